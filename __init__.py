@@ -30,8 +30,10 @@ from .props import (
 from . import (
     carinfo,
     common,
+    export_cache,
     fin_in,
     fin_out,
+    geometry,
     hul_in,
     hul_out,
     img_in,
@@ -52,6 +54,7 @@ from . import (
     ta_csv_out,
     texanim,
     tools,
+    track_out,
     w_in,
     w_out,
 )
@@ -75,6 +78,8 @@ importlib.reload(props_obj)
 importlib.reload(props_scene)
 
 importlib.reload(common)
+importlib.reload(export_cache)
+importlib.reload(geometry)
 importlib.reload(layers)
 importlib.reload(operators)
 importlib.reload(texanim)
@@ -121,6 +126,8 @@ if "w_in" in locals():
     importlib.reload(w_in)
 if "w_out" in locals():
     importlib.reload(w_out)
+if "track_out" in locals():
+    importlib.reload(track_out)
 if "rim_in" in locals():
     importlib.reload(rim_in)
 if "rim_out" in locals():
@@ -134,7 +141,7 @@ from .common import FACE_DOUBLE, FACE_TRANSLUCENT, FACE_MIRROR, FACE_TRANSL_TYPE
 from .common import NCP_DOUBLE, NCP_NO_SKID, NCP_OIL, NCP_OBJECT_ONLY, NCP_CAMERA_ONLY, NCP_NOCOLL, MATERIALS
 from .layers import select_ncp_material, get_face_material, set_face_material, set_face_texture, get_face_texture
 from .layers import set_face_ncp_property, get_face_ncp_property, get_face_env, set_face_env, get_face_property, set_face_property
-from .operators import ImportRV, ExportRV, RVIO_OT_ReadCarParameters, RVIO_OT_SelectRevoltDirectory, ButtonReExport
+from .operators import ImportRV, ExportRV, ExportTrack, RVIO_OT_ReadCarParameters, RVIO_OT_SelectRevoltDirectory, ButtonReExport
 from .operators import SelectNCPMaterial, VertexColorRemove, SetVertexColor
 from .operators import VertexColorCreateLayer, TexAnimDirection
 from .operators import ButtonRenameAllObjects, SelectByName, SelectByData, UseTextureNumber
@@ -144,9 +151,10 @@ from .operators import ToggleTriangulateNgons, ExportWithoutTexture, ToggleApply
 from .operators import BakeShadow, ToggleEnvironmentMap, ToggleNoMirror, ToggleModelRGB, ToggleFinHide
 from .operators import SetEnvironmentMapColor, ToggleNoLights, ToggleNoCameraCollision, ToggleFinPriority
 from .operators import ToggleNoObjectCollision, ToggleMirrorPlane, InstanceColor, ResetFinLoDBias
-from .operators import SetBCubeMeshIndices, ButtonHullGenerate, ButtonHullSphere, RVIO_OT_ToggleWParentMeshes
+from .operators import SetBCubeMeshIndices, ButtonHullGenerate, ButtonHullDecompose, ButtonHullSphere, RVIO_OT_ToggleWParentMeshes
 from .operators import RVIO_OT_ToggleWImportBoundBoxes, RVIO_OT_ToggleWImportCubes, RVIO_OT_ToggleWImportBigCubes
 from .operators import RVIO_OT_NCPExportSelected, RVIO_OT_NCPExportCollgrid, ToggleApplyTranslation, RVIO_OT_NCPGridSize
+from .operators import RVIO_OT_NCPGridAuto
 from .operators import ButtonCopyUvToFrame, ButtonCopyFrameToUv, TexAnimTransform, TexAnimGrid, OBJECT_OT_add_texanim_uv
 from .rvstruct import World, PRM, Mesh, BoundingBox, Vector, Matrix, Polygon, Vertex, UV, BigCube, TexAnimation
 from .rvstruct import Frame, Color, Instances, Instance, PosNodes, PosNode, NCP, Polyhedron, Plane, LookupGrid
@@ -456,6 +464,39 @@ def register():
         default=False
     )
 
+    bpy.types.Scene.w_split_meshes = bpy.props.BoolProperty(
+        name="Split into Cells",
+        default=False,
+        description="Merges all level geometry and splits it up into "
+                    "meshes of nearby polygons for culling.\n"
+                    "Also allows exporting objects above the 65535 "
+                    "polygon/vertex limit"
+    )
+
+    bpy.types.Scene.w_split_polygons = bpy.props.IntProperty(
+        name="Polygons per Cell",
+        default=1024,
+        min=16,
+        max=65535,
+        description="Maximum amount of polygons per mesh when splitting "
+                    "the level into cells"
+    )
+
+    bpy.types.Scene.w_report_spheres = bpy.props.BoolProperty(
+        name="Report Bound Balls",
+        default=False,
+        description="Prints how much smaller the bound ball of each mesh "
+                    "is compared to a sphere around its bbox center"
+    )
+
+    bpy.types.Scene.w_bigcube_meshes = bpy.props.IntProperty(
+        name="Meshes per Big Cube",
+        default=32,
+        min=0,
+        description="Splits the level into Big Cubes of at most this many "
+                    "meshes for culling.\n0 exports a single Big Cube"
+    )
+
     bpy.types.Scene.triangulate_ngons = bpy.props.BoolProperty(
         name="Triangulate Ngons",
         description="Enable or disable ngon triangulation",
@@ -534,6 +575,93 @@ def register():
         description="Size of the lookup grid"
     )
 
+    bpy.types.Scene.ncp_collgrid_auto = bpy.props.BoolProperty(
+        name="Automatic Grid Size",
+        default=False,
+        description="Picks the lookup grid size with the shortest lists "
+                    "for the file size instead of using the set grid size"
+    )
+
+    bpy.types.Scene.ncp_merge_quads = bpy.props.BoolProperty(
+        name="Merge Triangles",
+        default=False,
+        description="Merges adjacent coplanar triangles with the same "
+                    "material and flags into convex quads on export"
+    )
+
+    bpy.types.Scene.ncp_decimate = bpy.props.BoolProperty(
+        name="Simplify Flat Areas",
+        default=False,
+        description="Dissolves faces of flat areas with the same material "
+                    "and flags into fewer, larger polygons on export"
+    )
+
+    bpy.types.Scene.ncp_merge_angle = bpy.props.FloatProperty(
+        name="Flatness Tolerance",
+        default=0.0174533,
+        min=0.0,
+        max=0.261799,
+        subtype="ANGLE",
+        description="Faces are treated as coplanar if their normals differ "
+                    "by less than this angle"
+    )
+
+    bpy.types.Scene.hul_weld_tolerance = bpy.props.FloatProperty(
+        name="Hull Weld Tolerance",
+        default=0.01,
+        min=0.0,
+        max=10.0,
+        description="Hull vertices closer than this (in Re-Volt units) "
+                    "are merged into one on export"
+    )
+
+    bpy.types.Scene.hul_plane_angle = bpy.props.FloatProperty(
+        name="Hull Plane Angle",
+        default=0.0174533,
+        min=0.0,
+        max=0.261799,
+        subtype="ANGLE",
+        description="Hull faces whose normals differ by less than this "
+                    "are merged into one plane on export"
+    )
+
+    bpy.types.Scene.hul_plane_distance = bpy.props.FloatProperty(
+        name="Hull Plane Distance",
+        default=0.5,
+        min=0.0,
+        max=10.0,
+        description="Hull faces are only merged into one plane if their "
+                    "planes are closer than this (in Re-Volt units)"
+    )
+
+    bpy.types.Scene.hul_decompose_hulls = bpy.props.IntProperty(
+        name="Maximum Hulls",
+        default=8,
+        min=1,
+        max=64,
+        description="Maximum number of convex hulls an object is split into"
+    )
+
+    bpy.types.Scene.hul_decompose_concavity = bpy.props.FloatProperty(
+        name="Concavity",
+        default=0.05,
+        min=0.0,
+        max=1.0,
+        subtype="FACTOR",
+        description="Parts are not split further once the space their "
+                    "hulls cover in excess is less than this fraction of "
+                    "the object's volume"
+    )
+
+    bpy.types.Scene.hul_decompose_resolution = bpy.props.IntProperty(
+        name="Voxel Resolution",
+        default=32,
+        min=8,
+        max=128,
+        description="Voxels along the longest side of the object. Higher "
+                    "values give more accurate hulls but take longer"
+    )
+
     bpy.types.Scene.last_exported_filepath = bpy.props.StringProperty(
         name="Last Exported Filepath",
         description="Filepath used for the last export",
@@ -570,6 +698,20 @@ def register():
         default = True,
         description = "Checks car parameters.txt for the texture"
     )
+
+    bpy.types.Scene.export_cache = bpy.props.BoolProperty(
+        name = "Reuse Unchanged Meshes",
+        default = True,
+        description = "Keeps the exported data of each object and only "
+                      "exports objects again that changed since"
+    )
+
+    bpy.types.Scene.texture_cache_session = bpy.props.BoolProperty(
+        name = "Keep Texture Lookups",
+        default = False,
+        description = "Keeps folder listings and texture paths between imports. "
+                      "Changed folders are still read again"
+    )
     
 
     bpy.types.Scene.shadow_quality = bpy.props.IntProperty(
@@ -791,6 +933,7 @@ def register():
     bpy.utils.register_class(DialogOperator)
     bpy.utils.register_class(ImportRV)
     bpy.utils.register_class(ExportRV)
+    bpy.utils.register_class(ExportTrack)
     bpy.utils.register_class(RVIO_OT_ReadCarParameters)
     bpy.utils.register_class(ButtonReExport)
     bpy.utils.register_class(SelectNCPMaterial)
@@ -809,6 +952,7 @@ def register():
     bpy.utils.register_class(UseTextureNumber)
     bpy.utils.register_class(CarParametersExport)
     bpy.utils.register_class(ButtonHullGenerate)  
+    bpy.utils.register_class(ButtonHullDecompose)
     bpy.utils.register_class(BakeShadow)
     bpy.utils.register_class(ButtonHullSphere)
     bpy.utils.register_class(ButtonCopyUvToFrame)
@@ -844,6 +988,7 @@ def register():
     bpy.utils.register_class(RVIO_OT_NCPExportCollgrid)
     bpy.utils.register_class(ToggleApplyTranslation)
     bpy.utils.register_class(RVIO_OT_NCPGridSize)
+    bpy.utils.register_class(RVIO_OT_NCPGridAuto)
     
     # Register UI
     bpy.utils.register_class(RVIO_PT_RevoltFacePropertiesPanel)
@@ -859,11 +1004,22 @@ def register():
     
     # UI and Handlers Registration
     bpy.app.handlers.depsgraph_update_pre.append(edit_object_change_handler)
+    bpy.app.handlers.depsgraph_update_post.append(export_cache.depsgraph_update_handler)
+    bpy.app.handlers.frame_change_post.append(export_cache.frame_change_handler)
+    bpy.app.handlers.load_post.append(export_cache.load_handler)
+    bpy.app.handlers.undo_post.append(export_cache.load_handler)
+    bpy.app.handlers.redo_post.append(export_cache.load_handler)
 
 def unregister():
     
     # UI and Handlers Unregistration
     bpy.app.handlers.depsgraph_update_pre.remove(edit_object_change_handler)
+    bpy.app.handlers.depsgraph_update_post.remove(export_cache.depsgraph_update_handler)
+    bpy.app.handlers.frame_change_post.remove(export_cache.frame_change_handler)
+    bpy.app.handlers.load_post.remove(export_cache.load_handler)
+    bpy.app.handlers.undo_post.remove(export_cache.load_handler)
+    bpy.app.handlers.redo_post.remove(export_cache.load_handler)
+    export_cache.clear()
      
     # Unregister Classes
 
@@ -880,6 +1036,7 @@ def unregister():
     bpy.utils.unregister_class(RVIO_PT_RevoltFacePropertiesPanel)
     
     # Unregister Operators
+    bpy.utils.unregister_class(RVIO_OT_NCPGridAuto)
     bpy.utils.unregister_class(RVIO_OT_NCPGridSize)
     bpy.utils.unregister_class(ToggleApplyTranslation)
     bpy.utils.unregister_class(RVIO_OT_NCPExportCollgrid)
@@ -915,6 +1072,7 @@ def unregister():
     bpy.utils.unregister_class(ButtonCopyUvToFrame)
     bpy.utils.unregister_class(ButtonHullSphere)
     bpy.utils.unregister_class(BakeShadow)
+    bpy.utils.unregister_class(ButtonHullDecompose)
     bpy.utils.unregister_class(ButtonHullGenerate) 
     bpy.utils.unregister_class(CarParametersExport)
     bpy.utils.unregister_class(UseTextureNumber)
@@ -933,6 +1091,7 @@ def unregister():
     bpy.utils.unregister_class(SelectNCPMaterial)
     bpy.utils.unregister_class(ButtonReExport)
     bpy.utils.unregister_class(RVIO_OT_ReadCarParameters)
+    bpy.utils.unregister_class(ExportTrack)
     bpy.utils.unregister_class(ExportRV)
     bpy.utils.unregister_class(ImportRV)
     bpy.utils.unregister_class(DialogOperator)
@@ -967,6 +1126,8 @@ def unregister():
     del bpy.types.Scene.shadow_resolution
     del bpy.types.Scene.shadow_quality
     del bpy.types.Scene.prm_check_parameters
+    del bpy.types.Scene.texture_cache_session
+    del bpy.types.Scene.export_cache
     del bpy.types.Object.ignore_ncp
     del bpy.types.Object.is_bbox
     del bpy.types.Object.is_cube
@@ -975,6 +1136,16 @@ def unregister():
     del bpy.types.Scene.ncp_export_selected
     del bpy.types.Scene.ncp_export_collgrid
     del bpy.types.Scene.ncp_collgrid_size
+    del bpy.types.Scene.ncp_collgrid_auto
+    del bpy.types.Scene.ncp_merge_quads
+    del bpy.types.Scene.ncp_decimate
+    del bpy.types.Scene.ncp_merge_angle
+    del bpy.types.Scene.hul_weld_tolerance
+    del bpy.types.Scene.hul_plane_angle
+    del bpy.types.Scene.hul_plane_distance
+    del bpy.types.Scene.hul_decompose_hulls
+    del bpy.types.Scene.hul_decompose_concavity
+    del bpy.types.Scene.hul_decompose_resolution
     del bpy.types.Scene.rvgl_dir
     del bpy.types.Object.is_mirror_plane
     del bpy.types.Object.is_hull_convex
@@ -984,6 +1155,10 @@ def unregister():
     
     del bpy.types.Scene.w_import_cubes
     del bpy.types.Scene.w_import_big_cubes
+    del bpy.types.Scene.w_bigcube_meshes
+    del bpy.types.Scene.w_report_spheres
+    del bpy.types.Scene.w_split_polygons
+    del bpy.types.Scene.w_split_meshes
     del bpy.types.Scene.w_import_bound_boxes
     del bpy.types.Scene.w_parent_meshes
     
@@ -15,6 +15,8 @@ if "bpy" not in locals():
 import bpy
 import bmesh
 import os
+import stat
+import numpy as np
 from math import sqrt
 from mathutils import Color, Matrix
 
@@ -22,6 +24,12 @@ from mathutils import Color, Matrix
 global ERRORS
 ERRORS = {}  # Dictionary that holds error messages
 PARAMETERS = {}  # Glocal dict to hold parameters
+DIRECTORIES = {}  # Cached directory listings: path -> (mtime, file names)
+TEXTURE_PATHS = {}  # Resolved texture paths: key -> (mtime, path)
+FOLDER_TIMES = {}  # Folder mtimes checked during this import: path -> mtime
+TEXTURE_MATERIALS = {}  # Imported materials by normalized texture path
+TEXTURE_IMAGES = {}  # Loaded images by normalized texture path
+TEXTURE_REGISTRY_SIZE = None  # Material and image count at the last rebuild
 
 
 # If True, more debug messages will be printed
@@ -367,6 +375,111 @@ def int_to_texture(tex_num, name=""):
         suffix += chr(suffix2 + 96) 
     return name + suffix + ".bmp"
 
+def fill_mesh(me, positions, loop_vertices, loop_totals):
+    """ Adds vertices, loops and faces to an empty mesh in bulk """
+    me.vertices.add(len(positions))
+    me.vertices.foreach_set(
+        "co", np.asarray(positions, dtype=np.float32).ravel())
+    me.loops.add(len(loop_vertices))
+    me.loops.foreach_set(
+        "vertex_index", np.asarray(loop_vertices, dtype=np.int32))
+    me.polygons.add(len(loop_totals))
+    me.polygons.foreach_set(
+        "loop_start", (np.cumsum(loop_totals) - loop_totals).astype(np.int32))
+
+
+def texture_key(path):
+    """ Normalized texture path used to look up materials and images """
+    return os.path.normcase(os.path.normpath(os.path.abspath(path)))
+
+
+def data_size():
+    return len(bpy.data.materials), len(bpy.data.images)
+
+
+def rebuild_texture_registry():
+    """ Finds the materials and images of textures in bpy.data """
+    global TEXTURE_REGISTRY_SIZE
+    TEXTURE_MATERIALS.clear()
+    TEXTURE_IMAGES.clear()
+    for mat in bpy.data.materials:
+        path = mat.get("rv_texture_path")
+        if path:
+            TEXTURE_MATERIALS[texture_key(path)] = mat
+    for image in bpy.data.images:
+        if image.source == "FILE" and image.filepath:
+            TEXTURE_IMAGES[texture_key(bpy.path.abspath(image.filepath))] = image
+    TEXTURE_REGISTRY_SIZE = data_size()
+
+
+def registry_lookup(registry, path):
+    """
+    Returns the datablock of a texture from the registry. It's rebuilt if
+    the entry was removed from bpy.data or if it's missing and bpy.data
+    changed since the last rebuild.
+    """
+    key = texture_key(path)
+    item = registry.get(key)
+    if item is not None:
+        try:
+            item.name       # Raises if the datablock has been removed
+            return item
+        except ReferenceError:
+            pass
+    elif TEXTURE_REGISTRY_SIZE == data_size():
+        return None
+    rebuild_texture_registry()
+    return registry.get(key)
+
+
+def register_texture_item(registry, path, item):
+    """
+    Adds a datablock created after a lookup missed. The registry was up to
+    date for that lookup, so it stays up to date with the new datablock.
+    """
+    global TEXTURE_REGISTRY_SIZE
+    registry[texture_key(path)] = item
+    TEXTURE_REGISTRY_SIZE = data_size()
+
+
+def get_texture_image(texture_path):
+    """ Returns the one image datablock of a texture file """
+    image = registry_lookup(TEXTURE_IMAGES, texture_path)
+    if image is None:
+        image = bpy.data.images.load(texture_path, check_existing=True)
+        register_texture_item(TEXTURE_IMAGES, texture_path, image)
+    return image
+
+
+def get_texture_material(texture_path):
+    """ Returns the material of a texture file, creating it if needed """
+    mat = registry_lookup(TEXTURE_MATERIALS, texture_path)
+    if mat is not None:
+        return mat
+
+    # Materials of older imports are named after the full path and aren't
+    # tagged yet
+    mat = bpy.data.materials.get(texture_path)
+    if mat is not None:
+        mat["rv_texture_path"] = texture_path
+        register_texture_item(TEXTURE_MATERIALS, texture_path, mat)
+        return mat
+
+    # Create a new material with the texture
+    mat = bpy.data.materials.new(name=os.path.basename(texture_path))
+    mat["rv_texture_path"] = texture_path
+    mat.use_nodes = True
+    bsdf = mat.node_tree.nodes.get('Principled BSDF')
+
+    # Create image texture node and use the shared image
+    tex_image = mat.node_tree.nodes.new('ShaderNodeTexImage')
+    tex_image.image = get_texture_image(texture_path)
+    mat.node_tree.links.new(bsdf.inputs['Base Color'], tex_image.outputs['Color'])
+
+    register_texture_item(TEXTURE_MATERIALS, texture_path, mat)
+    return mat
+
+
 def create_material(name, diffuse, alpha):
     """ Creates a material, mostly used for debugging objects """
     mat = bpy.data.materials.new(name)
@@ -426,41 +539,46 @@ def get_edit_bmesh(obj):
         return None
 
 
+def export_matrix(obj, transform=True):
+    """
+    The world matrix of an object for exporting, read once without changing
+    the scene. The translation is left out if transform is False.
+    """
+    matrix = obj.matrix_world.copy()
+    if not transform:
+        matrix.translation = (0, 0, 0)
+    return matrix
+
+
+def transform_points(matrix, co):
+    """ Applies a 4x4 matrix to an (n, 3) array of positions """
+    matrix = np.array(matrix, dtype=np.float64)
+    return (co @ matrix[:3, :3].T + matrix[:3, 3]).astype(co.dtype)
+
+
+def transform_normals(matrix, normals):
+    """
+    Applies the inverse transpose of a matrix to an (n, 3) array of
+    normals and normalizes them again
+    """
+    linear = np.array(matrix, dtype=np.float64)[:3, :3]
+    try:
+        normals = normals @ np.linalg.inv(linear)
+    except np.linalg.LinAlgError:
+        # Flattened objects keep their normals
+        return normals
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals.astype(np.float32)
+
+
 def apply_trs(obj, bm, transform=False):
-        # Removes the parent for exporting and applies transformation
-        parent = obj.parent
-        if parent:
-            mat = obj.matrix_world.copy()
-            old_mat = obj.matrix_basis.copy()
-            obj.parent = None
-            obj.matrix_world = mat
-
-        spc = obj.matrix_basis
-        bmesh.ops.scale(
-            bm,
-            vec=obj.scale,
-            space=spc,
-            verts=bm.verts
-        )
-        if transform:
-            bmesh.ops.transform(
-                bm,
-                matrix=Matrix.Translation(obj.location),
-                space=spc,
-                verts=bm.verts
-            )
-        bmesh.ops.rotate(
-            bm,
-            cent=obj.location,
-            matrix=obj.rotation_euler.to_matrix(),
-            space=spc,
-            verts=bm.verts
-        )
-
-        # Restores the parent relationship
-        if parent and not obj.parent:
-            obj.parent = parent
-            obj.matrix_basis = old_mat
+    """
+    Transforms a bmesh by the world matrix of the object (without the
+    translation if transform is False). Doesn't modify the object.
+    """
+    bm.transform(export_matrix(obj, transform))
+    bm.normal_update()
 
 
 def objects_to_bmesh(objs, transform=True):
@@ -494,40 +612,8 @@ def objects_to_bmesh(objs, transform=True):
         material_layer = (bm.faces.layers.int.get("Material") or
                           bm.faces.layers.int.new("Material"))
 
-        # Removes the parent for exporting and applies transformation
-        parent = obj.parent
-        if parent:
-            mat = obj.matrix_world.copy()
-            old_mat = obj.matrix_basis.copy()
-            obj.parent = None
-            obj.matrix_world = mat
-
-        spc = obj.matrix_basis
-        bmesh.ops.scale(
-            bm,
-            vec=obj.scale,
-            space=spc,
-            verts=bm.verts
-        )
-        if transform:
-            bmesh.ops.transform(
-                bm,
-                matrix=Matrix.Translation(obj.location),
-                space=spc,
-                verts=bm.verts
-            )
-        bmesh.ops.rotate(
-            bm,
-            cent=obj.location,
-            matrix=obj.rotation_euler.to_matrix(),
-            space=spc,
-            verts=bm.verts
-        )
-
-        # Restores the parent relationship
-        if parent and not obj.parent:
-            obj.parent = parent
-            obj.matrix_basis = old_mat
+        # Applies the transformation
+        apply_trs(obj, bm, transform)
 
         # Converts the transformed bmesh to mesh
         new_mesh = bpy.data.meshes.new("ncp_export_temp")
@@ -616,6 +702,29 @@ def triangulate_ngons(bm):
     return len(triangulate)
 
 
+def triangulated_copy(me, triangulate=True):
+    """
+    Returns a temporary copy of a mesh with its n-gons triangulated, or
+    None if that is disabled or the mesh has no n-gons. The copy has to be
+    removed with bpy.data.meshes.remove() after reading it.
+    """
+    if not triangulate:
+        return None
+    sizes = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_total", sizes)
+    if not (sizes > 4).any():
+        return None
+
+    bm = bmesh.new()
+    bm.from_mesh(me)
+    num_ngons = triangulate_ngons(bm)
+    print("Triangulated {} n-gons".format(num_ngons))
+    tmp = bpy.data.meshes.new("{}_export".format(me.name))
+    bm.to_mesh(tmp)
+    bm.free()
+    return tmp
+
+
 def check_for_export(obj):
     if not obj:
         msg_box("Please select an object first.")
@@ -636,10 +745,9 @@ Non-Blender helper functions
 
 def get_texture_path(filepath, tex_num, scene):
     """ Gets the full texture path when given a file and its
-        polygon texture number. """
+        polygon texture number. Results are cached until the folder
+        changes (see clear_texture_cache). """
         
-    from .carinfo import read_parameters
-
     path, fname = filepath.rsplit(os.sep, 1)
 
     # Checks if the loaded model is located in the custom folder
@@ -648,11 +756,25 @@ def get_texture_path(filepath, tex_num, scene):
         path = path.rsplit(os.sep, 1)[0]
         folder = path.rsplit(os.sep, 1)[1]
 
-    if not os.path.isdir(path):
+    mtime = get_mtime(path)
+    if mtime is None:
         return None
 
+    key = (path, tex_num, scene.prm_check_parameters)
+    cached = TEXTURE_PATHS.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    texture_path = find_texture_path(path, folder, tex_num, scene)
+    TEXTURE_PATHS[key] = (mtime, texture_path)
+    return texture_path
+
+
+def find_texture_path(path, folder, tex_num, scene):
+    from .carinfo import read_parameters
+
     # The file is part of a car
-    if scene.prm_check_parameters and "parameters.txt" in os.listdir(path):
+    if scene.prm_check_parameters and "parameters.txt" in list_dir(path):
         filepath = os.path.join(path, "parameters.txt")
         if not filepath in PARAMETERS:
             PARAMETERS[filepath] = read_parameters(filepath)
@@ -669,12 +791,51 @@ def get_texture_path(filepath, tex_num, scene):
 
 
 def is_track_folder(path):
-    for f in os.listdir(path):
+    for f in list_dir(path):
         if ".inf" in f:
             return True
     return False
 
 
+def get_mtime(path):
+    """ Returns the modification time of a folder or None if it's not a
+        folder. Each folder is only checked once per import (see
+        forget_folder_times), so cache hits need no file system calls. """
+    if path in FOLDER_TIMES:
+        return FOLDER_TIMES[path]
+    try:
+        status = os.stat(path)
+    except OSError:
+        mtime = None
+    else:
+        mtime = status.st_mtime_ns if stat.S_ISDIR(status.st_mode) else None
+    FOLDER_TIMES[path] = mtime
+    return mtime
+
+
+def list_dir(path):
+    """ Cached os.listdir, read again when the folder was modified """
+    mtime = get_mtime(path)
+    cached = DIRECTORIES.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    names = frozenset(os.listdir(path))
+    DIRECTORIES[path] = (mtime, names)
+    return names
+
+
+def clear_texture_cache():
+    """ Forgets all directory listings and resolved texture paths """
+    DIRECTORIES.clear()
+    TEXTURE_PATHS.clear()
+    FOLDER_TIMES.clear()
+
+
+def forget_folder_times():
+    """ Checks the folders for changes again on their next lookup """
+    FOLDER_TIMES.clear()
+
+
 def get_format(fstr):
     """
     Gets the format by the ending and returns an int
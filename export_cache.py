@@ -0,0 +1,156 @@
+"""
+Name:    export_cache
+Purpose: Reuses exported data of objects that did not change
+
+Description:
+The exporters store what they encoded for each object (mesh bytes for .w,
+polyhedra for .ncp) together with a hash of the mesh data, transformation
+and export settings. A depsgraph handler counts the updates of each object.
+Objects without updates since they were cached are reused right away if
+their world matrix is also unchanged, others are hashed again and only
+re-encoded if the hash changed. Frame changes don't update the depsgraph
+handler, so they invalidate the quick check of all objects.
+
+"""
+
+import bpy
+import hashlib
+import numpy as np
+from bpy.app.handlers import persistent
+
+CACHE = {}      # (format, object name) -> CacheEntry
+UPDATES = {}    # object name -> number of depsgraph updates
+GENERATION = 0  # Increased when materials, images or the frame change
+
+# Property that holds the data of each attribute type
+ATTRIBUTE_PROPS = {
+    "FLOAT": ("value", 1, np.float32),
+    "INT": ("value", 1, np.int32),
+    "INT8": ("value", 1, np.int32),
+    "BOOLEAN": ("value", 1, bool),
+    "FLOAT_VECTOR": ("vector", 3, np.float32),
+    "FLOAT2": ("vector", 2, np.float32),
+    "FLOAT_COLOR": ("color", 4, np.float32),
+    "BYTE_COLOR": ("color_srgb", 4, np.float32),
+}
+
+
+class CacheEntry:
+    def __init__(self, digest, value, updates, settings, matrix):
+        self.digest = digest        # hash of the mesh and settings
+        self.value = value          # exported data
+        self.updates = updates      # (object updates, generation) when valid
+        self.settings = settings    # repr of the export settings
+        self.matrix = matrix        # world matrix of the object as tuples
+
+
+def _hash_array(digest, values):
+    digest.update(np.ascontiguousarray(values).tobytes())
+
+
+def mesh_digest(obj, settings=()):
+    """ Hashes the mesh, transformation and export settings of an object """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(settings).encode())
+    for row in obj.matrix_world:
+        digest.update(repr(tuple(row)).encode())
+    for row in obj.matrix_basis:
+        digest.update(repr(tuple(row)).encode())
+
+    me = obj.data
+    digest.update(repr((len(me.vertices), len(me.loops),
+                        len(me.polygons))).encode())
+
+    loops = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", loops)
+    _hash_array(digest, loops)
+    starts = np.empty(len(me.polygons), dtype=np.int32)
+    me.polygons.foreach_get("loop_start", starts)
+    _hash_array(digest, starts)
+
+    # All attributes, including positions and UVs. Internal ones like the
+    # selection start with a dot and don't affect the export.
+    for attribute in sorted(me.attributes, key=lambda a: a.name):
+        if attribute.name.startswith("."):
+            continue
+        prop = ATTRIBUTE_PROPS.get(attribute.data_type)
+        if prop is None:
+            continue
+        name, width, dtype = prop
+        values = np.empty(len(attribute.data) * width, dtype=dtype)
+        attribute.data.foreach_get(name, values)
+        digest.update(repr((attribute.name, attribute.data_type,
+                            attribute.domain)).encode())
+        _hash_array(digest, values)
+
+    # Vertex normals are written to .w files
+    normals = np.empty(len(me.vertices) * 3, dtype=np.float32)
+    me.vertices.foreach_get("normal", normals)
+    _hash_array(digest, normals)
+
+    return digest.digest()
+
+
+def _updates(obj):
+    return UPDATES.get(obj.name, 0), GENERATION
+
+
+def _matrix(obj):
+    return tuple(tuple(row) for row in obj.matrix_world)
+
+
+def lookup(fmt, obj, settings=()):
+    """
+    Returns (value, digest). value is the cached data or None if the object
+    has to be exported again. The digest is passed on to store().
+    Changed settings don't update the object and animated objects may move
+    without updates, so the settings and the world matrix are always
+    compared.
+    """
+    entry = CACHE.get((fmt, obj.name))
+    if (entry is not None and entry.updates == _updates(obj) and
+            entry.settings == repr(settings) and entry.matrix == _matrix(obj)):
+        return entry.value, entry.digest
+
+    digest = mesh_digest(obj, settings)
+    if entry is not None and entry.digest == digest:
+        entry.updates = _updates(obj)
+        entry.matrix = _matrix(obj)
+        return entry.value, digest
+    return None, digest
+
+
+def store(fmt, obj, digest, value, settings=()):
+    CACHE[(fmt, obj.name)] = CacheEntry(digest, value, _updates(obj),
+                                        repr(settings), _matrix(obj))
+
+
+def clear():
+    CACHE.clear()
+    UPDATES.clear()
+
+
+@persistent
+def depsgraph_update_handler(scene, depsgraph):
+    """ Counts the updates of objects so cached exports get checked again """
+    global GENERATION
+    for update in depsgraph.updates:
+        id_data = update.id
+        if isinstance(id_data, bpy.types.Object):
+            name = id_data.original.name
+            UPDATES[name] = UPDATES.get(name, 0) + 1
+        elif isinstance(id_data, (bpy.types.Material, bpy.types.Image)):
+            GENERATION += 1
+
+
+@persistent
+def frame_change_handler(scene, *args):
+    """ Animations and drivers change objects without depsgraph updates """
+    global GENERATION
+    GENERATION += 1
+
+
+@persistent
+def load_handler(*args):
+    """ Cached exports may not match the data after loading or undoing """
+    clear()
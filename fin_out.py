@@ -25,11 +25,23 @@ if "bpy" in locals():
 
 
 def export_file(filepath, context):
+    fin = build_instances(filepath, context)
+
+    with open(filepath, "wb") as fd:
+        fin.write(fd)
+
+
+def build_instances(filepath, context, objs=None):
+    """
+    Creates the instance list. Also exports the models of instances that
+    don't have a .prm file next to filepath yet.
+    """
     scene = context.scene
     fin = Instances()
 
     # Gathers list of instance objects
-    objs = [obj for obj in scene.objects if obj.get("is_instance", False)]
+    if objs is None:
+        objs = [obj for obj in scene.objects if obj.get("is_instance", False)]
 
     for obj in objs:
         instance = Instance()
@@ -114,8 +126,6 @@ def export_file(filepath, context):
         fin.instances.append(instance)
 
     fin.instance_count = len(fin.instances)
-
-    with open(filepath, "wb") as fd:
-        fin.write(fd)
+    return fin
 
 
@@ -0,0 +1,733 @@
+"""
+Name:    geometry
+Purpose: Geometry helpers that do not depend on Blender
+
+Description:
+Bounding volumes and other computations used by the importers and exporters.
+Like rvstruct, this only needs the standard library and uses NumPy for
+larger inputs when it is available.
+
+"""
+
+from math import atan2, cos, floor, sqrt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Refinement steps after the initial sphere (Badoiu-Clarkson)
+SPHERE_ITERATIONS = 64
+
+# Maximum times Ritter's sphere is grown towards the farthest point
+RITTER_ITERATIONS = 256
+
+# Cutting planes tried along each axis when splitting a decomposition part
+CUT_CANDIDATES = 8
+
+
+def bounding_sphere(points, radii=None, iterations=SPHERE_ITERATIONS):
+    """
+    Returns (center, radius) of a small sphere enclosing all points, or all
+    spheres if radii are given. Starts with Ritter's sphere and then moves
+    the center towards the farthest point with shrinking steps, keeping the
+    smallest sphere found. The result is never larger than the sphere around
+    the bbox center.
+    """
+    if np is not None:
+        return _bounding_sphere_np(points, radii, iterations)
+    return _bounding_sphere(points, radii, iterations)
+
+
+def sphere_volume_saved(old_radius, new_radius):
+    """ Returns the fraction of sphere volume saved by the new radius """
+    if not old_radius:
+        return 0.0
+    return 1 - (new_radius / old_radius) ** 3
+
+
+def _bounding_sphere_np(points, radii, iterations):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if not len(points):
+        return (0.0, 0.0, 0.0), 0.0
+    if radii is None:
+        radii = np.zeros(len(points))
+    else:
+        radii = np.asarray(radii, dtype=np.float64)
+    has_radii = bool(radii.any())
+
+    def extent(center):
+        """ Distance from center to the far side of every point/sphere """
+        offsets = points - center
+        distances = np.sqrt(np.einsum("ij,ij->i", offsets, offsets))
+        return distances + radii if has_radii else distances
+
+    # Sphere around the bbox center as the upper bound
+    lo = (points - radii[:, None]).min(axis=0)
+    hi = (points + radii[:, None]).max(axis=0)
+    center = (lo + hi) / 2
+    best = (center, extent(center).max())
+
+    # Ritter: sphere through two far apart points, grown until all fit
+    a = int(np.argmax(extent(points[0])))
+    b = int(np.argmax(extent(points[a])))
+    center, radius = _enclose_two(points[a], radii[a], points[b], radii[b])
+    for i in range(RITTER_ITERATIONS):
+        ext = extent(center)
+        far = int(np.argmax(ext))
+        if ext[far] <= radius:
+            break
+        center, radius = _grow(center, radius, points[far], radii[far])
+    radius = extent(center).max()
+    if radius < best[1]:
+        best = (center, radius)
+
+    # Badoiu-Clarkson: step towards the farthest point
+    for k in range(1, iterations + 1):
+        ext = extent(center)
+        far = int(np.argmax(ext))
+        if ext[far] < best[1]:
+            best = (center, ext[far])
+        direction = points[far] - center
+        length = np.linalg.norm(direction)
+        if length == 0:
+            break
+        target = points[far] + direction / length * radii[far]
+        center = center + (target - center) / (k + 1)
+
+    center, radius = best
+    return tuple(float(c) for c in center), float(radius)
+
+
+def _bounding_sphere(points, radii, iterations):
+    points = [tuple(float(c) for c in p) for p in points]
+    if not points:
+        return (0.0, 0.0, 0.0), 0.0
+    if radii is None:
+        radii = [0.0] * len(points)
+
+    def extent(center):
+        return [_distance(p, center) + r for p, r in zip(points, radii)]
+
+    def farthest(center):
+        ext = extent(center)
+        far = max(range(len(ext)), key=ext.__getitem__)
+        return far, ext[far]
+
+    lo = [min(p[a] - r for p, r in zip(points, radii)) for a in range(3)]
+    hi = [max(p[a] + r for p, r in zip(points, radii)) for a in range(3)]
+    center = tuple((lo[a] + hi[a]) / 2 for a in range(3))
+    best = (center, farthest(center)[1])
+
+    a = farthest(points[0])[0]
+    b = farthest(points[a])[0]
+    center, radius = _enclose_two(points[a], radii[a], points[b], radii[b])
+    for i in range(RITTER_ITERATIONS):
+        far, ext = farthest(center)
+        if ext <= radius:
+            break
+        center, radius = _grow(center, radius, points[far], radii[far])
+    radius = farthest(center)[1]
+    if radius < best[1]:
+        best = (center, radius)
+
+    for k in range(1, iterations + 1):
+        far, ext = farthest(center)
+        if ext < best[1]:
+            best = (center, ext)
+        length = _distance(points[far], center)
+        if length == 0:
+            break
+        target = [points[far][a] + (points[far][a] - center[a]) / length *
+                  radii[far] for a in range(3)]
+        center = tuple(center[a] + (target[a] - center[a]) / (k + 1)
+                       for a in range(3))
+
+    center, radius = best
+    return tuple(center), float(radius)
+
+
+def _distance(p, q):
+    return sqrt((p[0] - q[0])**2 + (p[1] - q[1])**2 + (p[2] - q[2])**2)
+
+
+def _enclose_two(p, rp, q, rq):
+    """ Smallest sphere enclosing the spheres (p, rp) and (q, rq) """
+    length = _distance(p, q)
+    if length + rq <= rp:
+        return p, rp
+    if length + rp <= rq:
+        return q, rq
+    radius = (length + rp + rq) / 2
+    t = (radius - rp) / length
+    center = [p[a] + (q[a] - p[a]) * t for a in range(3)]
+    if np is not None and not isinstance(p, tuple):
+        center = np.array(center)
+    else:
+        center = tuple(center)
+    return center, radius
+
+
+def _grow(center, radius, p, rp):
+    """ Grows the sphere (center, radius) just enough to enclose (p, rp) """
+    length = _distance(p, center)
+    new_radius = (radius + length + rp) / 2
+    t = (new_radius - radius) / length
+    moved = [center[a] + (p[a] - center[a]) * t for a in range(3)]
+    if np is not None and not isinstance(center, tuple):
+        moved = np.array(moved)
+    else:
+        moved = tuple(moved)
+    return moved, new_radius
+
+
+class VertexIndex:
+    """
+    Welds vertices that are closer than the tolerance to each other.
+    Vertices are stored in a spatial hash of their quantized coordinates.
+    A lookup only checks the cell of the vertex and its neighbors, so adding
+    n vertices takes O(n). A tolerance of 0 only merges identical vertices.
+    """
+    def __init__(self, tolerance=0.0):
+        self.tolerance = tolerance
+        self.vertices = []          # welded vertices as tuples
+        self.cells = {}             # cell key -> vertex indices
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def add(self, co):
+        """ Returns the index of the vertex at co, adding it if it's new """
+        co = tuple(float(c) for c in co)
+
+        if self.tolerance <= 0:
+            index = self.cells.get(co)
+            if index is None:
+                index = len(self.vertices)
+                self.vertices.append(co)
+                self.cells[co] = index
+            return index
+
+        # The first vertex within the tolerance, like weld_points
+        key = tuple(floor(c / self.tolerance) for c in co)
+        found = None
+        for neighbor in _neighbor_keys(key):
+            for index in self.cells.get(neighbor, ()):
+                if ((found is None or index < found) and
+                        _distance(self.vertices[index], co) <= self.tolerance):
+                    found = index
+        if found is not None:
+            return found
+
+        index = len(self.vertices)
+        self.vertices.append(co)
+        self.cells.setdefault(key, []).append(index)
+        return index
+
+
+def _neighbor_keys(key):
+    x, y, z = key
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            for dz in (-1, 0, 1):
+                yield (x + dx, y + dy, z + dz)
+
+
+def weld_points(points, tolerance):
+    """
+    Welds all points that are closer than the tolerance to each other.
+    Returns the welded vertices and the vertex index of every point.
+    Gives the same result as adding the points to a VertexIndex in order:
+    each point goes to the first welded vertex within the tolerance. With
+    NumPy, the close pairs are found on a grid of cells as large as the
+    tolerance, so only the points that have close pairs are visited one
+    by one.
+    """
+    if np is None or tolerance <= 0:
+        return _weld_indexed(points, tolerance)
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if not len(points):
+        return [], []
+    pairs = _close_pairs(points, tolerance)
+    if pairs is None:
+        return _weld_indexed(points.tolist(), tolerance)
+    later, earlier = pairs
+
+    # Points without an earlier close point start a welded vertex. The
+    # others are welded to the first earlier point that started one.
+    target = np.arange(len(points))
+    starts = np.searchsorted(later, np.arange(len(points) + 1))
+    welded = np.unique(later)
+
+    # Usually the first earlier point has no earlier points of its own,
+    # so it surely started a welded vertex
+    first = earlier[starts[welded]]
+    alone = starts[first] == starts[first + 1]
+    target[welded[alone]] = first[alone]
+
+    for i in welded[~alone].tolist():
+        for j in earlier[starts[i]:starts[i + 1]].tolist():
+            if target[j] == j:
+                target[i] = j
+                break
+
+    roots, indices = np.unique(target, return_inverse=True)
+    return points[roots].tolist(), indices.ravel().tolist()
+
+
+def _weld_indexed(points, tolerance):
+    index = VertexIndex(tolerance)
+    indices = [index.add(p) for p in points]
+    return index.vertices, indices
+
+
+def _close_pairs(points, tolerance):
+    """
+    Returns the index pairs (later, earlier) of points at most tolerance
+    apart, sorted by later and then earlier. Returns None if the grid
+    can't be packed into integers.
+    """
+    keys = np.floor(points / tolerance).astype(np.int64)
+    keys -= keys.min(axis=0) - 1    # Leaves room for the neighbor cells
+    ranges = keys.max(axis=0) + 2
+    if float(ranges[0]) * float(ranges[1]) * float(ranges[2]) >= 2**62:
+        return None
+    packed = (keys[:, 0] * ranges[1] + keys[:, 1]) * ranges[2] + keys[:, 2]
+
+    # Points sorted by cell, and where the points of each cell start
+    order = np.argsort(packed, kind="stable")
+    cells, starts, counts = np.unique(packed[order], return_index=True,
+                                      return_counts=True)
+
+    later, earlier = [], []
+    for dx, dy, dz in _neighbor_keys((0, 0, 0)):
+        # Shifted cells stay sorted, which makes the search fast
+        neighbor = cells + (dx * ranges[1] + dy) * ranges[2] + dz
+        found = np.minimum(np.searchsorted(cells, neighbor), len(cells) - 1)
+        a = np.flatnonzero(cells[found] == neighbor)
+        b = found[a]
+
+        # Every point of cell a with every point of cell b
+        sizes = counts[a] * counts[b]
+        total = int(sizes.sum())
+        if not total:
+            continue
+        pair = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        columns = np.repeat(counts[b], sizes)
+        first = order[np.repeat(starts[a], sizes) + pair // columns]
+        second = order[np.repeat(starts[b], sizes) + pair % columns]
+
+        keep = second < first
+        first, second = first[keep], second[keep]
+        close = (np.linalg.norm(points[first] - points[second], axis=1) <=
+                 tolerance)
+        later.append(first[close])
+        earlier.append(second[close])
+
+    later = np.concatenate(later) if later else np.empty(0, dtype=np.int64)
+    earlier = (np.concatenate(earlier) if earlier
+               else np.empty(0, dtype=np.int64))
+    order = np.lexsort((earlier, later))
+    return later[order], earlier[order]
+
+
+def intersect_halfspaces(planes, lo, hi, eps=1e-6):
+    """
+    Intersects the half-spaces n.x + d <= 0, given as (normal, distance)
+    pairs. Starts with the box from lo to hi and clips it with one plane
+    after the other, so the box should contain the result.
+    Returns the vertices and the faces (lists of vertex indices) of the
+    convex polyhedron. Faces are ordered counter-clockwise when seen from
+    outside. Planes that don't cut the polyhedron get no face.
+    """
+    x0, y0, z0 = lo
+    x1, y1, z1 = hi
+    verts = [(x0, y0, z0), (x1, y0, z0), (x1, y1, z0), (x0, y1, z0),
+             (x0, y0, z1), (x1, y0, z1), (x1, y1, z1), (x0, y1, z1)]
+    faces = [[0, 3, 2, 1], [4, 5, 6, 7], [0, 1, 5, 4],
+             [2, 3, 7, 6], [1, 2, 6, 5], [0, 4, 7, 3]]
+
+    for normal, distance in planes:
+        length = sqrt(sum(c * c for c in normal))
+        if length == 0:
+            continue
+        normal = tuple(c / length for c in normal)
+        distance = distance / length
+
+        dist = _signed_distances(verts, normal, distance)
+        if max(dist) <= eps:
+            continue        # The plane doesn't cut the polyhedron
+        if min(dist) >= -eps:
+            return [], []   # Nothing is left
+
+        new_faces = []
+        cuts = {}           # edge -> vertex created on the plane
+        cap = set()         # vertices on the plane
+        for face in faces:
+            clipped = []
+            for k, a in enumerate(face):
+                b = face[(k + 1) % len(face)]
+                da, db = dist[a], dist[b]
+                if da <= eps:
+                    clipped.append(a)
+                    if da >= -eps:
+                        cap.add(a)
+                if (da < -eps and db > eps) or (da > eps and db < -eps):
+                    edge = (min(a, b), max(a, b))
+                    if edge not in cuts:
+                        t = da / (da - db)
+                        va, vb = verts[a], verts[b]
+                        verts.append(tuple(va[i] + (vb[i] - va[i]) * t
+                                           for i in range(3)))
+                        dist.append(0.0)
+                        cuts[edge] = len(verts) - 1
+                    clipped.append(cuts[edge])
+                    cap.add(cuts[edge])
+            if len(clipped) >= 3:
+                new_faces.append(clipped)
+
+        if len(cap) >= 3:
+            new_faces.append(_order_around(verts, list(cap), normal))
+        faces = new_faces
+
+    # Only keeps the vertices that are still in use
+    used = sorted({i for face in faces for i in face})
+    remap = {old: new for new, old in enumerate(used)}
+    return ([verts[i] for i in used],
+            [[remap[i] for i in face] for face in faces])
+
+
+def merge_planes(planes, points, angle_tolerance, distance_tolerance=0.0):
+    """
+    Clusters planes (normal, distance) whose normals differ by at most
+    angle_tolerance (radians) and whose distances differ by at most
+    distance_tolerance. Each cluster becomes one plane with the averaged
+    normal, moved out to the outermost of the points so that all of them
+    are still inside (n.x + d <= 0). Returns the planes in the order their
+    clusters first appear.
+    """
+    min_cos = cos(angle_tolerance)
+    clusters = []       # [first normal, first distance, summed normals]
+    for normal, distance in planes:
+        length = sqrt(_dot(normal, normal))
+        if length == 0:
+            continue
+        normal = tuple(c / length for c in normal)
+        distance = distance / length
+
+        for cluster in clusters:
+            if (_dot(cluster[0], normal) >= min_cos and
+                    abs(cluster[1] - distance) <= distance_tolerance):
+                cluster[2] = tuple(a + b for a, b in zip(cluster[2], normal))
+                break
+        else:
+            clusters.append([normal, distance, normal])
+
+    merged = []
+    for first, distance, total in clusters:
+        normal = _normalized(total) if _dot(total, total) > 0 else first
+        if points:
+            distance = -max(_dot(normal, p) for p in points)
+
+        # Parallel clusters end up on the same plane if they were inside
+        if not any(_dot(n, normal) >= min_cos and
+                   abs(d - distance) <= distance_tolerance
+                   for n, d in merged):
+            merged.append((normal, distance))
+    return merged
+
+
+def decompose(vertices, triangles, max_hulls=8, concavity=0.05,
+              resolution=32, mapper=map):
+    """
+    Approximate convex decomposition in the spirit of V-HACD. The mesh is
+    voxelized and the most concave part is cut along the axis-aligned plane
+    that leaves the least concavity, until there are max_hulls parts or all
+    parts are convex within the concavity tolerance (fraction of the total
+    volume). The cut candidates are evaluated with mapper, which can be the
+    map of a process pool. Returns an array of points for each part whose
+    convex hull approximates it. Requires NumPy.
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    if len(triangles) == 0:
+        return []
+
+    voxels, samples, sample_voxels, origin, size = voxelize(
+        vertices, triangles, resolution)
+    total = len(voxels)
+    parts = [(voxels, voxel_concavity(voxels))]
+
+    while len(parts) < max_hulls:
+        worst = max(range(len(parts)), key=lambda i: parts[i][1])
+        part, part_concavity = parts[worst]
+        if part_concavity <= concavity * total:
+            break
+        cuts = _cut_candidates(part)
+        if not cuts:
+            break
+        costs = list(mapper(cut_cost, [part] * len(cuts), *zip(*cuts)))
+        axis, position = cuts[costs.index(min(costs))]
+        below = part[part[:, axis] < position]
+        above = part[part[:, axis] >= position]
+        parts[worst] = (below, voxel_concavity(below))
+        parts.append((above, voxel_concavity(above)))
+
+    # The surface samples of a part give a tighter hull than its voxels.
+    # Parts that are all inside the mesh fall back to the voxel corners.
+    dims = voxels.max(axis=0) + 1
+    sample_keys = _voxel_keys(sample_voxels, dims)
+    hulls = []
+    for part, _ in parts:
+        points = samples[np.isin(sample_keys, _voxel_keys(part, dims))]
+        if len(points) < 4:
+            points = origin + _voxel_corners(part) * size
+        hulls.append(points)
+    return list(mapper(hull_points, hulls))
+
+
+def hull_points(points):
+    """ Returns the points that are corners of their convex hull """
+    points = np.asarray(points, dtype=np.float64)
+    triangles = convex_hull(points)
+    if not triangles:
+        return points
+    return points[np.unique(np.array(triangles))]
+
+
+def voxelize(vertices, triangles, resolution):
+    """
+    Voxelizes a closed triangle mesh with resolution cells along its
+    longest side. Returns the voxel coordinates of the solid, the points
+    sampled on the surface and their voxels, and the origin and size of
+    the voxels.
+    """
+    lo = vertices.min(axis=0)
+    extent = float((vertices.max(axis=0) - lo).max())
+    size = extent / resolution if extent > 0 else 1.0
+    origin = lo - size      # One empty cell around the mesh
+    dims = np.floor((vertices.max(axis=0) - origin) / size).astype(int) + 2
+
+    # Samples every triangle at least twice per voxel
+    corners = vertices[triangles]
+    edges = np.linalg.norm(corners - np.roll(corners, 1, axis=1), axis=2)
+    steps = np.maximum(np.ceil(edges.max(axis=1) * 2 / size), 1).astype(int)
+    samples = []
+    for step in np.unique(steps):
+        u, v = np.mgrid[0:step + 1, 0:step + 1].reshape(2, -1) / step
+        inside = u + v <= 1 + 1e-9
+        u, v = u[inside], v[inside]
+        tris = corners[steps == step]
+        samples.append((tris[:, 0, None] * (1 - u - v)[:, None] +
+                        tris[:, 1, None] * u[:, None] +
+                        tris[:, 2, None] * v[:, None]).reshape(-1, 3))
+    samples = np.concatenate(samples)
+    sample_voxels = np.clip(np.floor((samples - origin) / size).astype(int),
+                            0, dims - 1)
+
+    surface = np.zeros(dims, dtype=bool)
+    surface[tuple(sample_voxels.T)] = True
+
+    # Floods the outside from the empty border, the rest is solid
+    outside = np.zeros(dims, dtype=bool)
+    outside[0, :, :] = outside[-1, :, :] = True
+    outside[:, 0, :] = outside[:, -1, :] = True
+    outside[:, :, 0] = outside[:, :, -1] = True
+    outside &= ~surface
+    while True:
+        grown = outside.copy()
+        grown[1:] |= outside[:-1]
+        grown[:-1] |= outside[1:]
+        grown[:, 1:] |= outside[:, :-1]
+        grown[:, :-1] |= outside[:, 1:]
+        grown[:, :, 1:] |= outside[:, :, :-1]
+        grown[:, :, :-1] |= outside[:, :, 1:]
+        grown &= ~surface
+        if np.array_equal(grown, outside):
+            break
+        outside = grown
+
+    voxels = np.argwhere(~outside)
+    return voxels, samples, sample_voxels, origin, size
+
+
+def voxel_concavity(voxels):
+    """ Volume of the convex hull of the voxels that they don't fill """
+    if len(voxels) == 0:
+        return 0.0
+    return max(hull_volume(_voxel_corners(voxels)) - len(voxels), 0.0)
+
+
+def cut_cost(voxels, axis, position):
+    """ Concavity left after cutting the voxels at position along axis """
+    below = voxels[:, axis] < position
+    return voxel_concavity(voxels[below]) + voxel_concavity(voxels[~below])
+
+
+def hull_volume(points):
+    points = np.asarray(points, dtype=np.float64)
+    triangles = convex_hull(points)
+    if not triangles:
+        return 0.0
+    a, b, c = (points[list(t)] for t in zip(*triangles))
+    return float(np.einsum("ij,ij->", a, np.cross(b, c))) / 6
+
+
+def convex_hull(points, eps=1e-9):
+    """
+    Quickhull. Returns the triangles (index triples into points) of the
+    convex hull, counter-clockwise when seen from outside, or an empty list
+    if the points are flat. Requires NumPy.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) < 4:
+        return []
+    eps *= max(float(np.abs(points).max()), 1.0)
+
+    # Initial tetrahedron of extreme points
+    a = int(points[:, 0].argmin())
+    b = int(np.linalg.norm(points - points[a], axis=1).argmax())
+    line = points[b] - points[a]
+    c = int(np.linalg.norm(np.cross(points - points[a], line), axis=1).argmax())
+    normal = np.cross(line, points[c] - points[a])
+    heights = (points - points[a]) @ normal
+    d = int(np.abs(heights).argmax())
+    if abs(heights[d]) <= eps * np.linalg.norm(normal) or a == b:
+        return []
+    center = points[[a, b, c, d]].mean(axis=0)
+
+    faces = {}          # face id -> (triangle, normal, offset, outside points)
+    next_id = 0
+
+    def add_face(i, j, k, candidates):
+        nonlocal next_id
+        normal = np.cross(points[j] - points[i], points[k] - points[i])
+        length = np.linalg.norm(normal)
+        if length == 0:
+            normal = np.zeros(3)
+        else:
+            normal /= length
+        if normal @ (center - points[i]) > 0:
+            j, k = k, j
+            normal = -normal
+        offset = normal @ points[i]
+        heights = points[candidates] @ normal - offset
+        above = heights > eps
+        faces[next_id] = ((i, j, k), normal, offset, candidates[above])
+        next_id += 1
+        return candidates[~above]
+
+    remaining = np.setdiff1d(np.arange(len(points)), [a, b, c, d])
+    for i, j, k in ((a, b, c), (a, b, d), (a, c, d), (b, c, d)):
+        remaining = add_face(i, j, k, remaining)
+
+    while True:
+        pending = next((f for f in faces.values() if len(f[3])), None)
+        if pending is None:
+            break
+        _, normal, offset, outside = pending
+        apex = int(outside[(points[outside] @ normal).argmax()])
+
+        visible = [fid for fid, (_, n, o, _) in faces.items()
+                   if points[apex] @ n - o > eps]
+        edges = set()
+        orphans = []
+        for fid in visible:
+            (i, j, k), _, _, outside = faces.pop(fid)
+            edges.update(((i, j), (j, k), (k, i)))
+            orphans.append(outside)
+        orphans = np.concatenate(orphans)
+        orphans = orphans[orphans != apex]
+
+        # The horizon are the edges of visible faces only used once
+        for i, j in edges:
+            if (j, i) not in edges:
+                orphans = add_face(i, j, apex, orphans)
+
+    return [face[0] for face in faces.values()]
+
+
+def _cut_candidates(voxels, count=CUT_CANDIDATES):
+    """ Evenly spread cutting planes along each axis of the voxels """
+    cuts = []
+    for axis in range(3):
+        lo = int(voxels[:, axis].min()) + 1
+        hi = int(voxels[:, axis].max())
+        if hi < lo:
+            continue
+        positions = np.unique(np.linspace(lo, hi, min(count, hi - lo + 1))
+                              .round().astype(int))
+        cuts.extend((axis, int(p)) for p in positions)
+    return cuts
+
+
+def _voxel_corners(voxels):
+    """
+    Corners of the voxels that can be on their convex hull. Voxels between
+    two others of the same row are inside the hull of those.
+    """
+    voxels = _row_ends(np.asarray(voxels))
+    offsets = np.indices((2, 2, 2)).reshape(3, -1).T
+    corners = (voxels[:, None, :] + offsets[None]).reshape(-1, 3)
+    return _row_ends(np.unique(corners, axis=0)).astype(np.float64)
+
+
+def _row_ends(points):
+    """ Keeps the first and last integer point of each row along each axis """
+    for axis in range(3):
+        if len(points) < 3:
+            break
+        other = [i for i in range(3) if i != axis]
+        points = points[np.lexsort((points[:, axis], points[:, other[1]],
+                                    points[:, other[0]]))]
+        rows = points[:, other]
+        first = np.ones(len(points), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]).any(axis=1)
+        last = np.ones(len(points), dtype=bool)
+        last[:-1] = first[1:]
+        points = points[first | last]
+    return points
+
+
+def _voxel_keys(voxels, dims):
+    return (voxels[:, 0] * dims[1] + voxels[:, 1]) * dims[2] + voxels[:, 2]
+
+
+def _signed_distances(verts, normal, distance):
+    if np is not None and len(verts) > 64:
+        return (np.asarray(verts) @ np.asarray(normal) + distance).tolist()
+    nx, ny, nz = normal
+    return [v[0] * nx + v[1] * ny + v[2] * nz + distance for v in verts]
+
+
+def _order_around(verts, indices, normal):
+    """ Sorts vertices of a planar polygon counter-clockwise around normal """
+    center = [sum(verts[i][a] for i in indices) / len(indices)
+              for a in range(3)]
+
+    # Two axes spanning the plane
+    helper = (1.0, 0.0, 0.0) if abs(normal[0]) < 0.9 else (0.0, 1.0, 0.0)
+    u = _normalized(_cross(normal, helper))
+    v = _cross(normal, u)
+
+    def angle(i):
+        offset = [verts[i][a] - center[a] for a in range(3)]
+        return atan2(_dot(offset, v), _dot(offset, u))
+
+    return sorted(indices, key=angle)
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _normalized(a):
+    length = sqrt(_dot(a, a))
+    return tuple(c / length for c in a)
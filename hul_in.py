@@ -7,8 +7,6 @@ Description:
 """
 
 import os
-import subprocess
-import re
 import bpy
 import bmesh
 import mathutils
@@ -25,6 +23,7 @@ if "bpy" in locals():
 # Importing specific classes and functions
 from .common import COL_SPHERE, COL_HULL, to_blender_coord, to_blender_scale, create_material
 from .rvstruct import Hull
+from .geometry import intersect_halfspaces
 from mathutils import Color, Vector
 
 
@@ -42,79 +41,21 @@ def import_hull(filepath, scene):
     with open(filepath, "rb") as fd:
         hull = Hull(fd)
 
-    script_file = os.path.realpath(__file__)
-    script_dir = os.path.dirname(script_file)
-
-    qhull_in = os.path.join(script_dir, "hull", "qhull_in.txt")
-    qhull_out = os.path.join(script_dir, "hull", "qhull_out.txt")
-
-    if os.name == "nt":
-        qhull_exe = os.path.join(script_dir, "hull", "qhull.exe")
-    else:
-        qhull_exe = "qhull"
-
     filename = os.path.basename(filepath)
 
-    for chull in hull.chulls:
-
-        # If the bbox is not centered, center it and update the offset.
-        # TODO: Add center() function and bbox + vector operator for BoundingBox.
-        offset = rvstruct.Vector(data=(
-                (chull.bbox.xlo + chull.bbox.xhi) / 2,
-                (chull.bbox.ylo + chull.bbox.yhi) / 2,
-                (chull.bbox.zlo + chull.bbox.zhi) / 2
-            )
-        )
-
-        print("Fixing convex hull offset: {} {} {}".format(*offset))
+    # Intersects the planes of all hulls before creating any meshes
+    shapes = [intersect_chull(chull) for chull in hull.chulls]
 
-        chull.bbox_offset += offset
-        chull.bbox.xlo -= offset[0]
-        chull.bbox.xhi -= offset[0]
-        chull.bbox.ylo -= offset[1]
-        chull.bbox.yhi -= offset[1]
-        chull.bbox.zlo -= offset[2]
-        chull.bbox.zhi -= offset[2]
+    for vertices, faces in shapes:
+        if not faces:
+            print("Could not intersect the planes of a convex hull")
+            continue
 
-        bm = bmesh.new()
         me = bpy.data.meshes.new(filename)
-        with open(qhull_in, "w") as file:
-            # TODO: Document this. I'm relying on what jig did here
-            file.write("3 1\n")
-            file.write("{} {} {}\n".format(*chull.bbox_offset))
-            file.write("4\n")
-            file.write("{}\n".format(len(chull.faces)))
-            for face in chull.faces:
-                file.write("{} {} {} {}\n".format(*face.normal, face.distance))
-
-        subprocess.Popen([qhull_exe, "H", "Fp", "FN", "E0.0001", "TI", qhull_in, "TO", qhull_out]).wait()
-
-        with open(qhull_out, "r") as file:
-            if not file.readline(): # ignores first line
-                continue
-
-            num_verts = int(file.readline())
-
-            for i in range(num_verts):
-                bm.verts.new(to_blender_coord([float(s) for s in re.match("\\s*(\\S+)?\\s*(\\S+)?\\s*(\\S+)?", file.readline()).groups("0")]))
-
-            bm.verts.ensure_lookup_table()
-            bm.faces.ensure_lookup_table()
-            num_faces = int(file.readline())
-            for i in range(num_faces):
-                face = [int(s) for s in re.findall("\\S+", file.readline())][:0:-1]
-                if len(face) > 2:
-                    bm.faces.new([bm.verts[i] for i in face])
-                    continue
-
-        os.remove(qhull_in)
-        os.remove(qhull_out)
-
+        me.from_pydata([to_blender_coord(v) for v in vertices], [], faces)
+        me.update()
         me.materials.append(create_material("RVHull", COL_HULL, 0.3))
 
-        # bm.normal_update()
-        bmesh.ops.recalc_face_normals(bm, faces=bm.faces)
-        bm.to_mesh(me)
         ob = bpy.data.objects.new(filename, me)
         ob.show_transparent = True
         ob.show_wire = True
@@ -125,6 +66,41 @@ def import_hull(filepath, scene):
         create_sphere(scene, sphere.center, sphere.radius, filename)
 
 
+def intersect_chull(chull):
+    """
+    Returns the vertices and faces of a convex hull, computed from its planes.
+    """
+    # If the bbox is not centered, center it and update the offset.
+    # TODO: Add center() function and bbox + vector operator for BoundingBox.
+    offset = rvstruct.Vector(data=(
+            (chull.bbox.xlo + chull.bbox.xhi) / 2,
+            (chull.bbox.ylo + chull.bbox.yhi) / 2,
+            (chull.bbox.zlo + chull.bbox.zhi) / 2
+        )
+    )
+
+    print("Fixing convex hull offset: {} {} {}".format(*offset))
+
+    chull.bbox_offset += offset
+    chull.bbox.xlo -= offset[0]
+    chull.bbox.xhi -= offset[0]
+    chull.bbox.ylo -= offset[1]
+    chull.bbox.yhi -= offset[1]
+    chull.bbox.zlo -= offset[2]
+    chull.bbox.zhi -= offset[2]
+
+    # Starts from a box well around the hull's bbox, the planes cut it down
+    center = chull.bbox_offset
+    size = max(chull.bbox.xhi - chull.bbox.xlo,
+               chull.bbox.yhi - chull.bbox.ylo,
+               chull.bbox.zhi - chull.bbox.zlo) + 1
+    lo = [center[i] - size for i in range(3)]
+    hi = [center[i] + size for i in range(3)]
+
+    planes = [(face.normal.data, face.distance) for face in chull.faces]
+    return intersect_halfspaces(planes, lo, hi, eps=1e-4)
+
+
 def import_chull(chull, scene, filename):
     #unused
     print("Importing convex hull...")
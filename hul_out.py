@@ -22,6 +22,7 @@ if "bpy" in locals():
 # Importing specific classes and functions
 from .common import apply_trs, to_revolt_axis, to_revolt_coord, to_revolt_scale, rvbbox_from_verts
 from .rvstruct import Hull, ConvexHull, BoundingBox, Edge, Sphere, Plane, Interior
+from .geometry import VertexIndex, intersect_halfspaces, merge_planes
 from mathutils import Color, Vector
 
 
@@ -35,11 +36,20 @@ def get_plane(x, y, z):
 
 
 def export_hull(filepath, scene):
+    hull = build_hull(scene)
+
+    # Write to file
+    with open(filepath, "wb") as f:
+        hull.write(f)
+
+def build_hull(scene, chull_objs=None, sphere_objs=None):
     hull = rvstruct.Hull()
 
     # Export Convex Hulls
-    chull_objs = [obj for obj in scene.objects if "is_hull_convex" in obj and obj["is_hull_convex"]]
+    if chull_objs is None:
+        chull_objs = [obj for obj in scene.objects if "is_hull_convex" in obj and obj["is_hull_convex"]]
     hull.chull_count = len(chull_objs)
+    planes_before = planes_after = 0
 
     for obj in chull_objs:
         chull = rvstruct.ConvexHull()
@@ -48,23 +58,34 @@ def export_hull(filepath, scene):
 
         apply_trs(obj, bm, transform=False)
 
-        for face in bm.faces:
-            plane = create_plane_from_face(face)
-            chull.faces.append(plane)
-            chull.face_count += 1
+        planes = [create_plane_from_face(face) for face in bm.faces]
+        points = [to_revolt_coord(vert.co) for vert in bm.verts]
+        merged = merge_hull_planes(planes, points, scene.hul_plane_angle,
+                                   scene.hul_plane_distance)
+
+        # Keeps one plane per face if the planes don't close the hull
+        if merged is None:
+            print("Could not merge the planes of {}".format(obj.name))
+            chull.faces = planes
+            process_edges_and_vertices(chull, bm, scene.hul_weld_tolerance)
+        else:
+            chull.faces, segments = merged
+            set_edges_and_vertices(chull, segments, scene.hul_weld_tolerance)
+        chull.face_count = len(chull.faces)
+        planes_before += len(planes)
+        planes_after += chull.face_count
 
-        process_edges_and_vertices(chull, bm)
         define_bounding_box(chull, bm)
 
         bm.free()        
         hull.chulls.append(chull)
 
-    # Export Sphere Hulls
-    hull.interior = process_sphere_hulls(scene)
+    if chull_objs:
+        print("Convex hull planes: {} -> {}".format(planes_before, planes_after))
 
-    # Write to file
-    with open(filepath, "wb") as f:
-        hull.write(f)
+    # Export Sphere Hulls
+    hull.interior = process_sphere_hulls(scene, sphere_objs)
+    return hull
         
 def create_plane_from_face(face):
     plane = rvstruct.Plane()
@@ -76,10 +97,11 @@ def create_plane_from_face(face):
     plane.distance = distance
     return plane
 
-def process_sphere_hulls(scene):
+def process_sphere_hulls(scene, sphere_objs=None):
     interior = rvstruct.Interior()
     # Filter to include only mesh objects marked as sphere hulls
-    sphere_objs = [obj for obj in scene.objects if "is_hull_sphere" in obj and obj["is_hull_sphere"]]
+    if sphere_objs is None:
+        sphere_objs = [obj for obj in scene.objects if "is_hull_sphere" in obj and obj["is_hull_sphere"]]
     interior.sphere_count = len(sphere_objs)
 
     for obj in sphere_objs:
@@ -90,20 +112,63 @@ def process_sphere_hulls(scene):
 
     return interior
 
-def process_edges_and_vertices(chull, bm):
-    ind = 0
-    for edge in bm.edges:
+def merge_hull_planes(planes, points, angle_tolerance, distance_tolerance):
+    """
+    Merges the planes of (nearly) coplanar faces, e.g. of a triangulated
+    hull, into one plane per side and rebuilds the hull from those.
+    Returns the planes and the edges as pairs of points, or None if the
+    planes don't enclose the hull.
+    """
+    merged = merge_planes([(p.normal.data, p.distance) for p in planes],
+                          points, angle_tolerance, distance_tolerance)
+    if not points or len(merged) < 4:
+        return None
+
+    # Starts from a box well around the hull, the planes cut it down
+    lo = [min(p[i] for p in points) for i in range(3)]
+    hi = [max(p[i] for p in points) for i in range(3)]
+    size = max(hi[i] - lo[i] for i in range(3)) + 1
+    verts, faces = intersect_halfspaces(
+        merged, [c - size for c in lo], [c + size for c in hi], eps=1e-4)
+
+    # Planes that only touch the hull in an edge or corner are left out
+    kept = [(normal, distance) for normal, distance in merged
+            if sum(abs(sum(n * c for n, c in zip(normal, v)) + distance) < 1e-3
+                   for v in verts) >= 3]
+
+    # Box faces are left if the planes are open to a side
+    if not faces or len(faces) != len(kept):
+        return None
+
+    segments = {tuple(sorted((a, face[(k + 1) % len(face)])))
+                for face in faces for k, a in enumerate(face)}
+    return ([Plane(n=rvstruct.Vector(data=normal), d=distance)
+             for normal, distance in kept],
+            [(verts[a], verts[b]) for a, b in sorted(segments)])
+
+def process_edges_and_vertices(chull, bm, tolerance=0.0):
+    set_edges_and_vertices(
+        chull, ([to_revolt_coord(vert.co) for vert in edge.verts]
+                for edge in bm.edges), tolerance)
+
+def set_edges_and_vertices(chull, segments, tolerance=0.0):
+    # Welds the edge end points in one pass over the edges
+    index = VertexIndex(tolerance)
+    edges = set()
+    for segment in segments:
+        ends = [index.add(co) for co in segment]
+        key = tuple(sorted(ends))
+
+        # Skips edges that collapsed or already exist after welding
+        if ends[0] == ends[1] or key in edges:
+            continue
+        edges.add(key)
+
         rvedge = rvstruct.Edge()
-        for vert in edge.verts:
-            rvvert = rvstruct.Vector(data=to_revolt_coord(vert.co))
-            existing_vertex = next((v for v in chull.vertices if v.data == rvvert.data), None)
-            if existing_vertex:
-                rvedge.vertices.append(chull.vertices.index(existing_vertex))
-            else:
-                chull.vertices.append(rvvert)
-                rvedge.vertices.append(ind)
-                ind += 1
+        rvedge.vertices = ends
         chull.edges.append(rvedge)
+
+    chull.vertices = [rvstruct.Vector(data=co) for co in index.vertices]
     chull.vertex_count = len(chull.vertices)
     chull.edge_count = len(chull.edges)
 
@@ -9,40 +9,68 @@ Imports collision files.
 
 import os
 import bpy
-import bmesh
-import mathutils
+import numpy as np
 import importlib
 from . import common
+from . import geometry
 from . import rvstruct
 
 # Check if 'bpy' is already in locals to determine if this is a reload scenario
 if "bpy" in locals():
     importlib.reload(common)
+    importlib.reload(geometry)
     importlib.reload(rvstruct)
 
 # Importing specific classes and functions
-from .common import to_blender_axis, to_blender_scale, NCP_QUAD, COLORS
-from .rvstruct import NCP, Vector
-from mathutils import Color
+from .common import SCALE, NCP_QUAD, COLORS, fill_mesh
+from .geometry import weld_points
+from .rvstruct import NCP
 
-# Add specific imports from common as needed
-# Example: from .common import specific_function, SpecificClass
+# Planes that meet in each corner. Plane 0 is the face, the others are
+# the sides. Triangles use the first three corners only.
+QUAD_CORNERS = ((0, 1, 2), (0, 2, 3), (0, 3, 4), (0, 4, 1))
+TRI_CORNERS = ((0, 1, 2), (0, 2, 3), (0, 3, 1), (0, 1, 2))
 
-def intersect(d1, n1, d2, n2, d3, n3):
-    """ Intersection of three planes
+# Corner order of the faces, -1 marks unused corners
+QUAD_ORDER = (0, 3, 2, 1)
+TRI_ORDER = (0, 2, 1, -1)
+
+# Distance below which corners of neighboring polyhedra are merged
+WELD_TOLERANCE = 1e-5
+
+
+def intersect(distances, normals):
+    """ Intersections of plane triples, all at once.
     "If three planes are each specified by a point x and a unit normal vec n":
-    http://mathworld.wolfram.com/Plane-PlaneIntersection.html """
-    det = n1.scalar(n2.cross(n3))
+    http://mathworld.wolfram.com/Plane-PlaneIntersection.html
+    Takes (n, 3) distances and (n, 3, 3) normals. Returns the (n, 3) points
+    and a mask of the triples that intersect. """
+    n1, n2, n3 = normals[:, 0], normals[:, 1], normals[:, 2]
+    c23 = np.cross(n2, n3)
+    c31 = np.cross(n3, n1)
+    c12 = np.cross(n1, n2)
+    det = np.einsum("ij,ij->i", n1, c23)
 
     # If det is too small, there is no intersection
-    if abs(det) < 1e-100:
-        return None
+    valid = np.abs(det) >= 1e-100
+    det = np.where(valid, det, 1.0)
+
+    points = (distances[:, 0, None] * c23 +
+              distances[:, 1, None] * c31 +
+              distances[:, 2, None] * c12) / det[:, None]
+    valid &= np.isfinite(points).all(axis=1)
+    return points, valid
+
 
-    # Returns intersection point
-    return (d1 * n2.cross(n3) +
-            d2 * n3.cross(n1) +
-            d3 * n1.cross(n2)
-            ) / det
+def polyhedra_arrays(ncp):
+    """ Returns the planes (n, 5, 4), types and materials of all polyhedra """
+    planes = np.array([[(*p.normal.data, p.distance) for p in poly.planes]
+                       for poly in ncp.polyhedra],
+                      dtype=np.float64).reshape(-1, 5, 4)
+    types = np.array([poly.type for poly in ncp.polyhedra], dtype=np.int64)
+    materials = np.array([poly.material for poly in ncp.polyhedra],
+                         dtype=np.int64)
+    return planes, types, materials
 
 
 def import_file(filepath, scene):
@@ -52,62 +80,72 @@ def import_file(filepath, scene):
         ncp = NCP(file)
         print("Imported NCP file.")
 
-    filename = os.path.basename(filepath)
-    # Creates a new mesh and bmesh
+    planes, types, materials = polyhedra_arrays(ncp)
+    count = len(planes)
+
+    # Converts the planes to Blender space
+    normals = planes[:, :, (0, 2, 1)] * (1, 1, -1)
+    distances = -planes[:, :, 3] * SCALE
+
+    # Solves the plane triples of all corners, four per polyhedron
+    quads = (types & NCP_QUAD).astype(bool)
+    triples = np.where(quads[:, None, None], QUAD_CORNERS, TRI_CORNERS)
+    rows = np.arange(count)[:, None, None]
+    corners, valid = intersect(distances[rows, triples].reshape(-1, 3),
+                               normals[rows, triples].reshape(-1, 3, 3))
+    valid = valid.reshape(count, 4).all(axis=1)
+
+    # Skips polys if no intersection was found
+    if not valid.all():
+        print("Skipping {} polyhedra (no intersection).".format(
+            count - int(valid.sum())))
+
+    order = np.where(quads[:, None], QUAD_ORDER, TRI_ORDER)[valid]
+    used = order >= 0
+    loop_corners = (np.flatnonzero(valid)[:, None] * 4 + order)[used]
+
+    # Merges the corners that neighboring polyhedra share
+    verts, indices = weld_points(corners[loop_corners], WELD_TOLERANCE)
+
+    # Skips faces that lost a corner to welding
+    face_verts = np.full(order.shape, -1, dtype=np.int64)
+    face_verts[used] = indices
+    degenerate = np.zeros(len(face_verts), dtype=bool)
+    for a in range(4):
+        for b in range(a + 1, 4):
+            degenerate |= ((face_verts[:, a] == face_verts[:, b]) &
+                           (face_verts[:, a] >= 0))
+    if degenerate.any():
+        print("Skipping {} degenerate faces.".format(int(degenerate.sum())))
+    face_verts = face_verts[~degenerate]
+    loop_verts = face_verts[face_verts >= 0]
+    sizes = (face_verts >= 0).sum(axis=1)
+    face_materials = materials[valid][~degenerate]
+    face_types = types[valid][~degenerate]
+
+    # Creates the mesh in bulk
     me = bpy.data.meshes.new(filename)
-    bm = bmesh.new()
-
-    material_layer = bm.faces.layers.int.new("Material")
-    type_layer = bm.faces.layers.int.new("NCPType")
-    vc_layer = bm.loops.layers.color.new("NCPPreview")
-
-    # Goes through all polyhedra and creates faces from them
-    for poly in ncp.polyhedra:
-        # distances
-        ds = [-to_blender_scale(p.distance) for p in poly.planes]
-        # normals
-        ns = [Vector(data=to_blender_axis(p.normal)) for p in poly.planes]
-        verts = []
-
-        if poly.type & NCP_QUAD:
-            verts.append(intersect(ds[0], ns[0], ds[1], ns[1], ds[2], ns[2]))
-            verts.append(intersect(ds[0], ns[0], ds[2], ns[2], ds[3], ns[3]))
-            verts.append(intersect(ds[0], ns[0], ds[3], ns[3], ds[4], ns[4]))
-            verts.append(intersect(ds[0], ns[0], ds[4], ns[4], ds[1], ns[1]))
-            face = (0, 3, 2, 1)
-        else:
-            verts.append(intersect(ds[0], ns[0], ds[1], ns[1], ds[2], ns[2]))
-            verts.append(intersect(ds[0], ns[0], ds[2], ns[2], ds[3], ns[3]))
-            verts.append(intersect(ds[0], ns[0], ds[3], ns[3], ds[1], ns[1]))
-            face = (0, 2, 1)
-
-        # Skips the poly if no intersection was found
-        if None in verts:
-            print('Skipping polyhedron (no intersection).')
-            continue
-
-        # Creates the bmverts and face
-        bmverts = []
-        for x in face:
-            bmverts.append(bm.verts.new(verts[x]))
-        face = bm.faces.new(bmverts)
-
-        # Assigns the material and type
-        face[material_layer] = poly.material
-        face[type_layer] = poly.type
-
-        # Sets preview colors
-        for lnum in range(len(face.loops)):
-            face.loops[lnum][vc_layer][0] = COLORS[poly.material][0]
-            face.loops[lnum][vc_layer][1] = COLORS[poly.material][1]
-            face.loops[lnum][vc_layer][2] = COLORS[poly.material][2]
-
-        bm.verts.ensure_lookup_table()
-
-    # Converts the bmesh back to a mesh and frees resources
-    bm.normal_update()
-    bm.to_mesh(me)
-    bm.free()
+    fill_mesh(me, verts, loop_verts, sizes)
+
+    # Assigns the material and type
+    me.attributes.new("Material", "INT", "FACE").data.foreach_set(
+        "value", face_materials.astype(np.int32))
+    me.attributes.new("NCPType", "INT", "FACE").data.foreach_set(
+        "value", face_types.astype(np.int32))
+
+    # Sets preview colors. The last color is the one of NONE (-1), which is
+    # also used for materials that don't exist.
+    colors = np.ones((len(COLORS), 4), dtype=np.float32)
+    colors[:, :3] = COLORS
+    none = len(COLORS) - 1
+    color_index = np.where(
+        (face_materials >= 0) & (face_materials < none), face_materials, none)
+    loop_colors = np.repeat(colors[color_index], sizes, axis=0)
+    me.attributes.new("NCPPreview", "BYTE_COLOR", "CORNER").data.foreach_set(
+        "color_srgb", loop_colors.ravel())
+
+    me.update(calc_edges=True)
+    me.validate()
 
     print("Creating Blender object for {}...".format(filename))
     ob = bpy.data.objects.new(filename, me)
@@ -16,14 +16,17 @@ if "bpy" in locals():
 import os
 import bpy
 import bmesh
+import numpy as np
 
-from math import ceil
+from math import ceil, pi
 from mathutils import Color, Matrix
 from . import common
+from . import export_cache
 from . import rvstruct
 
 from .common import *
 from .rvstruct import (
+    POLYHEDRON_DTYPE,
     BoundingBox,
     LookupGrid,
     LookupList,
@@ -38,23 +41,7 @@ def export_file(filepath, scene):
     print("Exporting NCP to {}...".format(filepath))
 
     # Collects objects for export
-    objs = []
-    if scene.ncp_export_selected:
-        objs = [ob for ob in scene.objects if ob.select_get() and not ob.get("ignore_ncp", False)]
-    else:
-        for obj in scene.objects:
-            conditions = (
-                obj.data and
-                obj.type == "MESH" and
-                not obj.get("is_cube", False) and
-                not obj.get("is_bcube", False) and
-                not obj.get("is_bbox", False) and
-                not obj.get("ignore_ncp", False) and
-                not obj.get("is_mirror_plane", False) and
-                not obj.get("is_track_zone", False)
-            )
-            if conditions:
-                objs.append(obj)
+    objs = get_export_objects(scene)
 
     if objs == []:
         common.queue_error("exporting NCP", "No suitable objects in scene.")
@@ -69,23 +56,74 @@ def export_file(filepath, scene):
     ncp = NCP()
 
     # Adds all meshes to the ncp
+    chunks = []
+    reused = 0
+    faces_before = faces_after = 0
     for obj in objs:
+        # Unchanged objects are taken from the cache
+        digest = None
+        if scene.export_cache:
+            settings = collision_settings(scene, transform)
+            records, digest = export_cache.lookup("ncp", obj, settings)
+            if records is not None:
+                chunks.append(records)
+                reused += 1
+                continue
+
         print("Adding {} to ncp...".format(obj.name))
-        bm = bmesh.new()
-        bm.from_mesh(obj.data)
+        data = extract_collision_mesh(obj, scene, transform)
+        records = encode_polyhedra(data)
+        chunks.append(records)
+        faces_before += data.get("faces_before", len(data["loop_start"]))
+        faces_after += len(data["loop_start"])
 
-        if scene.triangulate_ngons:
-            num_ngons = triangulate_ngons(bm)
-            if scene.triangulate_ngons > 0:
-                print("Triangulated {} n-gons".format(num_ngons))
+        if digest is not None:
+            export_cache.store("ncp", obj, digest, records, settings)
 
-        # Applies translation, rotation and scale
-        apply_trs(obj, bm, transform)
+    if reused:
+        print("Reused {} unchanged objects".format(reused))
+    if faces_before != faces_after:
+        print("Simplified collision from {} to {} polygons".format(
+            faces_before, faces_after))
 
-        add_bm_to_ncp(bm, ncp)
+    if chunks:
+        ncp.set_arrays(np.concatenate(chunks))
 
-    # Sets length of polyhedron list
-    ncp.polyhedron_count = len(ncp.polyhedra)
+    grid_size = scene.ncp_collgrid_size
+    if scene.ncp_collgrid_auto:
+        grid_size = None
+    write_ncp(filepath, ncp, scene.ncp_export_collgrid, grid_size)
+
+
+def get_export_objects(scene):
+    if scene.ncp_export_selected:
+        return [ob for ob in scene.objects
+                if ob.select_get() and not ob.get("ignore_ncp", False)]
+    return [obj for obj in scene.objects if is_collision_object(obj)]
+
+
+def is_collision_object(obj):
+    """ Whether an object is exported to .ncp when not exporting selected """
+    return bool(
+        obj.data and
+        obj.type == "MESH" and
+        not obj.get("is_cube", False) and
+        not obj.get("is_bcube", False) and
+        not obj.get("is_bbox", False) and
+        not obj.get("ignore_ncp", False) and
+        not obj.get("is_mirror_plane", False) and
+        not obj.get("is_track_zone", False)
+    )
+
+
+def write_ncp(filepath, ncp, collgrid=True, grid_size=None):
+    """
+    Generates the collision grid and writes the NCP. grid_size None tunes
+    the grid automatically. Doesn't use bpy, so it can run in a worker thread.
+    """
+    # Sets length of polyhedron list, records set in bulk are counted already
+    if ncp.arrays is None:
+        ncp.polyhedron_count = len(ncp.polyhedra)
     if ncp.polyhedron_count > 65535:
         common.queue_error(
             "exporting ncp",
@@ -94,80 +132,239 @@ def export_file(filepath, scene):
         return None
 
     # Creates a collision grid
-    if scene.ncp_export_collgrid:
+    if collgrid:
         print("Exporting collision grid...")
-        ncp.generate_lookup_grid(grid_size=scene.ncp_collgrid_size)
+        if grid_size is None:
+            size, report = ncp.tune_lookup_grid()
+            print(report)
+        else:
+            ncp.generate_lookup_grid(grid_size=grid_size)
 
     # Writes the NCP to file
     with open(filepath, "wb") as f:
         ncp.write(f)
+    return ncp
 
-    # Frees the bmesh
-    bm.free()
-
-
-def add_bm_to_ncp(bm, ncp):
-
-    # Material and type layers. The preview layer will be ignored.
-    material_layer = (bm.faces.layers.int.get("Material") or
-                      bm.faces.layers.int.new("Material"))
-    type_layer = (bm.faces.layers.int.get("NCPType") or
-                  bm.faces.layers.int.new("NCPType"))
-
-    for face in bm.faces:
-        poly = Polyhedron()
-
-        # Doesn't export if material is NONE
-        if face[material_layer] < 0:
-            continue
 
-        # Doesn't export if nocoll flag is set (non-RV)
-        if face[type_layer] & NCP_NOCOLL:
-            print("Ignoring polygon due to nocoll flag")
-            continue
+def collision_settings(scene, transform=True):
+    """ Export settings that change the collision of an object """
+    return (transform, scene.triangulate_ngons, scene.ncp_merge_quads,
+            scene.ncp_decimate, round(scene.ncp_merge_angle, 6))
 
-        # Sets polyhedron properties
-        poly.material = face[material_layer]
-        if poly.material > 26:
-            print(face[material_layer])
-            queue_error("exporting to .ncp", "Invalid material")
-            if DEBUG:
-                return
 
-        poly.type = face[type_layer] & NCP_PROP_MASK
-
-        verts = face.verts
-
-        # Determines normal and distance for main plane
-        normal = Vector(data=to_revolt_axis(face.normal))
-        normal.normalize()
-
-        vec = Vector(data=to_revolt_coord(verts[0].co))
-        distance = -normal.dot(vec)
-
-        # Creates main plane
-        poly.planes.append(Plane(n=normal, d=distance))
-
-        if len(face.verts) == 4:
-            # Sets the quad flag because the poly has 4 vertices
-            poly.type |= NCP_QUAD
-
-        # Writes the cutting planes
-        vcount = len(verts[:4])
-        for i in range(vcount - 1, -1, -1):
-            vec0 = Vector(data=to_revolt_coord(verts[i].co))
-            vec1 = Vector(data=to_revolt_coord(verts[(i + 1) % vcount].co))
-
-            pnormal = normal.cross(vec0 - vec1)
-            pnormal.normalize()
-            distance = -pnormal.dot(vec0)
-
-            poly.planes.append(Plane(n=Vector(data=pnormal), d=distance))
-
-        # Writes remaining empty planes
-        for i in range(4 - vcount):
-            poly.planes.append(Plane())
-
-        # Creates a bbox and adds the poly to the ncp
-        poly.bbox = BoundingBox(data=rvbbox_from_verts(verts))
-        ncp.polyhedra.append(poly)
+def extract_collision_mesh(obj, scene, transform=True):
+    """
+    Reads the faces of an object for the collision as arrays, with the
+    positions transformed by the world matrix (without the translation if
+    transform is False). N-gons are triangulated first if enabled and the
+    faces are simplified if that is enabled.
+    """
+    faces_before = None
+    if scene.ncp_merge_quads or scene.ncp_decimate:
+        tmp, faces_before = simplified_copy(obj.data, scene)
+    else:
+        tmp = triangulated_copy(obj.data, scene.triangulate_ngons)
+    try:
+        data = read_collision_mesh(tmp or obj.data)
+    finally:
+        if tmp:
+            bpy.data.meshes.remove(tmp)
+
+    data["co"] = transform_points(export_matrix(obj, transform), data["co"])
+    if faces_before is not None:
+        data["faces_before"] = faces_before
+    return data
+
+
+def simplified_copy(me, scene):
+    """
+    Returns a temporary copy of the mesh with simplified collision faces
+    (see simplify_collision) and the amount of faces before simplifying.
+    N-gons are always triangulated.
+    """
+    bm = bmesh.new()
+    bm.from_mesh(me)
+    triangulate_ngons(bm)
+    faces_before = len(bm.faces)
+
+    simplify_collision(bm, scene.ncp_merge_angle,
+                       merge_quads=scene.ncp_merge_quads,
+                       decimate=scene.ncp_decimate)
+    print("Simplified collision of {}: {} -> {} polygons".format(
+        me.name, faces_before, len(bm.faces)))
+
+    tmp = bpy.data.meshes.new("{}_collision".format(me.name))
+    bm.to_mesh(tmp)
+    bm.free()
+    return tmp, faces_before
+
+
+def simplify_collision(bm, angle_limit, merge_quads=True, decimate=False):
+    """
+    Reduces the faces of a collision bmesh without n-gons. Faces are only
+    merged with neighbours that have the same Material and NCPType.
+    decimate dissolves flat areas (within angle_limit) into larger faces
+    and triangulates them again. merge_quads joins pairs of coplanar
+    triangles into quads. Quads that end up concave are split again, since
+    the cutting planes of a polyhedron only work for convex faces.
+    """
+    material_layer = bm.faces.layers.int.get("Material")
+    type_layer = bm.faces.layers.int.get("NCPType")
+
+    def surface(face):
+        return (face[material_layer] if material_layer else 0,
+                face[type_layer] if type_layer else 0)
+
+    if decimate:
+        edges = [edge for edge in bm.edges if len(edge.link_faces) == 2 and
+                 surface(edge.link_faces[0]) == surface(edge.link_faces[1])]
+        bmesh.ops.dissolve_limit(bm, angle_limit=angle_limit,
+                                 use_dissolve_boundaries=False,
+                                 verts=list(bm.verts), edges=edges,
+                                 delimit=set())
+        triangulate_ngons(bm)
+
+    if merge_quads:
+        triangles = {}
+        for face in bm.faces:
+            if len(face.verts) == 3:
+                triangles.setdefault(surface(face), []).append(face)
+        for faces in triangles.values():
+            bmesh.ops.join_triangles(bm, faces=faces,
+                                     angle_face_threshold=angle_limit,
+                                     angle_shape_threshold=pi)
+
+    bm.normal_update()
+    concave = [face for face in bm.faces
+               if len(face.verts) == 4 and not is_convex(face)]
+    if concave:
+        bmesh.ops.triangulate(bm, faces=concave, quad_method='BEAUTY',
+                              ngon_method='BEAUTY')
+
+
+def is_convex(face):
+    """ Whether all corners of a face turn the same way as its normal """
+    co = [vert.co for vert in face.verts]
+    count = len(co)
+    for i in range(count):
+        edge = co[(i + 1) % count] - co[i]
+        following = co[(i + 2) % count] - co[(i + 1) % count]
+        if edge.cross(following).dot(face.normal) <= 0:
+            return False
+    return True
+
+
+def read_collision_mesh(me):
+    """ Reads the geometry and the collision layers of a mesh into arrays """
+    num_faces = len(me.polygons)
+
+    data = {}
+    data["co"] = np.empty((len(me.vertices), 3), dtype=np.float32)
+    me.vertices.foreach_get("co", data["co"].ravel())
+    data["loop_verts"] = np.empty(len(me.loops), dtype=np.int32)
+    me.loops.foreach_get("vertex_index", data["loop_verts"])
+    data["loop_start"] = np.empty(num_faces, dtype=np.int32)
+    me.polygons.foreach_get("loop_start", data["loop_start"])
+    data["loop_total"] = np.empty(num_faces, dtype=np.int32)
+    me.polygons.foreach_get("loop_total", data["loop_total"])
+
+    # Faces without the layers get the first material and no flags.
+    # The preview layer will be ignored.
+    for name in ("Material", "NCPType"):
+        values = np.zeros(num_faces, dtype=np.int32)
+        layer = me.attributes.get(name)
+        if layer and layer.data_type == "INT" and layer.domain == "FACE":
+            layer.data.foreach_get("value", values)
+        data[name] = values
+    return data
+
+
+def encode_polyhedra(data):
+    """
+    Builds the polyhedron records of all faces from the arrays of
+    read_collision_mesh: the face plane, one cutting plane per edge of the
+    first 4 corners (empty planes for the rest) and the bbox. Faces without
+    material (< 0) or with the nocoll flag are left out. Doesn't use bpy.
+    """
+    materials = data["Material"]
+    types = data["NCPType"]
+
+    # Doesn't export if material is NONE or the nocoll flag is set (non-RV)
+    keep = materials >= 0
+    nocoll = keep & (types & NCP_NOCOLL != 0)
+    if nocoll.any():
+        print("Ignoring {} polygons due to nocoll flag".format(
+            np.count_nonzero(nocoll)))
+    keep &= ~nocoll
+
+    invalid = keep & (materials > 26)
+    if invalid.any():
+        print(materials[invalid][0])
+        queue_error("exporting to .ncp", "Invalid material")
+        if DEBUG:
+            # Leaves out the rest of the mesh like before
+            keep[np.argmax(invalid):] = False
+
+    faces = np.flatnonzero(keep)
+    sizes = data["loop_total"][faces].astype(np.int64)
+    starts = data["loop_start"][faces].astype(np.int64)
+    count = len(faces)
+    records = np.zeros(count, dtype=POLYHEDRON_DTYPE)
+    if count == 0:
+        return records
+
+    # Positions in Re-Volt coordinates
+    co = data["co"].astype(np.float64)
+    co = np.stack((co[:, 0], -co[:, 2], co[:, 1]), axis=1) / SCALE
+
+    # Corners of all faces in order, relative to the first corner of the
+    # face for precision
+    offsets = np.cumsum(sizes) - sizes
+    local = np.arange(sizes.sum()) - np.repeat(offsets, sizes)
+    face_start = np.repeat(starts, sizes)
+    corners = co[data["loop_verts"][face_start + local]]
+    firsts = co[data["loop_verts"][starts]]
+    relative = corners - np.repeat(firsts, sizes, axis=0)
+    following = relative[np.repeat(offsets, sizes) +
+                         (local + 1) % np.repeat(sizes, sizes)]
+
+    # Face normals (Newell's method, same as the cross products used by
+    # Blender for triangles and quads)
+    normals = np.add.reduceat(np.cross(relative, following), offsets)
+    normals = normalized(normals)
+
+    planes = records["planes"]
+    planes[:, 0, :3] = normals
+    planes[:, 0, 3] = -np.einsum("ij,ij->i", normals, firsts)
+
+    # Cutting planes go through the edges of the first 4 corners backwards
+    vcount = np.minimum(sizes, 4)
+    for j in range(4):
+        index = vcount - 1 - j
+        used = index >= 0
+        index = np.maximum(index, 0)
+        vec0 = co[data["loop_verts"][starts + index]]
+        vec1 = co[data["loop_verts"][starts + (index + 1) % vcount]]
+        pnormals = normalized(np.cross(normals, vec0 - vec1))
+        distances = -np.einsum("ij,ij->i", pnormals, vec0)
+        planes[used, j + 1, :3] = pnormals[used]
+        planes[used, j + 1, 3] = distances[used]
+
+    # Bounding boxes over all corners
+    lows = np.minimum.reduceat(corners, offsets)
+    highs = np.maximum.reduceat(corners, offsets)
+    records["bbox"] = np.stack((lows[:, 0], highs[:, 0], lows[:, 1],
+                                highs[:, 1], lows[:, 2], highs[:, 2]), axis=1)
+
+    poly_types = types[faces] & NCP_PROP_MASK
+    poly_types[sizes == 4] |= NCP_QUAD
+    records["type"] = poly_types
+    records["material"] = materials[faces]
+    return records
+
+
+def normalized(vectors):
+    """ Normalizes rows of vectors, zero vectors stay zero """
+    lengths = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, lengths, out=np.zeros_like(vectors),
+                     where=lengths > 0)
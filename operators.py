@@ -27,6 +27,7 @@ from .rvstruct import *
 from . import carinfo
 from .common import get_format, FORMAT_PRM, FORMAT_FIN, FORMAT_NCP, FORMAT_HUL, FORMAT_W, FORMAT_RIM, FORMAT_TA_CSV, FORMAT_TAZ, FORMAT_UNK
 from .common import get_errors, msg_box, FORMATS, to_revolt_scale, FORMAT_CAR, TEX_PAGES_MAX
+from .common import clear_texture_cache, forget_folder_times
 
 from bpy.props import (
     BoolProperty,
@@ -79,6 +80,13 @@ class ImportRV(bpy.types.Operator):
 
         print("Importing {}".format(self.filepath))
 
+        # Texture lookups are only kept for this import unless enabled.
+        # Kept ones are checked for changed folders once per import.
+        if not scene.texture_cache_session:
+            clear_texture_cache()
+        else:
+            forget_folder_times()
+
         # Handle different formats
         if frmt == FORMAT_UNK:
             self.report({'ERROR'}, "Unsupported format.")
@@ -235,6 +243,47 @@ def exec_export(filepath, context):
 
     return {"FINISHED"}
     
+class ExportTrack(bpy.types.Operator):
+    bl_idname = "export_scene.revolt_track"
+    bl_label = "Export Track"
+    bl_description = ("Export the world, collision, instances, mirrors, hull "
+                      "and zones of the track at once.\nThe files are named "
+                      "after the selected folder")
+    directory: bpy.props.StringProperty(subtype="DIR_PATH")
+
+    def execute(self, context):
+        from . import track_out
+
+        start_time = time.time()
+        context.window.cursor_set("WAIT")
+
+        # Turns off undo for better performance
+        use_global_undo = bpy.context.preferences.edit.use_global_undo
+        bpy.context.preferences.edit.use_global_undo = False
+
+        if bpy.ops.object.mode_set.poll():
+            bpy.ops.object.mode_set(mode="OBJECT")
+
+        try:
+            timings = track_out.export_track(self.directory, context)
+        finally:
+            bpy.context.preferences.edit.use_global_undo = use_global_undo
+            context.window.cursor_set("DEFAULT")
+
+        report = ", ".join("{} {:.3f}s".format(frmt, timings[frmt])
+                           for frmt in track_out.TRACK_FORMATS
+                           if frmt in timings)
+        print("Read objects in {:.3f}s, meshes in {:.3f}s".format(
+            timings["classify"], timings["meshes"]))
+        print("Track export done in {:.3f} seconds ({}).\n{}".format(
+            time.time() - start_time, report, get_errors()))
+        self.report({'INFO'}, "Exported track: {}".format(report))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
 class RVIO_OT_ReadCarParameters(bpy.types.Operator):
     bl_idname = "rvio.read_car_parameters"
     bl_label = "Read Car Parameters"
@@ -476,6 +525,23 @@ class RVIO_OT_NCPGridSize(bpy.types.Operator):
     def draw(self, context):
         self.layout.prop(self, "grid_size", text="Grid Size", slider=True)
 
+class RVIO_OT_NCPGridAuto(bpy.types.Operator):
+    bl_idname = "rvio.ncp_grid_auto"
+    bl_label = "Toggle Automatic NCP Grid Size"
+
+    def execute(self, context):
+        scene = context.scene
+        # Toggle the ncp_collgrid_auto property
+        scene.ncp_collgrid_auto = not scene.ncp_collgrid_auto
+
+        # Conditional message based on the toggled state
+        if scene.ncp_collgrid_auto:
+            self.report({'INFO'}, "Collgrid size will be picked on export")
+        else:
+            self.report({'INFO'}, f"Collgrid size set to {scene.ncp_collgrid_size}")
+
+        return {'FINISHED'}
+
 
 """
 HELPERS -----------------------------------------------------------------------
@@ -1029,6 +1095,76 @@ class ButtonHullGenerate(bpy.types.Operator):
             self.report({'ERROR'}, "Convex hull generation failed.")
         return {'FINISHED'}
     
+class ButtonHullDecompose(bpy.types.Operator):
+    bl_idname = "hull.decompose"
+    bl_label = "Decompose into Convex Hulls"
+    bl_description = ("Splits the selected object into several convex hulls.\n"
+                      "The object itself is kept")
+
+    @classmethod
+    def poll(cls, context):
+        return context.active_object is not None and context.active_object.type == 'MESH'
+
+    def execute(self, context):
+        from concurrent.futures import ThreadPoolExecutor
+        from . import geometry
+
+        scene = context.scene
+        self.obj = context.active_object
+        vertices, triangles = tools.read_hull_source(self.obj)
+        if len(triangles) == 0:
+            self.report({'ERROR'}, "The object has no faces.")
+            return {'CANCELLED'}
+
+        # Cutting planes are evaluated in worker processes, a thread waits
+        # for them so Blender stays responsive
+        self.start_time = time.time()
+        self.pool = tools.decomposition_pool()
+        self.runner = ThreadPoolExecutor(max_workers=1)
+        self.future = self.runner.submit(
+            geometry.decompose, vertices, triangles,
+            scene.hul_decompose_hulls, scene.hul_decompose_concavity,
+            scene.hul_decompose_resolution, mapper=self.pool.map)
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.1, window=context.window)
+        wm.modal_handler_add(self)
+        context.workspace.status_text_set(
+            "Decomposing {} into convex hulls (Esc to cancel)".format(self.obj.name))
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.finish(context)
+            self.report({'INFO'}, "Convex decomposition cancelled.")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER' or not self.future.done():
+            return {'PASS_THROUGH'}
+
+        self.finish(context)
+        try:
+            parts = self.future.result()
+        except Exception as e:
+            self.report({'ERROR'}, "Convex decomposition failed: {}".format(e))
+            return {'CANCELLED'}
+
+        if self.obj.name not in context.scene.objects:
+            self.report({'ERROR'}, "The object was removed.")
+            return {'CANCELLED'}
+        bpy.ops.object.select_all(action='DESELECT')
+        hulls = tools.create_decomposed_hulls(context, self.obj, parts)
+        print("Decomposed {} into {} convex hulls in {:.3f} seconds.".format(
+            self.obj.name, len(hulls), time.time() - self.start_time))
+        self.report({'INFO'}, "Generated {} convex hulls.".format(len(hulls)))
+        return {'FINISHED'}
+
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.runner.shutdown(wait=False)
+
 class SelectNCPMaterial(bpy.types.Operator):
     bl_idname = "ncpmaterial.select"
     bl_label = "Select Material Faces"
@@ -11,12 +11,14 @@ import os
 import bpy
 import bmesh
 import importlib
+import numpy as np
 from mathutils import Color, Vector
 from . import common
 from . import rvstruct
 from . import img_in
 from .rvstruct import PRM
 from .common import to_blender_coord, to_blender_axis, FACE_QUAD, reverse_quad, get_texture_path, FACE_ENV
+from .common import SCALE, fill_mesh, get_texture_material
 from .carinfo import read_parameters
 
 # Check if 'bpy' is already in locals to determine if this is a reload scenario
@@ -46,7 +48,7 @@ def import_file(filepath, scene):
 
         # Reads meshes until the file ends
         while file.tell() < file_end:
-            meshes.append(PRM(file))
+            meshes.append(PRM(file, bulk=True))
 
     print("Imported {} ({} meshes)".format(filename, len(meshes)))
 
@@ -77,18 +79,112 @@ def import_mesh(prm, scene, filepath, envlist=None):
     # Create a new mesh
     me = bpy.data.meshes.new(filename)
 
-    # Create a new bmesh
-    bm = bmesh.new()
-    
-    add_rvmesh_to_bmesh(prm, bm, me, filepath, scene, envlist)
-
-    # Convert the bmesh back to a mesh and free resources
-    bm.normal_update()
-    bm.to_mesh(me)
-    bm.free()
+    build_mesh(me, prm.columns(), filepath, scene, envlist)
 
     return me
 
+
+def build_mesh(me, columns, filepath, scene, envlist=None):
+    """
+    Fills an empty mesh with the polygon and vertex arrays of a PRM or
+    .w mesh (see BulkMesh.columns) in a few bulk calls.
+    """
+    types = columns["types"]
+    indices = columns["indices"]
+    vertex_count = len(columns["positions"])
+
+    # Loops are reversed, like reverse_quad does: 3 2 1 0 for quads and
+    # 2 1 0 for triangles. -1 marks the unused fourth corner.
+    quads = (types & FACE_QUAD).astype(bool)
+    order = np.where(quads[:, None], (3, 2, 1, 0), (2, 1, 0, -1))
+    used = order >= 0
+    corners = np.where(used, order, 0)
+    face_verts = np.where(used, np.take_along_axis(indices, corners, 1), -1)
+
+    # Faces with invalid or repeated vertices can't be created
+    keep = (face_verts < vertex_count).all(axis=1)
+    for a in range(4):
+        for b in range(a + 1, 4):
+            keep &= ~((face_verts[:, a] == face_verts[:, b]) &
+                      (face_verts[:, a] >= 0))
+    # The same face (in any vertex order) can only exist once
+    keys = np.sort(face_verts, axis=1)
+    first = np.unique(keys[keep], axis=0, return_index=True)[1]
+    unique = np.zeros(int(keep.sum()), dtype=bool)
+    unique[first] = True
+    keep[keep] = unique
+    if not keep.all():
+        print("Could not create {} faces.".format(int((~keep).sum())))
+
+    # Each env polygon of the file uses the next env color
+    env = (types & FACE_ENV).astype(bool) if envlist else np.zeros(
+        len(types), dtype=bool)
+    env_count = int(env.sum())
+    env_colors = np.ones((len(types), 4), dtype=np.float32)
+    env_alpha = np.zeros(len(types), dtype=np.float32)
+    if env_count:
+        start = scene.envidx
+        cols = envlist[start:start + env_count]
+        env_rows = np.flatnonzero(env)[:len(cols)]
+        env_colors[env_rows, :3] = [c.color for c in cols]
+        env_colors[env_rows, :3] /= 255
+        env_alpha[env_rows] = [float(c.alpha) / 255 for c in cols]
+        scene.envidx += env_count
+
+    # Per loop data of the kept faces, in loop order
+    used = used[keep]
+    corners = corners[keep]
+    rows = np.arange(len(corners))[:, None]
+    loop_totals = used.sum(axis=1)
+
+    positions = columns["positions"].astype(np.float64)
+    positions = positions[:, (0, 2, 1)] * (SCALE, SCALE, -SCALE)
+    fill_mesh(me, positions, face_verts[keep][used], loop_totals)
+
+    uvs = columns["uvs"][keep][rows, corners][used].astype(np.float32)
+    uvs[:, 1] = 1 - uvs[:, 1]
+    me.uv_layers.new(name="UVMap").data.foreach_set("uv", uvs.ravel())
+
+    # Colors are stored as BGRA, alpha is stored inverted
+    colors = columns["colors"][keep][rows, corners][used].astype(np.float32)
+    colors /= 255
+    vertex_colors = np.ones((len(colors), 4), dtype=np.float32)
+    vertex_colors[:, :3] = colors[:, (2, 1, 0)]
+    vertex_alpha = np.ones((len(colors), 4), dtype=np.float32)
+    vertex_alpha[:, :3] = colors[:, 3, None]
+    loop_env = np.repeat(env_colors[keep], loop_totals, axis=0)
+
+    for name, values in (("Col", vertex_colors), ("Env", loop_env),
+                         ("Alpha", vertex_alpha)):
+        layer = me.color_attributes.new(name, "BYTE_COLOR", "CORNER")
+        layer.data.foreach_set("color_srgb", values.ravel())
+
+    # Face properties (bit field and texture, one int per face)
+    me.attributes.new("EnvAlpha", "FLOAT", "FACE").data.foreach_set(
+        "value", env_alpha[keep])
+    me.attributes.new("Texture Number", "INT", "FACE").data.foreach_set(
+        "value", columns["textures"][keep].astype(np.int32))
+    me.attributes.new("Type", "INT", "FACE").data.foreach_set(
+        "value", types[keep].astype(np.int32))
+    me.polygons.foreach_set("use_smooth", np.ones(len(loop_totals), dtype=bool))
+
+    # Assigns a material to each texture, in order of first use
+    textures = columns["textures"][keep].astype(np.int64)
+    material_indices = np.zeros(len(textures), dtype=np.int32)
+    found, first = np.unique(textures, return_index=True)
+    material_dict = {}
+    for texture in found[np.argsort(first)].tolist():
+        if texture < 0:
+            continue
+        texture_path = get_texture_path(filepath, texture, scene)
+        if texture_path not in material_dict:
+            me.materials.append(get_or_create_material(texture_path))
+            material_dict[texture_path] = len(me.materials) - 1
+        material_indices[textures == texture] = material_dict[texture_path]
+    me.polygons.foreach_set("material_index", material_indices)
+
+    me.update(calc_edges=True)
+
 def get_or_create_material(texture_path):
     # If texture path is empty or the file does not exist, return None or a placeholder
     if not texture_path or not os.path.isfile(texture_path):
@@ -97,22 +193,7 @@ def get_or_create_material(texture_path):
         # Returning None will skip the texture, alternatively, you could specify a path to a default texture
         return None
 
-    # Check if the material already exists
-    for mat in bpy.data.materials:
-        if mat.name == texture_path:
-            return mat
-
-    # Create a new material with the texture
-    mat = bpy.data.materials.new(name=texture_path)
-    mat.use_nodes = True
-    bsdf = mat.node_tree.nodes.get('Principled BSDF')
-    
-    # Create image texture node and load the texture
-    tex_image = mat.node_tree.nodes.new('ShaderNodeTexImage')
-    tex_image.image = bpy.data.images.load(texture_path)
-    mat.node_tree.links.new(bsdf.inputs['Base Color'], tex_image.outputs['Color'])
-
-    return mat
+    return get_texture_material(texture_path)
 
 def add_rvmesh_to_bmesh(prm, bm, me, filepath, scene, envlist=None):
     """
@@ -136,8 +217,8 @@ def add_rvmesh_to_bmesh(prm, bm, me, filepath, scene, envlist=None):
         # Creates vertices
         bm.verts.new(Vector((position[0], position[1], position[2])))
 
-        # Ensures lookup table (potentially puts out an error otherwise)
-        bm.verts.ensure_lookup_table()
+    # Ensures lookup table (potentially puts out an error otherwise)
+    bm.verts.ensure_lookup_table()
 
     for poly in prm.polygons:
         is_quad = poly.type & FACE_QUAD
@@ -165,9 +246,6 @@ def add_rvmesh_to_bmesh(prm, bm, me, filepath, scene, envlist=None):
         except ValueError as e:
             print(f"Could not create face: {e}")
             continue
-        
-        bm.verts.ensure_lookup_table()
-        bm.faces.ensure_lookup_table()
 
         # Assigns env alpha to face. Colors are on a vcol layer
         if envlist and (poly.type & FACE_ENV):
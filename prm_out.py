@@ -18,6 +18,7 @@ if "bpy" in locals():
 import os
 import bpy
 import bmesh
+import numpy as np
 from mathutils import Color, Vector, Matrix
 from . import common
 from . import rvstruct
@@ -26,6 +27,7 @@ from . import layers
 
 from .common import *
 from .layers import *
+from .geometry import bounding_sphere, sphere_volume_saved
 from .props.props_scene import RVSceneProperties
 
 
@@ -54,210 +56,311 @@ def export_file(filepath, scene, context):
             if prm:
                 prm.write(file)
                 
-def get_texture_from_material(face, obj):
-    # Check if the object has materials
-    if obj.material_slots:
-        # Get the material from the first slot as a starting point
-        # You might need to modify this logic if your object uses multiple materials
-        mat = obj.material_slots[face.material_index].material
-        if mat and mat.node_tree:
-            # Iterate over all nodes in the material
-            for node in mat.node_tree.nodes:
-                # Check if the node is an image texture node
-                if node.type == 'TEX_IMAGE':
-                    # Return the first image texture found
-                    # You might want to extend this logic based on your needs
-                    return node.image
+def get_texture_from_material(mat):
+    if mat and mat.node_tree:
+        # Iterate over all nodes in the material
+        for node in mat.node_tree.nodes:
+            # Check if the node is an image texture node
+            if node.type == 'TEX_IMAGE':
+                # Return the first image texture found
+                # You might want to extend this logic based on your needs
+                return node.image
     return None
 
-def export_mesh(me, obj, scene, filepath, world=None):
+
+def get_slot_textures(obj):
+    """ Texture number of each material slot, -1 if it has no texture """
+    textures = []
+    for slot in obj.material_slots:
+        image = get_texture_from_material(slot.material)
+        textures.append(texture_to_int(image.name) if image else -1)
+    return textures
+
+
+def get_attribute(me, name, data_type, domain, prop, shape, default, dtype):
+    """ Reads a mesh attribute at once, or returns the default values """
+    values = np.full(shape, default, dtype=dtype)
+    layer = me.attributes.get(name)
+    if layer and layer.data_type == data_type and layer.domain == domain:
+        layer.data.foreach_get(prop, values.ravel())
+    return values
+
+
+def read_mesh(me):
+    """ Reads the geometry and RV layers of a mesh into arrays """
+    num_verts = len(me.vertices)
+    num_loops = len(me.loops)
+    num_faces = len(me.polygons)
+
+    data = {}
+    data["co"] = np.empty((num_verts, 3), dtype=np.float32)
+    me.vertices.foreach_get("co", data["co"].ravel())
+    data["loop_verts"] = np.empty(num_loops, dtype=np.int32)
+    me.loops.foreach_get("vertex_index", data["loop_verts"])
+    data["loop_start"] = np.empty(num_faces, dtype=np.int32)
+    me.polygons.foreach_get("loop_start", data["loop_start"])
+    data["loop_total"] = np.empty(num_faces, dtype=np.int32)
+    me.polygons.foreach_get("loop_total", data["loop_total"])
+    data["material_index"] = np.empty(num_faces, dtype=np.int32)
+    me.polygons.foreach_get("material_index", data["material_index"])
+
+    # Without a UV layer, UVs are written as (0, 0) instead of being flipped
+    data["uv"] = np.zeros((num_loops, 2), dtype=np.float32)
+    uv_layer = me.uv_layers.get("UVMap")
+    data["has_uv"] = uv_layer is not None
+    if uv_layer:
+        uv_layer.data.foreach_get("uv", data["uv"].ravel())
+
+    # Missing color layers are white, like newly created ones
+    for name in ("Col", "Alpha", "Env"):
+        data[name] = get_attribute(me, name, "BYTE_COLOR", "CORNER",
+                                   "color_srgb", (num_loops, 4), 1, np.float32)
+    data["EnvAlpha"] = get_attribute(me, "EnvAlpha", "FLOAT", "FACE",
+                                     "value", num_faces, 0, np.float32)
+    data["Type"] = get_attribute(me, "Type", "INT", "FACE",
+                                 "value", num_faces, 0, np.int32)
+    return data
+
+
+def export_mesh(me, obj, scene, filepath, world=None, check_limits=True):
     """
     This exports an object to an rvstruct object. This is also used for .w
     meshes since they're pretty much the same as PRM. The only additions are
     boundaries and the per-face environment color.
     If an rvstruct world object is provided, this will return an rvstruct.mesh
     instead of an rvstruct.PRM.
+    check_limits can be disabled if the mesh is split up before writing.
     """
+    data = extract_mesh(me, obj, scene, world=world is not None)
+    if check_limits and not check_mesh_limits(data):
+        return None
+
+    prm, env_list = encode_mesh(data, world=world is not None,
+                                report=scene.w_report_spheres)
+    if world is not None:
+        world.env_list.extend(env_list)
+    return prm
+
+
+def extract_mesh(me, obj, scene, world=False):
+    """
+    Reads everything needed for exporting a mesh from Blender. Applies the
+    object transformation like the exporters always did. The result only
+    contains arrays and plain values, so it can be encoded in another thread.
+    """
+    if world:
+        return extract_world_mesh(me, obj, scene)
+
     # Creates a bmesh from the supplied mesh
     bm = bmesh.new()
     bm.from_mesh(me)
 
-    if world is None:
-        # Applies the object scale if enabled
-        if scene.apply_scale:
-            bmesh.ops.scale(
-                bm,
-                vec=obj.scale,
-                verts=bm.verts
-            )
-        # Applies the object rotation if enabled
-        if scene.apply_rotation:
-            bmesh.ops.rotate(
-                bm,
-                cent=obj.location,
-                matrix=obj.rotation_euler.to_matrix(),
-                space=obj.matrix_basis,
-                verts=bm.verts
-            )
-    else:
-
-        # Removes the parent for exporting
-        parent = obj.parent
-        if parent:
-            mat = obj.matrix_world.copy()
-            old_mat = obj.matrix_basis.copy()
-            obj.parent = None
-            obj.matrix_world = mat
-
-        spc = obj.matrix_basis
-        bmesh.ops.scale(
-            bm,
-            vec=obj.scale,
-            space=spc,
-            verts=bm.verts
-        )
-        bmesh.ops.transform(
-            bm,
-            matrix=Matrix.Translation(obj.location),
-            space=spc,
-            verts=bm.verts
-        )
-        bmesh.ops.rotate(
-            bm,
-            cent=obj.location,
-            matrix=obj.rotation_euler.to_matrix(),
-            space=spc,
-            verts=bm.verts
-        )
-
-        # Restores the parent relationship
-        if parent and not obj.parent:
-            obj.parent = parent
-            obj.matrix_basis = old_mat
+    # Applies the object scale and rotation if enabled, taken from the
+    # world matrix like for other exports (any rotation mode and parents)
+    if scene.apply_scale or scene.apply_rotation:
+        matrix = export_matrix(obj, transform=False)
+        if not (scene.apply_scale and scene.apply_rotation):
+            _, rotation, scale = matrix.decompose()
+            if scene.apply_scale:
+                matrix = Matrix.Diagonal(scale).to_4x4()
+            else:
+                matrix = rotation.to_matrix().to_4x4()
+        bm.transform(matrix)
+        bm.normal_update()
 
     if scene.triangulate_ngons:
         num_ngons = triangulate_ngons(bm)
         if scene.triangulate_ngons > 0:
             print("Triangulated {} n-gons".format(num_ngons))
 
-    # Gets layers
-    uv_layer = bm.loops.layers.uv.get("UVMap")
-    tex_layer = bm.loops.layers.uv.get("UVMap")
-    vc_layer = (bm.loops.layers.color.get("Col") or 
-                bm.loops.layers.color.new("Col"))
-    env_layer = (bm.loops.layers.color.get("Env") or
-                 bm.loops.layers.color.new("Env"))
-    env_alpha_layer = (bm.faces.layers.float.get("EnvAlpha") or
-                       bm.faces.layers.float.new("EnvAlpha"))
-    va_layer = (bm.loops.layers.color.get("Alpha") or
-                bm.loops.layers.color.new("Alpha"))
-    texnum_layer = bm.faces.layers.int.get("Texture Number")
-    type_layer = (bm.faces.layers.int.get("Type") or
-                  bm.faces.layers.int.new("Type"))
+    data = read_bmesh(bm, me, obj)
+    bm.free()
+    return data
 
-    # Creates an empty PRM or Mesh structure
-    if world is None:
-        prm = rvstruct.PRM()
-    else:
-        prm = rvstruct.Mesh()
 
-    prm.polygon_count = len(bm.faces)
-    if prm.polygon_count > 65535:
+def extract_world_mesh(me, obj, scene):
+    """
+    Reads a world mesh and transforms its positions and normals by the
+    world matrix as arrays. The mesh is only copied if it has n-gons to
+    triangulate, and the scene isn't modified.
+    """
+    tmp = triangulated_copy(me, scene.triangulate_ngons)
+    try:
+        data = read_mesh(tmp or me)
+    finally:
+        if tmp:
+            bpy.data.meshes.remove(tmp)
+
+    add_mesh_extras(data, me, obj)
+    transform_data(data, export_matrix(obj))
+    return data
+
+
+def transform_data(data, matrix):
+    """ Transforms the positions and normals read by extract_mesh """
+    data["co"] = transform_points(matrix, data["co"])
+    data["normals"] = transform_normals(matrix, data["normals"])
+
+
+def read_bmesh(bm, me, obj):
+    """
+    Reads the arrays of extract_mesh from a bmesh that is already
+    transformed and triangulated. me is the original mesh of the object.
+    """
+    # Reads the transformed mesh and its layers as arrays
+    tmp = bpy.data.meshes.new("{}_export".format(me.name))
+    bm.to_mesh(tmp)
+    try:
+        data = read_mesh(tmp)
+    finally:
+        bpy.data.meshes.remove(tmp)
+
+    add_mesh_extras(data, me, obj)
+    return data
+
+
+def add_mesh_extras(data, me, obj):
+    """ Adds the vertex normals, textures and name of the object """
+    # The normals of the original mesh are written, as before
+    normals = np.empty((len(me.vertices), 3), dtype=np.float32)
+    me.vertices.foreach_get("normal", normals.ravel())
+    if len(normals) != len(data["co"]):
+        normals = np.zeros((len(data["co"]), 3), dtype=np.float32)
+    data["normals"] = normals
+
+    data["slot_textures"] = get_slot_textures(obj)
+    data["name"] = obj.name
+
+
+def check_mesh_limits(data):
+    """ Checks that the mesh fits into a PRM or .w mesh """
+    if len(data["loop_start"]) > 65535:
         queue_error(
             "exporting mesh",
             "Too many polygons, try splitting up your mesh."
         )
-        return None
+        return False
 
-    prm.vertex_count = len(bm.verts)
-    if prm.vertex_count > 65535:
+    if len(data["co"]) > 65535:
         queue_error(
             "exporting mesh",
             "Too many vertices, try splitting up your mesh."
         )
-        return None
+        return False
+    return True
 
-    for face in bm.faces:
-        poly = rvstruct.Polygon()
-        is_quad = len(face.verts) == 4
-
-        poly.type = face[type_layer] & FACE_PROP_MASK
-
-        # Sets the quad flag on the polygon
-        if is_quad:
-            poly.type |= FACE_QUAD
-
-        # Gets the texture number from the integer layer if setting enabled
-        # use_tex_num is the only way to achieve no texture
-        if bpy.context.scene.use_tex_num and texnum_layer:
-            poly.texture = face[texnum_layer]
-        # Falls back to texture if not enabled or texnum layer not found
-        image = get_texture_from_material(face, obj)
-        if image:
-            poly.texture = texture_to_int(image.name)
-        else:
-            poly.texture = -1
-
-        # Sets vertex indices for the polygon
-        vert_order = [2, 1, 0, 3] if not is_quad else [3, 2, 1, 0]
-        for i in vert_order:
-            if i < len(face.verts):
-                poly.vertex_indices.append(face.verts[i].index)
-            else:
-                # Fills up unused indices with 0s
-                poly.vertex_indices.append(0)
-
-        # write the vertex colors
-        for i in vert_order:
-            if i < len(face.verts):
-                # Gets color from the channel or falls back to a default value
-                white = Color((1, 1, 1))
-                color = face.loops[i][vc_layer] if vc_layer else white
-                alpha = face.loops[i][va_layer] if va_layer else white
-                col = rvstruct.Color(color=(int(color[0] * 255),
-                                            int(color[1] * 255),
-                                            int(color[2] * 255)),
-                                     alpha=255-int(((alpha[0] + alpha[1] + alpha[2]) * 255)  / 3))
-                poly.colors.append(col)
-            else:
-                # Writes white
-                col = rvstruct.Color(color=(255, 255, 255), alpha=255)
-                poly.colors.append(col)
-
-        # Writes the UV
-        for i in vert_order:
-            if i < len(face.verts) and uv_layer:
-                uv = face.loops[i][uv_layer].uv
-                poly.uv.append(rvstruct.UV(uv=(uv[0], 1 - uv[1])))
-            else:
-                poly.uv.append(rvstruct.UV())
 
-        if world is not None:
-            if (poly.type & FACE_ENV):
-                rgb = [int(c * 255) for c in get_average_vcol2([face], env_layer)]
-                alpha = int(face[env_alpha_layer] * 255)
-                col = rvstruct.Color(color=rgb, alpha=alpha)
-                world.env_list.append(col)
+def encode_mesh(data, world=False, report=False):
+    """
+    Builds the PRM (or Mesh if world is True) from the arrays of
+    extract_mesh. Returns the mesh and the env colors of its env faces.
+    Doesn't use bpy, so meshes can be encoded in worker threads.
+    """
+    # Creates an empty PRM or Mesh structure
+    if not world:
+        prm = rvstruct.PRM()
+    else:
+        prm = rvstruct.Mesh()
 
-        prm.polygons.append(poly)
+    prm.polygon_count = len(data["loop_start"])
+    prm.vertex_count = len(data["co"])
+    env_list = []
+
+    sizes = data["loop_total"]
+    is_quad = sizes == 4
+
+    # Corners are written as 2 1 0 3 (quads: 3 2 1 0). Corners that the
+    # face doesn't have are filled with defaults.
+    vert_order = np.where(is_quad[:, None], (3, 2, 1, 0), (2, 1, 0, 3))
+    used = vert_order < sizes[:, None]
+    loops = np.where(used, data["loop_start"][:, None] + vert_order, 0)
+
+    polygons = np.zeros(prm.polygon_count, dtype=rvstruct.POLYGON_DTYPE)
+
+    types = data["Type"] & FACE_PROP_MASK
+    types[is_quad] |= FACE_QUAD
+    polygons["type"] = types
+
+    # Only the material texture is used, even with use_tex_num.
+    # Faces of missing slots don't get a texture.
+    slot_textures = np.array(data["slot_textures"] + [-1], dtype=np.int64)
+    slots = data["material_index"]
+    slots = np.where((slots >= 0) & (slots < len(slot_textures) - 1), slots, -1)
+    polygons["texture"] = slot_textures[slots]
+
+    # Unused indices are 0
+    indices = np.where(used, data["loop_verts"][loops], 0)
+    polygons["vertex_indices"] = indices
+
+    # Colors are stored as BGRA, with the averaged alpha layer inverted.
+    # Unused corners are white and opaque.
+    colors = data["Col"][loops].astype(np.float64)
+    alpha = data["Alpha"][loops].astype(np.float64)
+    bgra = np.empty(colors.shape, dtype=np.float64)
+    bgra[..., :3] = np.floor(colors[..., 2::-1] * 255)
+    bgra[..., 3] = np.floor(
+        ((alpha[..., 0] + alpha[..., 1] + alpha[..., 2]) * 255) / 3)
+    bgra[~used] = (255, 255, 255, 0)
+    polygons["colors"] = bgra
+
+    uvs = data["uv"][loops].astype(np.float64)
+    if data.get("has_uv", True):
+        uvs[..., 1] = 1 - uvs[..., 1]
+    uvs[~used] = 0
+    polygons["uv"] = uvs
+
+    if world:
+        # Collects the average env color of each env face
+        env = np.flatnonzero(types & FACE_ENV)
+        env_sizes = sizes[env]
+        env_starts = data["loop_start"][env]
+        env_colors = data["Env"].astype(np.float64)
+        rgb = np.zeros((len(env), 3))
+        for i in range(int(env_sizes.max()) if len(env) else 0):
+            rgb += np.where((i < env_sizes)[:, None],
+                            env_colors[np.minimum(env_starts + i, len(env_colors) - 1), :3],
+                            0)
+        rgb = np.floor(rgb / env_sizes[:, None] * 255).astype(np.int64)
+        env_alpha = np.floor(data["EnvAlpha"][env].astype(np.float64) * 255)
+        for color, alpha in zip(rgb.tolist(), env_alpha.astype(np.int64).tolist()):
+            env_list.append(rvstruct.Color(color=color, alpha=alpha))
 
     # export vertex positions and normals
-    for vertex in bm.verts:
-        coord = to_revolt_coord(vertex.co)
-        normal = to_revolt_axis(vertex.normal)
-        rvvert = rvstruct.Vertex()
-        rvvert.position = rvstruct.Vector(data=coord)
-        rvvert.normal = rvstruct.Vector(data=normal)
-        prm.vertices.append(rvvert)
+    co = data["co"].astype(np.float64)
+    coords = np.stack((co[:, 0] / SCALE, -co[:, 2] / SCALE, co[:, 1] / SCALE),
+                      axis=1)
+
+    vertices = np.zeros(prm.vertex_count, dtype=rvstruct.VERTEX_DTYPE)
+    vertices["position"] = coords
+    vertices["normal"] = data["normals"][:, (0, 2, 1)] * (1, -1, 1)
+
+    prm.arrays = rvstruct.MeshArrays(polygons, vertices)
+    prm.polygons = None
+    prm.vertices = None
+
+    # Indices above 16 bit only fit in Polygon objects (meshes to be split)
+    if prm.vertex_count > 65535:
+        prm.polygons = prm.arrays.to_polygons()
+        for poly, quad in zip(prm.polygons, indices.tolist()):
+            poly.vertex_indices = quad
 
     # World extras
-    if world is not None:
-        rvbbox = rvbbox_from_bm(bm)
-        center = center_from_rvbbox(rvbbox)
-        radius = radius_from_bmesh(bm, center)
+    if world:
+        rvbbox = (co[:, 0].min() / SCALE, co[:, 0].max() / SCALE,
+                  -co[:, 2].max() / SCALE, -co[:, 2].min() / SCALE,
+                  co[:, 1].min() / SCALE, co[:, 1].max() / SCALE)
+        center, radius = bounding_sphere(coords)
         prm.bound_ball_center = rvstruct.Vector(data=center)
         prm.bound_ball_radius = radius
         prm.bbox = rvstruct.BoundingBox(data=rvbbox)
 
-    bm.free()
-    return prm
+        # Compares with the sphere around the bbox center used before
+        if report and len(coords):
+            old_center = center_from_rvbbox(rvbbox)
+            old_radius = max(get_distance(old_center, c) for c in coords.tolist())
+            print("Bound ball of {}: radius {:.1f} -> {:.1f} "
+                  "({:.1%} volume saved)".format(
+                      data["name"], old_radius, radius,
+                      sphere_volume_saved(old_radius, radius)))
+
+    return prm, env_list
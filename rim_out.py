@@ -23,9 +23,17 @@ if "common" in locals():
 # Example: from .common import specific_function, SpecificClass
 
 def export_file(filepath, scene):
-
     objs = [obj for obj in scene.objects if obj.is_mirror_plane]
+    rim = build_rim(objs)
+
+    print("Mirror planes:", rim.num_mirror_planes)
+
+    with open(filepath, "wb") as f:
+        rim.write(f)
+
 
+def build_rim(objs):
+    """ Creates the mirror planes of the given objects """
     rim = rvstruct.RIM()
 
     for obj in objs:
@@ -58,12 +66,4 @@ def export_file(filepath, scene):
             rim.mirror_planes.append(mirror_plane)
             rim.num_mirror_planes += 1
 
-    print("Mirror planes:", rim.num_mirror_planes)
-
-    f = open(filepath, "wb")
-
-    rim.write(f)
-
-    f.close()
-
-    
\ No newline at end of file
+    return rim
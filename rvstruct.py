@@ -27,33 +27,120 @@ Missing Formats:
 - .tri (Triggers)
 """
 
+import io
 import os
 import json
-import bmesh
+import mmap
 import struct
 from math import ceil, sqrt
+from bisect import bisect_left, bisect_right
+
+# This module only depends on the standard library (and the bpy-free geometry
+# module) so it can be used outside of Blender. NumPy is optional and used for
+# bulk decoding when available.
+try:
+    from .geometry import bounding_sphere
+except ImportError:
+    # Imported on its own, next to geometry.py
+    from geometry import bounding_sphere
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+POLYGON_SIZE = 60   # bytes of a polygon record
+VERTEX_SIZE = 24    # bytes of a vertex record
+POLYHEDRON_SIZE = 112   # bytes of a collision polyhedron record
+
+
+if np is not None:
+    # Fixed-size records of PRM and .w meshes, used for decoding them in bulk
+    POLYGON_DTYPE = np.dtype([
+        ("type", "<i2"),                # rvshort, bitfield
+        ("texture", "<i2"),             # rvshort
+        ("vertex_indices", "<u2", 4),   # 4 unsigned rvshorts
+        ("colors", "u1", (4, 4)),       # 4 BGRA colors, alpha is inverted
+        ("uv", "<f4", (4, 2)),          # 4 UV structures
+    ])
+    VERTEX_DTYPE = np.dtype([
+        ("position", "<f4", 3),         # Vector
+        ("normal", "<f4", 3),           # Vector (normalized, length 1)
+    ])
+    # Collision polyhedra of .ncp files, used for encoding them in bulk
+    POLYHEDRON_DTYPE = np.dtype([
+        ("type", "<u4"),                # rvulong, bitfield
+        ("material", "<u4"),            # rvulong
+        ("planes", "<f4", (5, 4)),      # face plane and 4 cutting planes
+        ("bbox", "<f4", 6),             # xlo, xhi, ylo, yhi, zlo, zhi
+    ])
+
+# Bound ball center and radius, bbox, polygon and vertex count of .w meshes
+MESH_HEADER = struct.Struct("<3ff6fHH")
+
+# Precompiled structs for writing
+RVSHORT = struct.Struct("<h")
+RVUSHORT = struct.Struct("<H")
+RVLONG = struct.Struct("<l")
+RVULONG = struct.Struct("<L")
+RVFLOAT = struct.Struct("<f")
+COUNTS = struct.Struct("<HH")
+VECTOR = struct.Struct("<3f")
+BBOX = struct.Struct("<6f")
+UV_STRUCT = struct.Struct("<2f")
+VERTEX = struct.Struct("<6f")
+# Polygon with 4 colors and UVs. Vertex indices are unsigned like in the
+# readers: meshes may have up to 65535 vertices.
+POLYGON = struct.Struct("<hh4H16B8f")
+PLANE = struct.Struct("<4f")
+EDGE = struct.Struct("<hh")
+POLYHEDRON_HEADER = struct.Struct("<LL")
+LOOKUP_GRID_HEADER = struct.Struct("<5f")
+HULL_COUNTS = struct.Struct("<3h")
+
+# Polyhedra closer than this to a lookup grid cell are listed in it as well
+LOOKUP_GRID_MARGIN = 150
+
+# Candidate cell sizes for automatic lookup grid tuning
+LOOKUP_GRID_SIZES = (512, 768, 1024, 1536, 2048, 3072, 4096, 6144, 8192)
+
+# Upper bounds of the list length buckets in lookup grid reports
+LOOKUP_HISTOGRAM_BINS = (0, 4, 16, 64, 256)
+
+
+class Packable:
+    """
+    Base for structures that are written with a single file.write().
+    Subclasses report their size with encoded_size() and fill a preallocated
+    buffer with pack_into(), which returns the offset after the structure.
+    """
+    __slots__ = ()
+
+    def encoded_size(self):
+        raise NotImplementedError
 
-from bpy.props import (
-    BoolProperty,
-    BoolVectorProperty,
-    EnumProperty,
-    FloatProperty,
-    IntProperty,
-    StringProperty,
-    IntVectorProperty,
-    FloatVectorProperty,
-    PointerProperty
-)
+    def pack_into(self, buffer, offset):
+        raise NotImplementedError
+
+    def to_bytes(self):
+        buffer = bytearray(self.encoded_size())
+        self.pack_into(buffer, 0)
+        return buffer
+
+    def write(self, file):
+        file.write(self.to_bytes())
 
 
-class World:
+class World(Packable):
     """
     Reads a .w file and stores all sub-structures
     All contained objects are of a similar structure.
     Usage: Objects of this class can be created to read and store .w files.
     If an opened file is supplied, it immediately starts reading from it.
+    With lazy=True, the file is memory-mapped and meshes are only decoded
+    when they are accessed (see LazyMeshes).
     """
-    def __init__(self, file=None):
+    def __init__(self, file=None, bulk=False, lazy=False):
         self.mesh_count = 0             # rvlong, amount of Mesh objects
         self.meshes = []                # sequence of Mesh structures
 
@@ -68,17 +155,22 @@ class World:
 
         # Immediately starts reading if an opened file is supplied
         if file:
-            self.read(file)
+            self.read(file, bulk, lazy)
 
-    def read(self, file):
+    def read(self, file, bulk=False, lazy=False):
 
         # Reads the mesh count (num_cubes in RVGL)
         self.mesh_count = struct.unpack("<l", file.read(4))[0]
 
-        # Reads the meshes. Gives the meshes a reference to itself so env_count
-        # can be set by the Polygon objects
-        for mesh in range(self.mesh_count):
-            self.meshes.append(Mesh(file, self))
+        # Only indexes the meshes, geometry is decoded on access
+        if lazy:
+            self.meshes = LazyMeshes(file, self.mesh_count, self)
+            self.env_count = sum(h.env_count for h in self.meshes.headers)
+        else:
+            # Reads the meshes. Gives the meshes a reference to itself so
+            # env_count can be set by the Polygon objects
+            for mesh in range(self.mesh_count):
+                self.meshes.append(Mesh(file, self, bulk))
 
         # Reads the amount of bigcubes
         self.bigcube_count = struct.unpack("<l", file.read(4))[0]
@@ -98,57 +190,219 @@ class World:
         for col in range(self.env_count):
             self.env_list.append(Color(file=file, alpha=True))
 
-    def write(self, file):
+    def encoded_size(self):
+        return (4 + sum(mesh.encoded_size() for mesh in self.meshes) +
+                self.tail_size())
+
+    def tail_size(self):
+        """ Size of everything after the meshes """
+        return (8 + sum(bcube.encoded_size() for bcube in self.bigcubes) +
+                sum(anim.encoded_size() for anim in self.animations) +
+                sum(col.encoded_size() for col in self.env_list))
+
+    def pack_into(self, buffer, offset):
         # Writes the mesh count
-        file.write(struct.pack("<l", self.mesh_count))
+        RVLONG.pack_into(buffer, offset, self.mesh_count)
+        offset += 4
 
-        # Writes all meshes, gives reference to self for env count
+        # Writes all meshes
         for mesh in self.meshes:
-            mesh.write(file)
+            offset = mesh.pack_into(buffer, offset)
 
+        return self.pack_tail_into(buffer, offset)
+
+    def pack_tail_into(self, buffer, offset):
+        """ Writes the BigCubes, texture animations and env colors """
         # Writes the count of BigCubes
-        file.write(struct.pack("<l", self.bigcube_count))
+        RVLONG.pack_into(buffer, offset, self.bigcube_count)
+        offset += 4
 
         # Writes all BigCubes
         for bcube in self.bigcubes:
-            bcube.write(file)
+            offset = bcube.pack_into(buffer, offset)
 
         # Writes the count of texture animations
-        file.write(struct.pack("<l", self.animation_count))
+        RVLONG.pack_into(buffer, offset, self.animation_count)
+        offset += 4
 
         # Writes all texture animations
         for anim in self.animations:
-            anim.write(file)
+            offset = anim.pack_into(buffer, offset)
 
-        # self.env_list.write(file)
+        # Writes the environment colors
         for col in self.env_list:
-            col.write(file)
-
-    def generate_bigcubes(self):
-        bb = BoundingBox()
+            offset = col.pack_into(buffer, offset)
+
+        return offset
+
+    def generate_bigcubes(self, max_meshes=0):
+        """
+        Generates the BigCubes used for culling meshes in game.
+        With max_meshes, the meshes are split up spatially until each cube
+        holds at most that many. Otherwise, one cube contains all meshes.
+        """
+        if not max_meshes:
+            max_meshes = max(1, len(self.meshes))
+        self.partition_bigcubes(max_meshes)
+
+    def partition_meshes(self, max_polygons):
+        """
+        Merges the polygons of all meshes and splits them up into spatial
+        cells (k-d tree over the polygon centers) of at most max_polygons
+        polygons and 65535 vertices. Every cell becomes a mesh with its own
+        vertices, bbox and bound ball. Environment colors are reordered to
+        follow the new polygon order. Requires NumPy.
+        """
+        if np is None:
+            raise ImportError("Partitioning meshes requires NumPy")
+        max_polygons = max(1, min(max_polygons, 65535))
+
+        # Gathers the polygons and vertices of all meshes
+        columns = []
+        offset = 0
         for mesh in self.meshes:
-            for v in mesh.vertices:
-                bb.xlo = v.position.x if v.position.x < bb.xlo else bb.xlo
-                bb.xhi = v.position.x if v.position.x > bb.xhi else bb.xhi
-                bb.ylo = v.position.y if v.position.y < bb.ylo else bb.ylo
-                bb.yhi = v.position.y if v.position.y > bb.yhi else bb.yhi
-                bb.zlo = v.position.z if v.position.z < bb.zlo else bb.zlo
-                bb.zhi = v.position.z if v.position.z > bb.zhi else bb.zhi
-
-        bcube = BigCube()
-        bcube.center = Vector(data=(
-            (bb.xlo + bb.xhi) / 2,
-            (bb.ylo + bb.yhi) / 2,
-            (bb.zlo + bb.zhi) / 2)
-        )
-        max_vert = Vector(data=(bb.xhi, bb.yhi, bb.zhi))
-        bcube.size = bcube.center.get_distance_to(max_vert)
-
-        bcube.mesh_count = len(self.meshes)
-        bcube.mesh_indices = [n for n in range(0, bcube.mesh_count)]
-
-        self.bigcube_count = 1
-        self.bigcubes = [bcube]
+            cols = mesh.columns()
+            cols["indices"] = cols["indices"] + offset
+            offset += len(cols["positions"])
+            columns.append(cols)
+        if not columns:
+            return
+        cols = {key: np.concatenate([c[key] for c in columns])
+                for key in columns[0]}
+        if not len(cols["types"]):
+            return
+
+        types = cols["types"]
+        indices = cols["indices"]
+        positions = cols["positions"]
+
+        # Triangles only use the first three indices
+        used = np.ones(indices.shape, dtype=bool)
+        used[(types & 1) == 0, 3] = False
+        centers = ((positions[indices] * used[:, :, None]).sum(axis=1) /
+                   used.sum(axis=1)[:, None])
+
+        is_env = (types & 2048) != 0
+        env_index = np.cumsum(is_env) - 1
+        if len(self.env_list) != int(is_env.sum()):
+            print("RVSTRUCT ERROR: Environment colors do not match.")
+            return
+
+        meshes = []
+        env_list = []
+        stack = [np.arange(len(types))]
+        while stack:
+            cell = stack.pop()
+            cell_used = used[cell]
+            verts, inverse = np.unique(indices[cell][cell_used],
+                                       return_inverse=True)
+
+            # Halves the cell along its longest axis if it is too large
+            if len(cell) > 1 and (len(cell) > max_polygons or
+                                  len(verts) > 65535):
+                points = centers[cell]
+                axis = int(np.argmax(np.ptp(points, axis=0)))
+                order = cell[np.argsort(points[:, axis], kind="stable")]
+                half = len(order) // 2
+                stack.append(np.sort(order[half:]))
+                stack.append(np.sort(order[:half]))
+                continue
+
+            cell_indices = np.zeros((len(cell), 4), dtype=np.uint16)
+            cell_indices[cell_used] = inverse
+
+            polygons = np.zeros(len(cell), dtype=POLYGON_DTYPE)
+            polygons["type"] = types[cell]
+            polygons["texture"] = cols["textures"][cell]
+            polygons["vertex_indices"] = cell_indices
+            polygons["colors"] = cols["colors"][cell]
+            polygons["uv"] = cols["uvs"][cell]
+
+            vertices = np.zeros(len(verts), dtype=VERTEX_DTYPE)
+            vertices["position"] = positions[verts]
+            vertices["normal"] = cols["normals"][verts]
+
+            mesh = Mesh(w=self)
+            mesh.from_arrays(MeshArrays(polygons, vertices))
+            meshes.append(mesh)
+
+            env_list.extend(self.env_list[i]
+                            for i in env_index[cell][is_env[cell]].tolist())
+
+        self.meshes = meshes
+        self.mesh_count = len(meshes)
+        self.env_list = env_list
+
+    def mesh_bounds(self):
+        """ Returns the bound ball centers and radii of all meshes """
+        if isinstance(self.meshes, LazyMeshes):
+            meshes = self.meshes.headers
+        else:
+            meshes = self.meshes
+        centers = [mesh.bound_ball_center.data for mesh in meshes]
+        radii = [mesh.bound_ball_radius for mesh in meshes]
+        return centers, radii
+
+    def partition_bigcubes(self, max_meshes):
+        """
+        Splits the meshes into BigCubes with a k-d tree over the centers of
+        their bound balls. Groups are halved along their longest axis until
+        they contain at most max_meshes meshes. Each cube is the smallest
+        sphere found around the bound balls of its meshes.
+        """
+        centers, radii = self.mesh_bounds()
+        if np is not None:
+            groups = self._partition_np(centers, radii, max_meshes)
+        else:
+            groups = self._partition(centers, radii, max_meshes)
+
+        self.bigcubes = []
+        for indices, center, size in groups:
+            bcube = BigCube()
+            bcube.center = Vector(data=center)
+            bcube.size = size
+            bcube.mesh_indices = indices
+            bcube.mesh_count = len(indices)
+            self.bigcubes.append(bcube)
+        self.bigcube_count = len(self.bigcubes)
+
+    def _partition_np(self, centers, radii, max_meshes):
+        centers = np.array(centers, dtype=np.float64).reshape(-1, 3)
+        radii = np.array(radii, dtype=np.float64)
+        groups = []
+        stack = [np.arange(len(radii))]
+        while stack:
+            indices = stack.pop()
+            points = centers[indices]
+            if len(indices) > max_meshes:
+                axis = int(np.argmax(np.ptp(points, axis=0)))
+                order = indices[np.argsort(points[:, axis], kind="stable")]
+                half = len(order) // 2
+                stack.append(order[half:])
+                stack.append(order[:half])
+                continue
+            center, size = bounding_sphere(points, radii[indices])
+            groups.append((sorted(indices.tolist()), center, size))
+        return groups
+
+    def _partition(self, centers, radii, max_meshes):
+        groups = []
+        stack = [list(range(len(radii)))]
+        while stack:
+            indices = stack.pop()
+            if len(indices) > max_meshes:
+                axis = max(range(3), key=lambda a: (
+                    max(centers[i][a] for i in indices) -
+                    min(centers[i][a] for i in indices)))
+                order = sorted(indices, key=lambda i: centers[i][axis])
+                half = len(order) // 2
+                stack.append(order[half:])
+                stack.append(order[:half])
+                continue
+            center, size = bounding_sphere([centers[i] for i in indices],
+                                           [radii[i] for i in indices])
+            groups.append((sorted(indices), center, size))
+        return groups
 
     def __repr__(self):
         return "World"
@@ -166,42 +420,324 @@ class World:
         return dic
 
 
-class PRM:
+class MeshHeader:
+    """
+    Location, size and bounds of a mesh in a .w file.
+    Read by LazyMeshes without touching the polygons and vertices.
+    """
+    def __init__(self, buffer=None, offset=0):
+        self.offset = 0                 # byte offset of the polygon records
+        self.polygon_count = 0
+        self.vertex_count = 0
+        self.env_count = 0              # polygons with env enabled
+
+        self.bound_ball_center = Vector()
+        self.bound_ball_radius = 0
+        self.bbox = BoundingBox()
+
+        if buffer is not None:
+            self.read(buffer, offset)
+
+    def __repr__(self):
+        return "MeshHeader"
+
+    def read(self, buffer, offset):
+        data = MESH_HEADER.unpack_from(buffer, offset)
+        self.bound_ball_center = Vector(data=data[0:3])
+        self.bound_ball_radius = data[3]
+        self.bbox = BoundingBox(data=data[4:10])
+        self.polygon_count, self.vertex_count = data[10:12]
+        self.offset = offset + MESH_HEADER.size
+
+        # Counts the env bits through a strided view of the type column
+        if np is not None:
+            types = np.ndarray((self.polygon_count,), dtype="<i2",
+                               buffer=buffer, offset=self.offset,
+                               strides=(POLYGON_SIZE,))
+            self.env_count = int(np.count_nonzero(types & 2048))
+            del types
+        else:
+            self.env_count = sum(
+                1 for p in range(self.polygon_count)
+                if RVSHORT.unpack_from(
+                    buffer, self.offset + p * POLYGON_SIZE)[0] & 2048
+            )
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """ Header of a Mesh that is about to be written """
+        header = cls()
+        header.polygon_count = mesh.polygon_count
+        header.vertex_count = mesh.vertex_count
+        header.bound_ball_center = mesh.bound_ball_center
+        header.bound_ball_radius = mesh.bound_ball_radius
+        header.bbox = mesh.bbox
+        if mesh._polygons is None:
+            header.env_count = mesh.arrays.env_count
+        else:
+            header.env_count = sum(
+                1 for poly in mesh._polygons if poly.type & 2048)
+        return header
+
+    @property
+    def size(self):
+        """ Size of the mesh in bytes, including the header """
+        return (MESH_HEADER.size + self.polygon_count * POLYGON_SIZE +
+                self.vertex_count * VERTEX_SIZE)
+
+
+class WorldWriter:
+    """
+    Writes a .w file while its meshes are still being exported.
+    Meshes are written as soon as they are added. Only their headers are
+    kept, which is enough to generate the BigCubes. The mesh count at the
+    start of the file is filled in by finish().
+    """
+    def __init__(self, file):
+        self.file = file
+        self.world = World()            # BigCubes, animations and env colors
+        self.start = file.tell()
+        file.write(RVLONG.pack(0))
+
+    def __repr__(self):
+        return "WorldWriter"
+
+    def add_mesh(self, data, header=None, env_list=()):
+        """
+        Writes an encoded Mesh and keeps its env colors for the end.
+        The header is read from the data if none is given. Passing
+        MeshHeader.from_mesh keeps the exact bounds for the BigCubes.
+        """
+        self.file.write(data)
+        if header is None:
+            header = MeshHeader(data)
+        self.world.meshes.append(header)
+        self.world.env_list.extend(env_list)
+
+    def finish(self, max_meshes=0):
+        """ Writes the BigCubes, animations and env colors after the meshes """
+        world = self.world
+        world.mesh_count = len(world.meshes)
+        world.generate_bigcubes(max_meshes)
+
+        buffer = bytearray(world.tail_size())
+        world.pack_tail_into(buffer, 0)
+        self.file.write(buffer)
+
+        end = self.file.tell()
+        self.file.seek(self.start)
+        self.file.write(RVLONG.pack(world.mesh_count))
+        self.file.seek(end)
+
+
+class LazyMeshes:
+    """
+    Sequence of the meshes of a memory-mapped .w file.
+    The file is scanned once for the mesh headers. A Mesh is decoded each
+    time it is accessed and not kept, so iterating only holds one at a time.
+    """
+    def __init__(self, file, mesh_count, w=None):
+        self.w = w
+        self.headers = []               # MeshHeader for each mesh
+
+        self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        offset = file.tell()
+        for mesh in range(mesh_count):
+            header = MeshHeader(self.buffer, offset)
+            self.headers.append(header)
+            offset += header.size
+
+        # Continues reading the rest of the world after the meshes
+        file.seek(offset)
+
+    def __repr__(self):
+        return "LazyMeshes"
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __iter__(self):
+        for index in range(len(self.headers)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        header = self.headers[index]
+
+        mesh = Mesh(w=self.w)
+        mesh.bound_ball_center = header.bound_ball_center
+        mesh.bound_ball_radius = header.bound_ball_radius
+        mesh.bbox = header.bbox
+        mesh.polygon_count = header.polygon_count
+        mesh.vertex_count = header.vertex_count
+
+        # Copies the records so the mesh does not pin the memory map
+        end = header.offset + header.size - MESH_HEADER.size
+        data = self.buffer[header.offset:end]
+
+        if np is None:
+            file = io.BytesIO(data)
+            for polygon in range(header.polygon_count):
+                mesh.polygons.append(Polygon(file))
+                mesh.polygons[-1].w = self.w
+            for vertex in range(header.vertex_count):
+                mesh.vertices.append(Vertex(file))
+            return mesh
+
+        mesh.arrays = MeshArrays.from_buffer(
+            data, header.polygon_count, header.vertex_count)
+        mesh.polygons = None
+        mesh.vertices = None
+        return mesh
+
+    def close(self):
+        self.buffer.close()
+
+
+class BulkMesh(Packable):
+    """
+    Base for PRM and Mesh. If the polygons and vertices were read in bulk,
+    they are kept as MeshArrays and only turned into Polygon and Vertex
+    objects when they are accessed.
+    """
+    w = None
+
+    @property
+    def polygons(self):
+        if self._polygons is None:
+            self._polygons = self.arrays.to_polygons(self.w)
+        return self._polygons
+
+    @polygons.setter
+    def polygons(self, polygons):
+        self._polygons = polygons
+
+    @property
+    def vertices(self):
+        if self._vertices is None:
+            self._vertices = self.arrays.to_vertices()
+        return self._vertices
+
+    @vertices.setter
+    def vertices(self, vertices):
+        self._vertices = vertices
+
+    def read_arrays(self, file):
+        """ Reads all polygon and vertex records at once """
+        self.arrays = MeshArrays.read(file, self.polygon_count, self.vertex_count)
+        self._polygons = None
+        self._vertices = None
+
+    def columns(self):
+        """
+        Returns the polygon and vertex data as a dict of arrays.
+        Vertex indices are not limited to 16 bit. Requires NumPy.
+        """
+        if self._polygons is None and self._vertices is None:
+            arrays = self.arrays
+            return {"types": arrays.types.astype(np.int64),
+                    "textures": arrays.textures.copy(),
+                    "indices": arrays.vertex_indices.astype(np.int64),
+                    "colors": arrays.colors.copy(),
+                    "uvs": arrays.uvs.copy(),
+                    "positions": arrays.positions.copy(),
+                    "normals": arrays.normals.copy()}
+
+        polygons = self.polygons
+        vertices = self.vertices
+        return {
+            "types": np.array([p.type for p in polygons],
+                              dtype=np.int64),
+            "textures": np.array([p.texture for p in polygons],
+                                 dtype=np.int16),
+            "indices": np.array([list(p.vertex_indices) for p in polygons],
+                                dtype=np.int64).reshape(-1, 4),
+            "colors": np.array(
+                [[(c.color[2], c.color[1], c.color[0], 255 - c.alpha)
+                  for c in p.colors] for p in polygons],
+                dtype=np.uint8).reshape(-1, 4, 4),
+            "uvs": np.array([[(uv.u, uv.v) for uv in p.uv]
+                             for p in polygons],
+                            dtype=np.float32).reshape(-1, 4, 2),
+            "positions": np.array([v.position.data for v in vertices],
+                                  dtype=np.float32).reshape(-1, 3),
+            "normals": np.array([v.normal.data for v in vertices],
+                                dtype=np.float32).reshape(-1, 3)
+        }
+
+    def records_size(self):
+        """ Size of the polygon and vertex records in bytes """
+        if self._polygons is None:
+            size = self.arrays.polygons.nbytes
+        else:
+            size = sum(poly.encoded_size() for poly in self._polygons)
+        if self._vertices is None:
+            size += self.arrays.vertices.nbytes
+        else:
+            size += len(self._vertices) * VERTEX.size
+        return size
+
+    def pack_records(self, buffer, offset):
+        """ Writes the polygons and vertices, untouched arrays are copied """
+        if self._polygons is None:
+            data = self.arrays.polygons.tobytes()
+            buffer[offset:offset + len(data)] = data
+            offset += len(data)
+        else:
+            for polygon in self._polygons:
+                offset = polygon.pack_into(buffer, offset)
+        if self._vertices is None:
+            data = self.arrays.vertices.tobytes()
+            buffer[offset:offset + len(data)] = data
+            offset += len(data)
+        else:
+            for vertex in self._vertices:
+                offset = vertex.pack_into(buffer, offset)
+        return offset
+
+
+class PRM(BulkMesh):
     """
     Similar to Mesh, reads, stores and writes PRM files
     """
-    def __init__(self, file=None):
+    def __init__(self, file=None, bulk=False):
         self.polygon_count = 0
         self.vertex_count = 0
 
         self.polygons = []
         self.vertices = []
 
+        self.arrays = None      # MeshArrays, only set when read in bulk
+
         if file:
-            self.read(file)
+            self.read(file, bulk)
 
     def __repr__(self):
         return "PRM"
 
-    def read(self, file):
+    def read(self, file, bulk=False):
         self.polygon_count = struct.unpack("<H", file.read(2))[0]
         self.vertex_count = struct.unpack("<H", file.read(2))[0]
 
+        if bulk and np is not None:
+            self.read_arrays(file)
+            return
+
         for polygon in range(self.polygon_count):
             self.polygons.append(Polygon(file))
 
         for vertex in range(self.vertex_count):
             self.vertices.append(Vertex(file))
 
-    def write(self, file):
-        # Writes amount of polygons/vertices and the structures themselves
-        file.write(struct.pack("<H", self.polygon_count))
-        file.write(struct.pack("<H", self.vertex_count))
+    def encoded_size(self):
+        return COUNTS.size + self.records_size()
 
-        for polygon in self.polygons:
-            polygon.write(file)
-        for vertex in self.vertices:
-            vertex.write(file)
+    def pack_into(self, buffer, offset):
+        # Writes amount of polygons/vertices and the structures themselves
+        COUNTS.pack_into(buffer, offset, self.polygon_count, self.vertex_count)
+        return self.pack_records(buffer, offset + COUNTS.size)
 
     def as_dict(self):
         dic = { "polygon_count": self.polygon_count,
@@ -212,13 +748,13 @@ class PRM:
         return dic
 
 
-class Mesh:
+class Mesh(BulkMesh):
     """
     Reads the Meshes found in .w files from an opened file
     These are different from PRM meshes since they also contain
     bounding boxes.
     """
-    def __init__(self, file=None, w=None):
+    def __init__(self, file=None, w=None, bulk=False):
         self.w = w                      # World it belongs to
 
         self.bound_ball_center = None   # Vector
@@ -232,8 +768,10 @@ class Mesh:
         self.polygons = []              # Sequence of Polygon objects
         self.vertices = []              # Sequence of Vertex objects
 
+        self.arrays = None              # MeshArrays, only set when read in bulk
+
         if file:
-            self.read(file)
+            self.read(file, bulk)
 
     def __repr__(self):
         return "Mesh"
@@ -244,7 +782,26 @@ class Mesh:
         self.polygons = prm.polygons
         self.vertices = prm.vertices
 
-    def read(self, file):
+    def from_arrays(self, arrays):
+        """ Uses the given MeshArrays and computes the bounds from them """
+        self.arrays = arrays
+        self.polygons = None
+        self.vertices = None
+        self.polygon_count = len(arrays.polygons)
+        self.vertex_count = len(arrays.vertices)
+
+        positions = arrays.positions.astype(np.float64)
+        if not len(positions):
+            return
+        lo = positions.min(axis=0)
+        hi = positions.max(axis=0)
+        self.bbox = BoundingBox(data=(lo[0], hi[0], lo[1], hi[1],
+                                      lo[2], hi[2]))
+        center, radius = bounding_sphere(positions)
+        self.bound_ball_center = Vector(data=center)
+        self.bound_ball_radius = radius
+
+    def read(self, file, bulk=False):
         # Reads bounding "ball" center and the radius
         self.bound_ball_center = Vector(file)
         self.bound_ball_radius = struct.unpack("<f", file.read(4))[0]
@@ -254,6 +811,12 @@ class Mesh:
         self.polygon_count = struct.unpack("<H", file.read(2))[0]
         self.vertex_count = struct.unpack("<H", file.read(2))[0]
 
+        if bulk and np is not None:
+            self.read_arrays(file)
+            if self.w:
+                self.w.env_count += self.arrays.env_count
+            return
+
         # Also give the polygon a reference to w so it can report if env is on
         for polygon in range(self.polygon_count):
             self.polygons.append(Polygon(file, self.w))
@@ -261,20 +824,18 @@ class Mesh:
         for vertex in range(self.vertex_count):
             self.vertices.append(Vertex(file))
 
-    def write(self, file):
-        # Writes bounding "ball" center and the radius and then the bounding box
-        self.bound_ball_center.write(file)
-        file.write(struct.pack("<f", self.bound_ball_radius))
-        self.bbox.write(file)
-
-        file.write(struct.pack("<H", self.polygon_count))
-        file.write(struct.pack("<H", self.vertex_count))
+    def encoded_size(self):
+        return MESH_HEADER.size + self.records_size()
 
-        # Also give the polygon a reference to w so it can write the env bit
-        for polygon in self.polygons:
-            polygon.write(file)
-        for vertex in self.vertices:
-            vertex.write(file)
+    def pack_into(self, buffer, offset):
+        # Writes bounding "ball" center and the radius and then the bounding box
+        bbox = self.bbox
+        MESH_HEADER.pack_into(
+            buffer, offset, *self.bound_ball_center.data,
+            self.bound_ball_radius, bbox.xlo, bbox.xhi, bbox.ylo, bbox.yhi,
+            bbox.zlo, bbox.zhi, self.polygon_count, self.vertex_count
+        )
+        return self.pack_records(buffer, offset + MESH_HEADER.size)
 
     def as_dict(self):
         dic = { "bound_ball_center": self.bound_ball_center,
@@ -288,11 +849,108 @@ class Mesh:
         return dic
 
 
-class BoundingBox:
+class MeshArrays:
+    """
+    Columnar view of the polygon and vertex records of a PRM or .w mesh.
+    All records are decoded in one pass with structured numpy arrays.
+    Only available if NumPy is installed.
+    """
+    def __init__(self, polygons=None, vertices=None):
+        if polygons is None:
+            polygons = np.zeros(0, dtype=POLYGON_DTYPE)
+        if vertices is None:
+            vertices = np.zeros(0, dtype=VERTEX_DTYPE)
+
+        self.polygons = polygons        # POLYGON_DTYPE records
+        self.vertices = vertices        # VERTEX_DTYPE records
+
+    def __repr__(self):
+        return "MeshArrays"
+
+    @classmethod
+    def read(cls, file, polygon_count, vertex_count):
+        size = polygon_count * POLYGON_SIZE + vertex_count * VERTEX_SIZE
+        return cls.from_buffer(file.read(size), polygon_count, vertex_count)
+
+    @classmethod
+    def from_buffer(cls, buffer, polygon_count, vertex_count, offset=0):
+        polygons = np.frombuffer(buffer, dtype=POLYGON_DTYPE,
+                                 count=polygon_count, offset=offset)
+        offset += polygon_count * POLYGON_SIZE
+        vertices = np.frombuffer(buffer, dtype=VERTEX_DTYPE,
+                                 count=vertex_count, offset=offset)
+        return cls(polygons, vertices)
+
+    @property
+    def types(self):
+        return self.polygons["type"]
+
+    @property
+    def textures(self):
+        return self.polygons["texture"]
+
+    @property
+    def vertex_indices(self):
+        return self.polygons["vertex_indices"]
+
+    @property
+    def colors(self):
+        """ BGRA colors as stored in the file (alpha is 255 - alpha) """
+        return self.polygons["colors"]
+
+    @property
+    def uvs(self):
+        return self.polygons["uv"]
+
+    @property
+    def positions(self):
+        return self.vertices["position"]
+
+    @property
+    def normals(self):
+        return self.vertices["normal"]
+
+    @property
+    def env_count(self):
+        """ Amount of polygons with the environment map bit (11) enabled """
+        return int(np.count_nonzero(self.types & 2048))
+
+    def to_polygons(self, w=None):
+        """ Creates the Polygon objects of the mesh """
+        polygons = []
+        columns = zip(self.types.tolist(), self.textures.tolist(),
+                      self.vertex_indices.tolist(), self.colors.tolist(),
+                      self.uvs.tolist())
+        for ptype, texture, indices, colors, uvs in columns:
+            poly = Polygon(w=w)
+            poly.type = ptype
+            poly.texture = texture
+            poly.vertex_indices = tuple(indices)
+            poly.colors = [Color(color=(c[2], c[1], c[0]), alpha=255 - c[3])
+                           for c in colors]
+            poly.uv = [UV(uv=uv) for uv in uvs]
+            polygons.append(poly)
+        return polygons
+
+    def to_vertices(self):
+        """ Creates the Vertex objects of the mesh """
+        vertices = []
+        for position, normal in zip(self.positions.tolist(),
+                                    self.normals.tolist()):
+            vert = Vertex()
+            vert.position = Vector(data=position)
+            vert.normal = Vector(data=normal)
+            vertices.append(vert)
+        return vertices
+
+
+class BoundingBox(Packable):
     """
     Reads and stores bounding boxes found in .w meshes
     They are probably used for culling optimization, similar to BigCube
     """
+    __slots__ = ("xlo", "xhi", "ylo", "yhi", "zlo", "zhi")
+
     def __init__(self, file=None, data=None):
         # Lower and higher boundaries for each axis
         if data is None:
@@ -317,10 +975,14 @@ class BoundingBox:
         self.ylo, self.yhi = struct.unpack("<ff", file.read(8))
         self.zlo, self.zhi = struct.unpack("<ff", file.read(8))
 
-    def write(self, file):
+    def encoded_size(self):
+        return BBOX.size
+
+    def pack_into(self, buffer, offset):
         # Writes all boundaries
-        file.write(struct.pack("<6f", self.xlo, self.xhi, self.ylo,
-                        self.yhi, self.zlo, self.zhi))
+        BBOX.pack_into(buffer, offset, self.xlo, self.xhi, self.ylo,
+                       self.yhi, self.zlo, self.zhi)
+        return offset + BBOX.size
 
     def as_dict(self):
         dic = { "xlo": self.xlo,
@@ -333,10 +995,12 @@ class BoundingBox:
         return dic
 
 
-class Vector:
+class Vector(Packable):
     """
     A very simple vector class
     """
+    __slots__ = ("data",)
+
     def __init__(self, file=None, data=None):
         # Default initialization
         self.data = [0.0, 0.0, 0.0]
@@ -355,9 +1019,13 @@ class Vector:
         # Reads the coordinates from the file
         self.data = list(struct.unpack("<3f", file.read(12)))
 
-    def write(self, file):
-        # Writes all coordinates to a file
-        file.write(struct.pack("<3f", *self.data))
+    def encoded_size(self):
+        return VECTOR.size
+
+    def pack_into(self, buffer, offset):
+        # Writes all coordinates
+        VECTOR.pack_into(buffer, offset, *self.data)
+        return offset + VECTOR.size
 
     def get_distance_to(self, v):
         return sqrt((self.x - v.x)**2 + (self.y - v.y)**2 + (self.z - v.z)**2)
@@ -496,10 +1164,12 @@ class Matrix:
         self.data[i] = value
 
 
-class Polygon:
+class Polygon(Packable):
     """
     Reads a Polygon structure and stores it.
     """
+    __slots__ = ("w", "type", "texture", "vertex_indices", "colors", "uv")
+
     def __init__(self, file=None, w=None):
         self.w = w                  # World it belongs to
 
@@ -537,21 +1207,47 @@ class Polygon:
         if self.w and self.type & 2048:
                 self.w.env_count += 1
 
-    def write(self, file):
+    def encoded_size(self):
+        return (4 + 2 * len(self.vertex_indices) +
+                sum(col.encoded_size() for col in self.colors) +
+                UV_STRUCT.size * len(self.uv))
+
+    def pack_into(self, buffer, offset):
+        colors = self.colors
+
+        # Common case: 4 indices, 4 colors with alpha and 4 UVs in one go
+        if (len(self.vertex_indices) == 4 and len(colors) == 4 and
+                len(self.uv) == 4 and
+                all(col.alpha is not False and col.alpha is not None
+                    for col in colors)):
+            bgra = []
+            for col in colors:
+                bgra.extend((col.color[2], col.color[1], col.color[0],
+                             255 - col.alpha))
+            uvs = []
+            for uv in self.uv:
+                uvs.extend((uv.u, uv.v))
+            POLYGON.pack_into(buffer, offset, self.type, self.texture,
+                              *self.vertex_indices, *bgra, *uvs)
+            return offset + POLYGON.size
+
         # Writes the type bitfield and the texture index
-        file.write(struct.pack("<h", self.type))
-        file.write(struct.pack("<h", self.texture))
+        RVSHORT.pack_into(buffer, offset, self.type)
+        RVSHORT.pack_into(buffer, offset + 2, self.texture)
+        offset += 4
 
-        # Writes indices of the polygon's vertices and their vertex colors
+        # Writes indices of the polygon's vertices (unsigned, see POLYGON)
+        # and their vertex colors
         for ind in self.vertex_indices:
-            file.write(struct.pack("<h", ind))
-        for col in self.colors:
-            col.write(file)
-            # file.write(struct.pack("<L", col))
+            RVUSHORT.pack_into(buffer, offset, ind)
+            offset += 2
+        for col in colors:
+            offset = col.pack_into(buffer, offset)
 
         # Writes the UV coordinates
         for uv in self.uv:
-            uv.write(file)
+            offset = uv.pack_into(buffer, offset)
+        return offset
 
     def as_dict(self):
         dic = { "type": self.type,
@@ -563,10 +1259,12 @@ class Polygon:
         return dic
 
 
-class Vertex:
+class Vertex(Packable):
     """
     Reads a Polygon structure and stores it
     """
+    __slots__ = ("position", "normal")
+
     def __init__(self, file=None):
         self.position = None    # Vector
         self.normal = None      # Vector (normalized, length 1)
@@ -582,10 +1280,14 @@ class Vertex:
         self.position = Vector(file)
         self.normal = Vector(file)
 
-    def write(self, file):
+    def encoded_size(self):
+        return VERTEX.size
+
+    def pack_into(self, buffer, offset):
         # Writes position and normal as a vector
-        self.position.write(file)
-        self.normal.write(file)
+        VERTEX.pack_into(buffer, offset, *self.position.data,
+                         *self.normal.data)
+        return offset + VERTEX.size
 
     def as_dict(self):
         dic = {"position": self.position.as_dict(),
@@ -594,10 +1296,12 @@ class Vertex:
         return dic
 
 
-class UV:
+class UV(Packable):
     """
     Reads UV-map structure and stores it
     """
+    __slots__ = ("u", "v")
+
     def __init__(self, file=None, uv=None):
         if uv:
             self.u, self.v = uv
@@ -616,10 +1320,13 @@ class UV:
         self.u = struct.unpack("<f", file.read(4))[0]
         self.v = struct.unpack("<f", file.read(4))[0]
 
-    def write(self, file):
+    def encoded_size(self):
+        return UV_STRUCT.size
+
+    def pack_into(self, buffer, offset):
         # Writes the uv coordinates
-        file.write(struct.pack("<f", self.u))
-        file.write(struct.pack("<f", self.v))
+        UV_STRUCT.pack_into(buffer, offset, self.u, self.v)
+        return offset + UV_STRUCT.size
 
     def as_dict(self):
         dic = {"u": self.u,
@@ -632,7 +1339,7 @@ class UV:
         self.v = dic["v"]
 
 
-class BigCube:
+class BigCube(Packable):
     """
     Reads a BigCube structure and stores it
     BigCubes are used for in-game optimization (culling)
@@ -660,15 +1367,20 @@ class BigCube:
         for mesh in range(self.mesh_count):
             self.mesh_indices.append(struct.unpack("<l", file.read(4))[0])
 
-    def write(self, file):
+    def encoded_size(self):
+        return VECTOR.size + 8 + 4 * len(self.mesh_indices)
+
+    def pack_into(self, buffer, offset):
         # Writes center and size of the cube
-        self.center.write(file)
-        file.write(struct.pack("<f", self.size))
+        offset = self.center.pack_into(buffer, offset)
+        RVFLOAT.pack_into(buffer, offset, self.size)
 
         # Writes amount of meshes and then the indices of the meshes
-        file.write(struct.pack("<l", self.mesh_count))
-        for mesh in self.mesh_indices:
-            file.write(struct.pack("<l", mesh))
+        RVLONG.pack_into(buffer, offset + 4, self.mesh_count)
+        offset += 8
+        struct.pack_into("<{}l".format(len(self.mesh_indices)), buffer,
+                         offset, *self.mesh_indices)
+        return offset + 4 * len(self.mesh_indices)
 
     def as_dict(self):
         dic = { "center": self.center.as_dict(),
@@ -679,7 +1391,7 @@ class BigCube:
         return dic
 
 
-class TexAnimation:
+class TexAnimation(Packable):
     """
     Reads and stores a texture animation of a .w file
     """
@@ -701,13 +1413,19 @@ class TexAnimation:
         for frame in range(self.frame_count):
             self.frames.append(Frame(file))
 
-    def write(self, file):
+    def encoded_size(self):
+        return 4 + sum(frame.encoded_size()
+                       for frame in self.frames[:self.frame_count])
+
+    def pack_into(self, buffer, offset):
         # Writes the amount of frames
-        file.write(struct.pack("<L", self.frame_count))
+        RVULONG.pack_into(buffer, offset, self.frame_count)
+        offset += 4
 
         # Writes the frames
         for frame in self.frames[:self.frame_count]:
-            frame.write(file)
+            offset = frame.pack_into(buffer, offset)
+        return offset
 
     def as_dict(self):
         return {
@@ -724,7 +1442,7 @@ class TexAnimation:
             self.frames.append(frame)
 
 
-class Frame:
+class Frame(Packable):
     """
     Reads and stores exactly one texture animation frame
     """
@@ -759,12 +1477,17 @@ class Frame:
         for uv in range(4):
             self.uv[uv] = UV(file)
 
-    def write(self, file):
-        file.write(struct.pack("<l", self.texture))
-        file.write(struct.pack("<f", self.delay))
+    def encoded_size(self):
+        return 8 + sum(UV_STRUCT.size for uv in self.uv if uv is not None)
+
+    def pack_into(self, buffer, offset):
+        RVLONG.pack_into(buffer, offset, self.texture)
+        RVFLOAT.pack_into(buffer, offset + 4, self.delay)
+        offset += 8
         for uv in self.uv:
             if uv is not None:  # Check if uv is not None before trying to access its write method.
-                uv.write(file)
+                offset = uv.pack_into(buffer, offset)
+        return offset
 
     def as_dict(self):
         return {
@@ -780,10 +1503,12 @@ class Frame:
         return json.dumps(self.as_dict())
 
 
-class Color:
+class Color(Packable):
     """
     Stores a color with optional alpha (RGB).
     """
+    __slots__ = ("color", "alpha")
+
     def __init__(self, file=None, color=(0, 0, 0), alpha=False):
         self.color = color          # RGB color
         self.alpha = alpha          # False or int from 0 to 255
@@ -798,12 +1523,20 @@ class Color:
         if self.alpha:
             self.alpha = 255 - struct.unpack("<B", file.read(1))[0]
 
-    def write(self, file):
-        file.write(struct.pack("<3B", self.color[2],
-                               self.color[1], self.color[0]))
+    def encoded_size(self):
+        # Alpha is only written if it is specified
+        if self.alpha is not False and self.alpha is not None:
+            return 4
+        return 3
+
+    def pack_into(self, buffer, offset):
+        struct.pack_into("<3B", buffer, offset, self.color[2],
+                         self.color[1], self.color[0])
         # Writes only if alpha is specified
         if self.alpha is not False and self.alpha is not None:
-            file.write(struct.pack("<B", 255 - self.alpha))
+            struct.pack_into("<B", buffer, offset + 3, 255 - self.alpha)
+            return offset + 4
+        return offset + 3
 
     def as_dict(self):
         dic = { "r": self.color[0],
@@ -985,10 +1718,16 @@ class PosNode:
         return "PosNode"
 
 
-class NCP:
+class NCP(Packable):
+    """
+    Reads, stores and writes collision files. Exporters can set the
+    polyhedra as POLYHEDRON_DTYPE records with set_arrays(), those are only
+    turned into Polyhedron objects when they are accessed.
+    """
     def __init__(self, file=None):
         self.polyhedron_count = 0
         self.polyhedra = []
+        self.arrays = None      # POLYHEDRON_DTYPE records, only set in bulk
 
         if not file:
             self.lookup_grid = LookupGrid()
@@ -1013,32 +1752,84 @@ class NCP:
         else:
             self.lookup_grid = None
 
-    def write(self, file):
-        # Writes the polyhedron count
-        file.write(struct.pack("<H", self.polyhedron_count))
+    @property
+    def polyhedra(self):
+        if self._polyhedra is None:
+            self._polyhedra = polyhedra_from_arrays(self.arrays)
+        return self._polyhedra
+
+    @polyhedra.setter
+    def polyhedra(self, polyhedra):
+        self._polyhedra = polyhedra
+
+    def set_arrays(self, arrays):
+        """ Uses POLYHEDRON_DTYPE records as the polyhedra """
+        self.arrays = arrays
+        self._polyhedra = None
+        self.polyhedron_count = len(arrays)
+
+    def bboxes(self):
+        """ The bboxes of all polyhedra as an (n, 6) array. Requires NumPy. """
+        if self._polyhedra is None:
+            return self.arrays["bbox"][:self.polyhedron_count].astype(
+                np.float64)
+        return np.array([(p.bbox.xlo, p.bbox.xhi, p.bbox.ylo, p.bbox.yhi,
+                          p.bbox.zlo, p.bbox.zhi)
+                         for p in self._polyhedra[:self.polyhedron_count]],
+                        dtype=np.float64).reshape(-1, 6)
+
+    def records_size(self):
+        """ Size of the polyhedron records in bytes """
+        if self._polyhedra is None:
+            return self.polyhedron_count * POLYHEDRON_SIZE
+        return sum(self._polyhedra[p].encoded_size()
+                   for p in range(self.polyhedron_count))
+
+    def encoded_size(self):
+        size = 2 + self.records_size()
+        if self.lookup_grid:
+            size += self.lookup_grid.encoded_size()
+        return size
 
-        # Writes all polyhedra
-        for p in range(self.polyhedron_count):
-            self.polyhedra[p].write(file)
+    def pack_into(self, buffer, offset):
+        # Writes the polyhedron count
+        RVUSHORT.pack_into(buffer, offset, self.polyhedron_count)
+        offset += 2
+
+        # Writes all polyhedra, records are copied at once
+        if self._polyhedra is None:
+            data = self.arrays[:self.polyhedron_count].tobytes()
+            buffer[offset:offset + len(data)] = data
+            offset += len(data)
+        else:
+            for p in range(self.polyhedron_count):
+                offset = self._polyhedra[p].pack_into(buffer, offset)
 
         if self.lookup_grid:
-            self.lookup_grid.write(file)
+            offset = self.lookup_grid.pack_into(buffer, offset)
+        return offset
 
-    def generate_lookup_grid(self, grid_size=None):
+    def generate_lookup_grid(self, grid_size=None, margin=LOOKUP_GRID_MARGIN):
         grid = LookupGrid()
         if grid_size is None:
             grid.size = 1024
         else:
             grid.size = grid_size
 
-        bbox = BoundingBox(data=(
-            min([poly.bbox.xlo for poly in self.polyhedra]),
-            max([poly.bbox.xhi for poly in self.polyhedra]),
-            0,
-            0,
-            min([poly.bbox.zlo for poly in self.polyhedra]),
-            max([poly.bbox.zhi for poly in self.polyhedra]))
-        )
+        if np is not None:
+            bboxes = self.bboxes()
+            bbox = BoundingBox(data=(
+                float(bboxes[:, 0].min()), float(bboxes[:, 1].max()), 0, 0,
+                float(bboxes[:, 4].min()), float(bboxes[:, 5].max())))
+        else:
+            bbox = BoundingBox(data=(
+                min([poly.bbox.xlo for poly in self.polyhedra]),
+                max([poly.bbox.xhi for poly in self.polyhedra]),
+                0,
+                0,
+                min([poly.bbox.zlo for poly in self.polyhedra]),
+                max([poly.bbox.zhi for poly in self.polyhedra]))
+            )
 
         grid.xsize = ceil((bbox.xhi - bbox.xlo) / grid.size)
         grid.zsize = ceil((bbox.zhi - bbox.zlo) / grid.size)
@@ -1046,26 +1837,109 @@ class NCP:
         grid.x0 = (bbox.xlo + bbox.xhi - grid.xsize * grid.size) / 2
         grid.z0 = (bbox.zlo + bbox.zhi - grid.zsize * grid.size) / 2
 
-        for z in range(grid.zsize):
-            zlo = grid.z0 + z * grid.size - 150
-            zhi = grid.z0 + (z + 1) * grid.size + 150
-
-            for x in range(grid.xsize):
-                xlo = grid.x0 + x * grid.size - 150
-                xhi = grid.x0 + (x + 1) * grid.size + 150
-
-                lookup = LookupList()
-                for i, poly in enumerate(self.polyhedra):
-                    if (poly.bbox.zhi > zlo and poly.bbox.zlo < zhi and
-                            poly.bbox.xhi > xlo and poly.bbox.xlo < xhi):
-                        lookup.polyhedron_idcs.append(i)
+        # Bounds of the grid columns and rows, including the margin. They are
+        # ascending, so the cells a polyhedron overlaps can be found with a
+        # binary search on each axis.
+        xlos = [grid.x0 + x * grid.size - margin for x in range(grid.xsize)]
+        xhis = [grid.x0 + (x + 1) * grid.size + margin
+                for x in range(grid.xsize)]
+        zlos = [grid.z0 + z * grid.size - margin for z in range(grid.zsize)]
+        zhis = [grid.z0 + (z + 1) * grid.size + margin
+                for z in range(grid.zsize)]
+
+        if np is not None:
+            cells = self._lookup_cells_np(grid, xlos, xhis, zlos, zhis)
+        else:
+            cells = self._lookup_cells(grid, xlos, xhis, zlos, zhis)
 
-                lookup.length = len(lookup.polyhedron_idcs)
-                grid.lists.append(lookup)
+        for idcs in cells:
+            lookup = LookupList()
+            lookup.polyhedron_idcs = idcs
+            lookup.length = len(idcs)
+            grid.lists.append(lookup)
 
         self.lookup_grid = grid
         return self
 
+    def tune_lookup_grid(self, sizes=LOOKUP_GRID_SIZES,
+                         margin=LOOKUP_GRID_MARGIN, max_weight=0.1,
+                         size_weight=4.0):
+        """
+        Generates a lookup grid for each candidate cell size and keeps the
+        one with the lowest cost. The cost is the mean length of the
+        non-empty lists (checked by the game for every collision test),
+        plus the longest list times max_weight, plus the grid size relative
+        to the polyhedra times size_weight.
+        Returns the chosen size and a report of all candidates.
+        """
+        polyhedra_size = max(1, self.records_size())
+        best = None
+        lines = ["Lookup grid candidates:"]
+
+        for size in sizes:
+            self.generate_lookup_grid(size, margin)
+            stats = self.lookup_grid.statistics()
+            cost = (stats["mean"] + stats["max"] * max_weight +
+                    stats["bytes"] / polyhedra_size * size_weight)
+            lines.append(
+                "  {:>5}: {:>4}x{:<4} mean {:6.1f}  max {:>5}  "
+                "indices {:>7}  {:>8} bytes  cost {:.2f}".format(
+                    size, stats["xsize"], stats["zsize"], stats["mean"],
+                    stats["max"], stats["indices"], stats["bytes"], cost)
+            )
+            if best is None or cost < best[0]:
+                best = (cost, size, self.lookup_grid)
+
+        cost, size, self.lookup_grid = best
+        lines.append("Chosen grid size: {}".format(size))
+        lines.extend(self.lookup_grid.report())
+        return size, "\n".join(lines)
+
+    def _lookup_cells(self, grid, xlos, xhis, zlos, zhis):
+        """ Polyhedron indices of each grid cell (pure Python) """
+        cells = [[] for c in range(grid.xsize * grid.zsize)]
+        for i, poly in enumerate(self.polyhedra):
+            # Cells that overlap: cell lo < poly hi and cell hi > poly lo
+            xstart = bisect_right(xhis, poly.bbox.xlo)
+            xend = bisect_left(xlos, poly.bbox.xhi)
+            zstart = bisect_right(zhis, poly.bbox.zlo)
+            zend = bisect_left(zlos, poly.bbox.zhi)
+            for z in range(zstart, zend):
+                for x in range(xstart, xend):
+                    cells[z * grid.xsize + x].append(i)
+        return cells
+
+    def _lookup_cells_np(self, grid, xlos, xhis, zlos, zhis):
+        """ Polyhedron indices of each grid cell (vectorized) """
+        bboxes = self.bboxes()[:, (0, 1, 4, 5)]
+
+        # Covered range of columns and rows for every polyhedron
+        xstart = np.searchsorted(np.array(xhis), bboxes[:, 0], side="right")
+        xend = np.searchsorted(np.array(xlos), bboxes[:, 1], side="left")
+        zstart = np.searchsorted(np.array(zhis), bboxes[:, 2], side="right")
+        zend = np.searchsorted(np.array(zlos), bboxes[:, 3], side="left")
+        xcount = np.maximum(xend - xstart, 0)
+        counts = xcount * np.maximum(zend - zstart, 0)
+
+        # One (cell, polyhedron) pair for every covered cell
+        polys = np.repeat(np.arange(len(bboxes)), counts)
+        local = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        row = np.repeat(np.maximum(xcount, 1), counts)
+        cell = ((np.repeat(zstart, counts) + local // row) * grid.xsize +
+                np.repeat(xstart, counts) + local % row)
+
+        # A stable sort keeps the polyhedra of each cell in ascending order
+        order = np.argsort(cell, kind="stable")
+        polys = polys[order].tolist()
+        ends = np.cumsum(np.bincount(cell, minlength=grid.xsize * grid.zsize))
+        cells = []
+        start = 0
+        for end in ends.tolist():
+            cells.append(polys[start:end])
+            start = end
+        return cells
+
     def as_dict(self):
         if not self.lookup_grid:
             lookup_grid = None
@@ -1078,7 +1952,25 @@ class NCP:
         return dic
 
 
-class Polyhedron:
+def polyhedra_from_arrays(arrays):
+    """ Turns POLYHEDRON_DTYPE records into Polyhedron objects """
+    polyhedra = []
+    for ptype, material, planes, bbox in zip(
+            arrays["type"].tolist(), arrays["material"].tolist(),
+            arrays["planes"].tolist(), arrays["bbox"].tolist()):
+        poly = Polyhedron()
+        poly.type = ptype
+        poly.material = material
+        poly.planes = [Plane(n=Vector(data=plane[:3]), d=plane[3])
+                       for plane in planes]
+        poly.bbox = BoundingBox(data=bbox)
+        polyhedra.append(poly)
+    return polyhedra
+
+
+class Polyhedron(Packable):
+    __slots__ = ("type", "material", "planes", "bbox")
+
     def __init__(self, file=None):
         self.type = 0
         self.material = 0
@@ -1097,15 +1989,19 @@ class Polyhedron:
 
         self.bbox = BoundingBox(file)
 
-    def write(self, file):
-        # Writes the type
-        file.write(struct.pack("<L", self.type))
-        # Writes the surface material
-        file.write(struct.pack("<L", self.material))
+    def encoded_size(self):
+        return (POLYHEDRON_HEADER.size + PLANE.size * len(self.planes[:5]) +
+                BBOX.size)
+
+    def pack_into(self, buffer, offset):
+        # Writes the type and the surface material
+        POLYHEDRON_HEADER.pack_into(buffer, offset, self.type, self.material)
+        offset += POLYHEDRON_HEADER.size
         # Writes the 5 planes
-        [p.write(file) for p in self.planes[:5]]
+        for p in self.planes[:5]:
+            offset = p.pack_into(buffer, offset)
         # Writes the BBOX
-        self.bbox.write(file)
+        return self.bbox.pack_into(buffer, offset)
 
     def as_dict(self):
         dic = {"type": self.type,
@@ -1116,7 +2012,9 @@ class Polyhedron:
         return dic
 
 
-class Plane:
+class Plane(Packable):
+    __slots__ = ("normal", "distance")
+
     def __init__(self, file=None, n=None, d=None):
         if n is not None:
             self.normal = n
@@ -1149,11 +2047,13 @@ class Plane:
         self.normal = Vector(file=file)
         self.distance = struct.unpack("<f", file.read(4))[0]
 
-    def write(self, file):
-        # Writes the normal vector
-        self.normal.write(file)
-        # Writes the plane distance
-        file.write(struct.pack("<f", self.distance))
+    def encoded_size(self):
+        return PLANE.size
+
+    def pack_into(self, buffer, offset):
+        # Writes the normal vector and the plane distance
+        PLANE.pack_into(buffer, offset, *self.normal.data, self.distance)
+        return offset + PLANE.size
 
     def as_dict(self):
         dic = {"normal": self.normal.as_dict(),
@@ -1162,7 +2062,7 @@ class Plane:
         return dic
 
 
-class LookupGrid:
+class LookupGrid(Packable):
     def __init__(self, file=None):
         self.x0 = 0.0
         self.z0 = 0.0
@@ -1188,16 +2088,60 @@ class LookupGrid:
 
         self.lists = [LookupList(file) for x in range(self.xsize * self.zsize)]
 
-    def write(self, file):
+    def encoded_size(self):
+        return LOOKUP_GRID_HEADER.size + sum(
+            self.lists[x].encoded_size()
+            for x in range(int(self.xsize) * int(self.zsize)))
+
+    def pack_into(self, buffer, offset):
         # Writes the lookup grid data
-        file.write(struct.pack("<f", self.x0))
-        file.write(struct.pack("<f", self.z0))
-        file.write(struct.pack("<f", self.xsize))
-        file.write(struct.pack("<f", self.zsize))
-        file.write(struct.pack("<f", self.size))
+        LOOKUP_GRID_HEADER.pack_into(buffer, offset, self.x0, self.z0,
+                                     self.xsize, self.zsize, self.size)
+        offset += LOOKUP_GRID_HEADER.size
         # Writes the lists
         for x in range(int(self.xsize) * int(self.zsize)):
-            self.lists[x].write(file)
+            offset = self.lists[x].pack_into(buffer, offset)
+        return offset
+
+    def statistics(self):
+        """ Returns the list lengths and the size of the grid """
+        lengths = [l.length for l in self.lists]
+        used = [length for length in lengths if length]
+        return {"xsize": int(self.xsize),
+                "zsize": int(self.zsize),
+                "cells": len(lengths),
+                "empty": len(lengths) - len(used),
+                "mean": sum(used) / len(used) if used else 0.0,
+                "max": max(lengths, default=0),
+                "indices": sum(lengths),
+                "bytes": self.encoded_size(),
+                "lengths": lengths
+        }
+
+    def report(self):
+        """ Returns lines describing the distribution of list lengths """
+        stats = self.statistics()
+        lines = [
+            "{} cells ({} empty), {} indices, {} bytes".format(
+                stats["cells"], stats["empty"], stats["indices"],
+                stats["bytes"]),
+            "List lengths: mean {:.1f}, max {}".format(
+                stats["mean"], stats["max"])
+        ]
+        low = 0
+        for high in LOOKUP_HISTOGRAM_BINS + (None,):
+            count = sum(1 for length in stats["lengths"]
+                        if length >= low and (high is None or length <= high))
+            if high is None:
+                label = "{}+".format(low)
+            elif high == low:
+                label = str(low)
+            else:
+                label = "{}-{}".format(low, high)
+            lines.append("  {:>8}: {}".format(label, count))
+            if high is not None:
+                low = high + 1
+        return lines
 
     def as_dict(self):
         dic = {"x0": self.x0,
@@ -1210,7 +2154,9 @@ class LookupGrid:
         return dic
 
 
-class LookupList:
+class LookupList(Packable):
+    __slots__ = ("length", "polyhedron_idcs")
+
     def __init__(self, file=None):
         self.length = 0
         self.polyhedron_idcs = []
@@ -1223,11 +2169,14 @@ class LookupList:
         for x in range(self.length):
             self.polyhedron_idcs.append(struct.unpack("<L", file.read(4))[0])
 
-    def write(self, file):
-        file.write(struct.pack("<L", self.length))
-        # Writes the polyhedron indices
-        for x in range(self.length):
-            file.write(struct.pack("<L", self.polyhedron_idcs[x]))
+    def encoded_size(self):
+        return 4 + 4 * self.length
+
+    def pack_into(self, buffer, offset):
+        # Writes the length and the polyhedron indices
+        struct.pack_into("<L{}L".format(self.length), buffer, offset,
+                         self.length, *self.polyhedron_idcs[:self.length])
+        return offset + 4 + 4 * self.length
 
     def as_dict(self):
         dic = {"length": self.length,
@@ -1236,7 +2185,7 @@ class LookupList:
         return dic
 
 
-class Hull:
+class Hull(Packable):
     def __init__(self, file=None):
         self.chull_count = 0
         self.chulls = []  # ConvexHulls
@@ -1251,11 +2200,17 @@ class Hull:
         self.chulls = [ConvexHull(file) for x in range(self.chull_count)]
         self.interior = Interior(file)
 
-    def write(self, file):
-        file.write(struct.pack("<h", self.chull_count))
+    def encoded_size(self):
+        return (2 + sum(self.chulls[x].encoded_size()
+                        for x in range(self.chull_count)) +
+                self.interior.encoded_size())
+
+    def pack_into(self, buffer, offset):
+        RVSHORT.pack_into(buffer, offset, self.chull_count)
+        offset += 2
         for x in range(self.chull_count):
-            self.chulls[x].write(file)
-        self.interior.write(file)
+            offset = self.chulls[x].pack_into(buffer, offset)
+        return self.interior.pack_into(buffer, offset)
 
     def as_dict(self):
         dic = {"chull_count": self.chull_count,
@@ -1265,7 +2220,7 @@ class Hull:
         return dic
 
 
-class ConvexHull:
+class ConvexHull(Packable):
     """ ConvexHull used in .hul """
     def __init__(self, file=None):
         self.vertex_count = 0
@@ -1306,24 +2261,32 @@ class ConvexHull:
         self.edges = [Edge(file) for x in range(self.edge_count)]
         self.faces = [Plane(file) for x in range(self.face_count)]
 
-    def write(self, file):
-        file.write(struct.pack("<h", self.vertex_count))
-        file.write(struct.pack("<h", self.edge_count))
-        file.write(struct.pack("<h", self.face_count))
+    def encoded_size(self):
+        return (HULL_COUNTS.size + BBOX.size + VECTOR.size +
+                VECTOR.size * self.vertex_count +
+                EDGE.size * self.edge_count + PLANE.size * self.face_count)
+
+    def pack_into(self, buffer, offset):
+        HULL_COUNTS.pack_into(buffer, offset, self.vertex_count,
+                              self.edge_count, self.face_count)
+        offset += HULL_COUNTS.size
 
-        self.bbox.write(file)
-        self.bbox_offset.write(file)
+        offset = self.bbox.pack_into(buffer, offset)
+        offset = self.bbox_offset.pack_into(buffer, offset)
 
         for x in range(self.vertex_count):
-            self.vertices[x].write(file)
+            offset = self.vertices[x].pack_into(buffer, offset)
         for x in range(self.edge_count):
-            self.edges[x].write(file)
+            offset = self.edges[x].pack_into(buffer, offset)
         for x in range(self.face_count):
-            self.faces[x].write(file)
+            offset = self.faces[x].pack_into(buffer, offset)
+        return offset
 
 
-class Edge:
+class Edge(Packable):
     """ Edge used in .hul """
+    __slots__ = ("vertices",)
+
     def __init__(self, file=None):
         self.vertices = []  # Integer indices
 
@@ -1333,8 +2296,12 @@ class Edge:
     def read(self, file):
         self.vertices = [struct.unpack("<h", file.read(2))[0] for x in range(2)]
 
-    def write(self, file):
-        file.write(struct.pack("<hh", *self.vertices))
+    def encoded_size(self):
+        return EDGE.size
+
+    def pack_into(self, buffer, offset):
+        EDGE.pack_into(buffer, offset, *self.vertices)
+        return offset + EDGE.size
 
     def __getitem__(self, i):
         return self.vertices[i]
@@ -1344,7 +2311,7 @@ class Edge:
         return dic
 
 
-class Interior:
+class Interior(Packable):
     """ Interior used in .hul """
     def __init__(self, file=None):
         self.sphere_count = 0
@@ -1357,12 +2324,17 @@ class Interior:
         self.sphere_count = struct.unpack("<h", file.read(2))[0]
         self.spheres = [Sphere(file) for x in range(self.sphere_count)]
 
-    def write(self, file):
+    def encoded_size(self):
+        return 2 + sum(sphere.encoded_size() for sphere in self.spheres)
+
+    def pack_into(self, buffer, offset):
         # Update sphere_count to match the actual number of spheres just before writing
         self.sphere_count = len(self.spheres)
-        file.write(struct.pack("<h", self.sphere_count))
+        RVSHORT.pack_into(buffer, offset, self.sphere_count)
+        offset += 2
         for sphere in self.spheres:  # This avoids index out of range errors
-            sphere.write(file)
+            offset = sphere.pack_into(buffer, offset)
+        return offset
 
     def as_dict(self):
         dic = {"sphere_count": self.sphere_count,
@@ -1371,7 +2343,7 @@ class Interior:
         return dic
 
 
-class Sphere:
+class Sphere(Packable):
     """ Sphere used in .hul """
     def __init__(self, file=None):
         self.center = Vector()
@@ -1384,9 +2356,13 @@ class Sphere:
         self.center = Vector(file)
         self.radius = struct.unpack("<f", file.read(4))[0]
 
-    def write(self, file):
-        self.center.write(file)
-        file.write(struct.pack("<f", self.radius))
+    def encoded_size(self):
+        return VECTOR.size + 4
+
+    def pack_into(self, buffer, offset):
+        offset = self.center.pack_into(buffer, offset)
+        RVFLOAT.pack_into(buffer, offset, self.radius)
+        return offset + 4
 
     def as_dict(self):
         dic = {"center": self.center.as_dict(),
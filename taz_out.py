@@ -18,14 +18,25 @@ from .rvstruct import TrackZones
 
 
 def export_file(filepath, scene):
+    zones = build_zones()
+    if zones is None:
+        return
+
+    with open(filepath, "wb") as file:
+        zones.write(file)
+
+def build_zones(objs=None):
+    """ Creates the track zones of the TRACK_ZONES collection """
     zones = TrackZones()
-    track_zones_collection = bpy.data.collections.get('TRACK_ZONES')
+    if objs is None:
+        track_zones_collection = bpy.data.collections.get('TRACK_ZONES')
 
-    if track_zones_collection is None:
-        print("No 'TRACK_ZONES' collection found.")
-        return
-    
-    for obj in track_zones_collection.objects:
+        if track_zones_collection is None:
+            print("No 'TRACK_ZONES' collection found.")
+            return None
+        objs = track_zones_collection.objects
+
+    for obj in objs:
         if "is_track_zone" not in obj or not obj["is_track_zone"]:
             continue
         
@@ -34,9 +45,7 @@ def export_file(filepath, scene):
             obj.location, obj.rotation_euler, obj.scale, obj.dimensions)
         
         zones.append(zid, location, rotation_matrix_data, size)
-    
-    with open(filepath, "wb") as file:
-        zones.write(file)
+    return zones
 
 def transforms_to_revolt(location, rotation_euler=(0, 0, 0), scale=(1, 1, 1), dimensions=(1, 1, 1)):
     """
@@ -8,9 +8,13 @@ Some functions that are called by operators
 
 """
 
+import os
 import bpy
 import bmesh
 import mathutils
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from math import pi
 import time
 from .common import create_material, COL_HULL
@@ -315,22 +319,7 @@ def generate_chull(context):
         bm.to_mesh(me)
         bm.free()
 
-        # Create new hull object
-        hull_ob = bpy.data.objects.new(hull_name, me)
-
-        # Set custom property
-        hull_ob.is_hull_convex = True
-
-        # Setup materials and other properties
-        hull_ob.show_transparent = True
-        hull_ob.show_wire = True
-        hull_ob.matrix_world = obj.matrix_world.copy()
-        me.materials.append(create_material("RVHull", COL_HULL, 0.3))
-
-        # Link new hull object to the same collections as the original object
-        for collection in bpy.data.collections:
-            if obj.name in collection.objects:
-                collection.objects.link(hull_ob)
+        hull_ob = new_hull_object(obj, me, hull_name)
 
         # Remove the original object
         bpy.data.objects.remove(obj, do_unlink=True)
@@ -345,3 +334,87 @@ def generate_chull(context):
     except Exception as e:
         print(f"An error occurred while generating the hull: {e}")
         return None
+
+
+def new_hull_object(obj, me, hull_name="is_hull_convex"):
+    """ Creates a convex hull object for obj from the mesh me """
+    hull_ob = bpy.data.objects.new(hull_name, me)
+
+    # Set custom property
+    hull_ob.is_hull_convex = True
+
+    # Setup materials and other properties
+    hull_ob.show_transparent = True
+    hull_ob.show_wire = True
+    hull_ob.matrix_world = obj.matrix_world.copy()
+    me.materials.append(create_material("RVHull", COL_HULL, 0.3))
+
+    # Link new hull object to the same collections as the original object
+    for collection in bpy.data.collections:
+        if obj.name in collection.objects:
+            collection.objects.link(hull_ob)
+
+    return hull_ob
+
+
+# Worker processes don't have bpy, so they can't import the add-on package.
+# This registers an empty package instead that only finds its modules.
+WORKER_SETUP = (
+    "import sys, types\n"
+    "if {name!r} not in sys.modules:\n"
+    "    package = types.ModuleType({name!r})\n"
+    "    package.__path__ = [{path!r}]\n"
+    "    sys.modules[{name!r}] = package\n"
+)
+
+
+def decomposition_pool():
+    """ Process pool for the bpy-free geometry module """
+    setup = WORKER_SETUP.format(name=__package__,
+                                path=os.path.dirname(__file__))
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=exec,
+        initargs=(setup,)
+    )
+
+
+def read_hull_source(obj):
+    """ Returns the vertices and triangles of a mesh object as arrays """
+    me = obj.data
+    me.calc_loop_triangles()
+    vertices = np.empty(len(me.vertices) * 3, dtype=np.float64)
+    me.vertices.foreach_get("co", vertices)
+    triangles = np.empty(len(me.loop_triangles) * 3, dtype=np.int64)
+    me.loop_triangles.foreach_get("vertices", triangles)
+    return vertices.reshape(-1, 3), triangles.reshape(-1, 3)
+
+
+def create_decomposed_hulls(context, obj, parts):
+    """
+    Adds a convex hull object for each point array of a decomposition.
+    The source object is kept.
+    """
+    hulls = []
+    for points in parts:
+        bm = bmesh.new()
+        verts = [bm.verts.new(p) for p in points.tolist()]
+        chull_out = bmesh.ops.convex_hull(bm, input=verts)
+
+        # Points that are not on the hull are left unconnected
+        bmesh.ops.delete(bm, geom=chull_out["geom_interior"] +
+                         chull_out["geom_unused"], context="VERTS")
+        me = bpy.data.meshes.new("is_hull_convex")
+        bm.to_mesh(me)
+        bm.free()
+
+        if len(me.polygons) == 0:
+            bpy.data.meshes.remove(me)
+            continue
+        hulls.append(new_hull_object(obj, me))
+
+    for hull_ob in hulls:
+        hull_ob.select_set(True)
+    context.view_layer.update()
+    return hulls
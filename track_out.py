@@ -0,0 +1,288 @@
+"""
+Name:    track_out
+Purpose: Exports all files of a track in one go
+
+Description:
+Goes through the scene objects once and sorts them by the files they are
+exported to. Meshes used by both the world (.w) and the collision (.ncp)
+are read, triangulated and transformed only once.
+Blender data is read on the main thread; the files are then encoded and
+written by worker threads at the same time.
+
+"""
+
+if "bpy" in locals():
+    import imp
+    imp.reload(common)
+    imp.reload(rvstruct)
+    imp.reload(prm_out)
+    imp.reload(w_out)
+    imp.reload(ncp_out)
+
+import os
+import bpy
+import time
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from . import (
+    common,
+    export_cache,
+    rvstruct,
+    fin_out,
+    hul_out,
+    ncp_out,
+    prm_out,
+    rim_out,
+    taz_out,
+    w_out
+)
+from .common import (
+    export_matrix,
+    queue_error,
+    transform_points,
+    triangulated_copy
+)
+
+# File extension of each format in the order they're reported
+TRACK_FORMATS = ("w", "ncp", "fin", "rim", "hul", "taz")
+
+
+def classify_objects(scene):
+    """ Sorts the scene objects by the track files they are exported to """
+    groups = {
+        "w": [],
+        "ncp": [],
+        "fin": [],
+        "rim": [],
+        "chulls": [],
+        "spheres": [],
+        "taz": [],
+    }
+    for obj in scene.objects:
+        if w_out.is_world_object(obj):
+            groups["w"].append(obj)
+
+        if scene.ncp_export_selected:
+            collision = obj.select_get() and not obj.get("ignore_ncp", False)
+        else:
+            collision = ncp_out.is_collision_object(obj)
+        if collision and obj.type == "MESH":
+            groups["ncp"].append(obj)
+
+        if obj.get("is_instance", False):
+            groups["fin"].append(obj)
+        if obj.is_mirror_plane:
+            groups["rim"].append(obj)
+        if obj.get("is_hull_convex", False):
+            groups["chulls"].append(obj)
+        if obj.get("is_hull_sphere", False):
+            groups["spheres"].append(obj)
+        if obj.get("is_track_zone", False) and any(
+                col.name == "TRACK_ZONES" for col in obj.users_collection):
+            groups["taz"].append(obj)
+    return groups
+
+
+def completed(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def timed(func, *args, **kwargs):
+    """ Runs func and returns how long it took """
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def snapshot_meshes(scene, world_objs, collision_objs, pool):
+    """
+    Reads every mesh of the world and collision once and hands the arrays
+    to the pool for encoding. Returns the futures of the world meshes and
+    of the collision records in order, and (format, future, object, digest,
+    settings) of the results to cache once they were written.
+    """
+    split = scene.w_split_meshes
+    report = scene.w_report_spheres
+    world_set = set(world_objs)
+    collision_set = set(collision_objs)
+    simplify = scene.ncp_merge_quads or scene.ncp_decimate
+
+    futures = []
+    ncp_futures = []
+    stores = []
+    reused = 0
+
+    for obj in scene.objects:
+        in_world = obj in world_set
+        in_collision = obj in collision_set
+        if not in_world and not in_collision:
+            continue
+
+        # Unchanged meshes are taken from the cache. Split worlds need the
+        # whole meshes, so only the streamed encoding is cached.
+        w_digest = ncp_digest = None
+        if scene.export_cache:
+            if in_world and not split:
+                w_settings = (scene.triangulate_ngons,
+                              tuple(prm_out.get_slot_textures(obj)))
+                encoded, w_digest = export_cache.lookup("w", obj, w_settings)
+                if encoded is not None:
+                    futures.append(completed(encoded))
+                    in_world = False
+            if in_collision:
+                ncp_settings = ncp_out.collision_settings(scene)
+                records, ncp_digest = export_cache.lookup(
+                    "ncp", obj, ncp_settings)
+                if records is not None:
+                    ncp_futures.append(completed(records))
+                    in_collision = False
+            if not in_world and not in_collision:
+                reused += 1
+                continue
+
+        # Both formats read the same (triangulated) mesh unless the
+        # collision gets simplified
+        print("Reading mesh of {}".format(obj.name))
+        me = obj.data
+        shared = in_collision and not simplify
+        tmp = None
+        if in_world or shared:
+            tmp = triangulated_copy(me, scene.triangulate_ngons)
+        try:
+            if in_world:
+                data = prm_out.read_mesh(tmp or me)
+            if shared:
+                collision = ncp_out.read_collision_mesh(tmp or me)
+        finally:
+            if tmp:
+                bpy.data.meshes.remove(tmp)
+
+        matrix = export_matrix(obj)
+        if in_world:
+            prm_out.add_mesh_extras(data, me, obj)
+            prm_out.transform_data(data, matrix)
+            if split:
+                futures.append(pool.submit(
+                    prm_out.encode_mesh, data, world=True, report=report))
+            elif prm_out.check_mesh_limits(data):
+                futures.append(pool.submit(
+                    w_out.encode_world_mesh, data, report))
+                if w_digest is not None:
+                    stores.append(("w", futures[-1], obj, w_digest,
+                                   w_settings))
+            else:
+                queue_error(
+                    "exporting World",
+                    "A mesh could not be exported."
+                )
+
+        if in_collision:
+            if not shared:
+                collision = ncp_out.extract_collision_mesh(obj, scene)
+            elif in_world:
+                collision["co"] = data["co"]
+            else:
+                collision["co"] = transform_points(matrix, collision["co"])
+            ncp_futures.append(pool.submit(
+                ncp_out.encode_polyhedra, collision))
+            if ncp_digest is not None:
+                stores.append(("ncp", ncp_futures[-1], obj, ncp_digest,
+                               ncp_settings))
+
+    if reused:
+        print("Reused {} unchanged meshes".format(reused))
+    return futures, ncp_futures, stores
+
+
+def write_collision(filepath, futures, collgrid, grid_size):
+    """ Writes the .ncp once the records of all meshes are encoded """
+    records = [future.result() for future in futures]
+    ncp = rvstruct.NCP()
+    ncp.set_arrays(np.concatenate(records))
+    if ncp.polyhedron_count == 0:
+        queue_error("exporting NCP", "No collision polygons in scene.")
+        return None
+    return ncp_out.write_ncp(filepath, ncp, collgrid, grid_size)
+
+
+def export_track(directory, context):
+    """
+    Exports the world, collision, instances, mirrors, hull and zones of the
+    scene into directory. The files are named after the directory like the
+    ones of the game. Returns the time each format took in seconds.
+    """
+    scene = context.scene
+    name = os.path.basename(os.path.normpath(directory))
+    filepaths = {frmt: os.path.join(directory, "{}.{}".format(name, frmt))
+                 for frmt in TRACK_FORMATS}
+
+    start = time.perf_counter()
+    groups = classify_objects(scene)
+    timings = {"classify": time.perf_counter() - start}
+    jobs = {}   # format -> (future of the writing time, reading time)
+
+    with ThreadPoolExecutor(max_workers=w_out.ENCODE_THREADS + 1) as pool:
+        start = time.perf_counter()
+        futures, ncp_futures, stores = snapshot_meshes(
+            scene, groups["w"], groups["ncp"], pool)
+        timings["meshes"] = time.perf_counter() - start
+
+        # Written after all mesh encoding jobs, which are queued before them
+        if futures:
+            split_polygons = scene.w_split_polygons if scene.w_split_meshes else 0
+            jobs["w"] = (pool.submit(
+                timed, w_out.write_world, filepaths["w"],
+                (future.result() for future in futures),
+                w_out.get_animations(scene), scene.ta_max_slots,
+                scene.w_bigcube_meshes, split_polygons), 0.0)
+
+        if ncp_futures:
+            grid_size = scene.ncp_collgrid_size
+            if scene.ncp_collgrid_auto:
+                grid_size = None
+            jobs["ncp"] = (pool.submit(
+                timed, write_collision, filepaths["ncp"], ncp_futures,
+                scene.ncp_export_collgrid, grid_size), 0.0)
+
+        # The other files only need a little data from Blender
+        builders = (
+            ("fin", groups["fin"], lambda: fin_out.build_instances(
+                filepaths["fin"], context, groups["fin"])),
+            ("rim", groups["rim"], lambda: rim_out.build_rim(groups["rim"])),
+            ("hul", groups["chulls"] + groups["spheres"],
+             lambda: hul_out.build_hull(scene, groups["chulls"],
+                                        groups["spheres"])),
+            ("taz", groups["taz"], lambda: taz_out.build_zones(groups["taz"])),
+        )
+        for frmt, objs, build in builders:
+            if not objs:
+                continue
+            start = time.perf_counter()
+            struct = build()
+            jobs[frmt] = (pool.submit(timed, write_struct, filepaths[frmt],
+                                      struct), time.perf_counter() - start)
+
+        for frmt in TRACK_FORMATS:
+            if frmt not in jobs:
+                continue
+            future, read_time = jobs[frmt]
+            try:
+                timings[frmt] = read_time + future.result()
+            except Exception as e:
+                queue_error("exporting track", "{}: {}".format(
+                    filepaths[frmt], e))
+
+        # Keeps the encoded meshes once they were written
+        for fmt, future, obj, digest, settings in stores:
+            if fmt in timings:
+                export_cache.store(fmt, obj, digest, future.result(),
+                                   settings)
+
+    return timings
+
+
+def write_struct(filepath, struct):
+    with open(filepath, "wb") as file:
+        struct.write(file)
@@ -17,5 +17,6 @@ class RVIO_PT_RevoltIOToolPanel(bpy.types.Panel):
         row.operator("import_scene.revolt", text="Import", icon="IMPORT")
         row.operator("export_scene.revolt", text="Export", icon="EXPORT")
         row.operator("export_scene.revolt_redo", text="Re-Export", icon="FILE_REFRESH")
+        self.layout.operator("export_scene.revolt_track", text="Export Track", icon="EXPORT")
         
 dprint
@@ -57,4 +57,9 @@ class RVIO_PT_RevoltObjectPanel(bpy.types.Panel):
         hull_box = layout.box()
         hull_box.label(text="Hull Properties:")
         hull_col = hull_box.column(align=True)
-        hull_col.operator("hull.generate")
\ No newline at end of file
+        hull_col.operator("hull.generate")
+        hull_col.separator()
+        hull_col.prop(context.scene, "hul_decompose_hulls")
+        hull_col.prop(context.scene, "hul_decompose_concavity")
+        hull_col.prop(context.scene, "hul_decompose_resolution")
+        hull_col.operator("hull.decompose")
\ No newline at end of file
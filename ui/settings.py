@@ -35,6 +35,7 @@ class RVIO_PT_RevoltSettingsPanel(bpy.types.Panel):
         # General import settings
         layout.label(text="Import:")
         layout.operator("rvio.read_car_parameters", text="Read Car Parameters")
+        layout.prop(scene, "texture_cache_session")
         layout.separator()
 
         # General export settings
@@ -44,6 +45,7 @@ class RVIO_PT_RevoltSettingsPanel(bpy.types.Panel):
         layout.operator("export.apply_scale", text="Apply Scale")
         layout.operator("export.apply_rotation", text= "Apply Rotation")
         layout.operator("export.apply_translation", text= "Apply Translation")
+        layout.prop(scene, "export_cache")
         layout.separator()
 
         # PRM Export settings
@@ -58,9 +60,30 @@ class RVIO_PT_RevoltSettingsPanel(bpy.types.Panel):
         layout.operator("rvio.toggle_w_import_big_cubes", text="w_import_big_cubes")
         layout.separator()
 
+        # World Export settings
+        layout.label(text="Export World (.w):")
+        layout.prop(scene, "w_split_meshes")
+        if scene.w_split_meshes:
+            layout.prop(scene, "w_split_polygons")
+        layout.prop(scene, "w_bigcube_meshes")
+        layout.prop(scene, "w_report_spheres")
+        layout.separator()
+
         # NCP Export settings
         layout.label(text="Export Collision (.ncp):")
         layout.operator("rvio.ncp_export_selected", text="ncp_export_selected")
         layout.operator("rvio.ncp_export_collgrid", text="ncp_export_collgrid")
         layout.operator("rvio.ncp_grid_size", text="ncp_collgrid_size")
+        layout.operator("rvio.ncp_grid_auto", text="ncp_collgrid_auto")
+        layout.prop(scene, "ncp_merge_quads")
+        layout.prop(scene, "ncp_decimate")
+        if scene.ncp_merge_quads or scene.ncp_decimate:
+            layout.prop(scene, "ncp_merge_angle")
+        layout.separator()
+
+        # Hull Export settings
+        layout.label(text="Export Hull (.hul):")
+        layout.prop(scene, "hul_weld_tolerance")
+        layout.prop(scene, "hul_plane_angle")
+        layout.prop(scene, "hul_plane_distance")
 
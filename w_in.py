@@ -31,50 +31,54 @@ def import_file(filepath, scene):
 
     with open(filepath, 'rb') as file:
         filename = os.path.basename(filepath)
-        world = World(file)
-
-    meshes = world.meshes
-    print(f"Imported {filename} with {len(meshes)} meshes")
-
-    main_w = None
-    if scene.get('w_parent_meshes', False):
-        main_w = bpy.data.objects.new(filename, None)
-        scene.collection.objects.link(main_w)
-
-    for index, rvmesh in enumerate(meshes):
-        mesh_name = filename if index == 0 else f"{filename}.{str(index).zfill(3)}"
-        me = import_mesh(rvmesh, scene, filepath, world.env_list)
-        ob = bpy.data.objects.new(mesh_name, me)
-        scene.collection.objects.link(ob)
-
-        if main_w:
-            ob.parent = main_w
-
-        if scene.get('w_import_bound_boxes', False):
-            bbox = create_bound_box(scene, rvmesh.bbox, mesh_name)
-            bbox.parent = ob if not main_w else main_w
-            bbox["is_bbox"] = True
-
-        if scene.get('w_import_cubes', False):
-            center = rvmesh.bound_ball_center.data
-            radius = rvmesh.bound_ball_radius
-            cube = create_cube(scene, "CUBE", center, radius, mesh_name)
-            cube.parent = ob if not main_w else main_w
-            cube["is_cube"] = True
-
-    # Import big cubes - should be outside the mesh loop
-    if scene.get('w_import_big_cubes', False):
-        if world.bigcubes:
-            cube_data = world.bigcubes[0]
-            radius = cube_data.size
-            center = cube_data.center.data
-            bcube = create_cube(scene, "BIGCUBE", center, radius, filename)
-            if main_w:
-                bcube.parent = main_w
-            bcube["is_bcube"] = True
+        world = World(file, lazy=True)
+
+    # The meshes are read from a memory map of the file, which is always
+    # released (it keeps the file locked on Windows)
+    try:
+        meshes = world.meshes
+        print(f"Imported {filename} with {len(meshes)} meshes")
+
+        main_w = None
+        if scene.get('w_parent_meshes', False):
+            main_w = bpy.data.objects.new(filename, None)
+            scene.collection.objects.link(main_w)
 
-    scene.texture_animations = json.dumps([a.as_dict() for a in world.animations])
-    scene.ta_max_slots = world.animation_count
+        for index, rvmesh in enumerate(meshes):
+            mesh_name = filename if index == 0 else f"{filename}.{str(index).zfill(3)}"
+            me = import_mesh(rvmesh, scene, filepath, world.env_list)
+            ob = bpy.data.objects.new(mesh_name, me)
+            scene.collection.objects.link(ob)
+
+            if main_w:
+                ob.parent = main_w
+
+            if scene.get('w_import_bound_boxes', False):
+                bbox = create_bound_box(scene, rvmesh.bbox, mesh_name)
+                bbox.parent = ob if not main_w else main_w
+                bbox["is_bbox"] = True
+
+            if scene.get('w_import_cubes', False):
+                center = rvmesh.bound_ball_center.data
+                radius = rvmesh.bound_ball_radius
+                cube = create_cube(scene, "CUBE", center, radius, mesh_name)
+                cube.parent = ob if not main_w else main_w
+                cube["is_cube"] = True
+
+        # Import big cubes - should be outside the mesh loop
+        if scene.get('w_import_big_cubes', False):
+            for cube_data in world.bigcubes:
+                radius = cube_data.size
+                center = cube_data.center.data
+                bcube = create_cube(scene, "BIGCUBE", center, radius, filename)
+                if main_w:
+                    bcube.parent = main_w
+                bcube["is_bcube"] = True
+
+        scene.texture_animations = json.dumps([a.as_dict() for a in world.animations])
+        scene.ta_max_slots = world.animation_count
+    finally:
+        world.meshes.close()
 
     # Clears the used texture paths
     # # global textures
@@ -18,64 +18,179 @@ import os
 import bpy
 import bmesh
 import json
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from mathutils import Color, Vector
 from . import (
     common,
+    export_cache,
     rvstruct,
     img_in,
     prm_out
 )
 from .common import *
-from .prm_out import export_mesh
+from .prm_out import extract_mesh, check_mesh_limits, encode_mesh
+from .prm_out import get_slot_textures
+
+# Meshes that are encoded at the same time while streaming
+ENCODE_THREADS = min(4, os.cpu_count() or 1)
 
 
 def export_file(filepath, scene):
-    # Creates an empty world object to put the scene into
-    world = rvstruct.World()
+    objs = get_export_objects(scene)
+
+    # Splitting needs the geometry of all meshes at once
+    if scene.w_split_meshes:
+        export_world(filepath, scene, objs)
+    else:
+        stream_world(filepath, scene, objs)
 
-    objs = []
+
+def get_export_objects(scene):
     # Goes through all objects and adds the exportable ones to the list
-    for obj in scene.objects:
-        conditions = (
-            obj.data and
-            obj.type == "MESH" and
-            not obj.get("is_instance", False) and
-            not obj.get("is_cube", False) and
-            not obj.get("is_bcube", False) and
-            not obj.get("is_bbox", False) and
-            not obj.get("is_mirror_plane", False) and
-            not obj.get("is_hull_sphere", False) and
-            not obj.get("is_hull_convex", False) and
-            not obj.get("is_track_zone", False)
-        )
-        if conditions:
-            objs.append(obj)
-
-    # Goes through all objects from the scene and exports them to PRM/Mesh
+    return [obj for obj in scene.objects if is_world_object(obj)]
+
+
+def is_world_object(obj):
+    """ Whether an object is exported as a world mesh """
+    return bool(
+        obj.data and
+        obj.type == "MESH" and
+        not obj.get("is_instance", False) and
+        not obj.get("is_cube", False) and
+        not obj.get("is_bcube", False) and
+        not obj.get("is_bbox", False) and
+        not obj.get("is_mirror_plane", False) and
+        not obj.get("is_hull_sphere", False) and
+        not obj.get("is_hull_convex", False) and
+        not obj.get("is_track_zone", False)
+    )
+
+
+def get_animations(scene):
+    animations = []
+    for animdict in json.loads(scene.texture_animations):
+        anim = rvstruct.TexAnimation()
+        anim.from_dict(animdict)
+        animations.append(anim)
+    return animations
+
+
+def encode_world_mesh(data, report):
+    """ Encodes a mesh to bytes, runs in a worker thread """
+    mesh, env_list = encode_mesh(data, world=True, report=report)
+    return mesh.to_bytes(), rvstruct.MeshHeader.from_mesh(mesh), env_list
+
+
+def stream_world(filepath, scene, objs):
+    """
+    Exports the world while writing it. The main thread reads the meshes
+    from Blender, worker threads encode them and finished meshes are
+    written in order right away.
+    """
+    with open(filepath, "wb") as file, \
+            ThreadPoolExecutor(max_workers=ENCODE_THREADS) as pool:
+        writer = rvstruct.WorldWriter(file)
+        pending = deque()       # (future, object, digest, settings) in order
+        reused = 0
+
+        def write_next():
+            future, obj, digest, settings = pending.popleft()
+            encoded = future.result()
+            if digest is not None:
+                export_cache.store("w", obj, digest, encoded, settings)
+            writer.add_mesh(*encoded)
+
+        for obj in objs:
+            # Unchanged objects are written from the cache
+            digest = settings = None
+            if scene.export_cache:
+                settings = (scene.triangulate_ngons,
+                            tuple(get_slot_textures(obj)))
+                encoded, digest = export_cache.lookup("w", obj, settings)
+                if encoded is not None:
+                    future = Future()
+                    future.set_result(encoded)
+                    pending.append((future, obj, None, None))
+                    reused += 1
+                    continue
+
+            print("Exporting mesh for {}".format(obj.name))
+            data = extract_mesh(obj.data, obj, scene, world=True)
+            if not check_mesh_limits(data):
+                queue_error(
+                    "exporting World",
+                    "A mesh could not be exported."
+                )
+                continue
+            pending.append((pool.submit(
+                encode_world_mesh, data, scene.w_report_spheres), obj, digest,
+                settings))
+
+            # Writes what's done and limits the meshes held in memory
+            while pending and (pending[0][0].done() or
+                               len(pending) > ENCODE_THREADS * 2):
+                write_next()
+
+        while pending:
+            write_next()
+        if reused:
+            print("Reused {} unchanged meshes".format(reused))
+
+        # Exports the texture animation
+        writer.world.animations = get_animations(scene)
+        writer.world.animation_count = scene.ta_max_slots
+
+        # Generates big cubes (spheres) around groups of nearby meshes
+        writer.finish(scene.w_bigcube_meshes)
+        print("Generated {} big cubes".format(writer.world.bigcube_count))
+
+
+def export_world(filepath, scene, objs):
+    # Goes through all objects from the scene and exports them to meshes.
+    # The limits don't apply since the meshes are split up afterwards.
+    encoded = []
     for obj in objs:
-        me = obj.data
         print("Exporting mesh for {}".format(obj.name))
-        mesh = export_mesh(me, obj, scene, filepath, world=world)
-        if mesh:
+        data = extract_mesh(obj.data, obj, scene, world=True)
+        encoded.append(encode_mesh(data, world=True,
+                                   report=scene.w_report_spheres))
+
+    # Merges and splits all geometry into meshes of nearby polygons
+    world = write_world(filepath, encoded, get_animations(scene),
+                        scene.ta_max_slots, scene.w_bigcube_meshes,
+                        split_polygons=scene.w_split_polygons)
+    print("Split world into {} meshes".format(world.mesh_count))
+    print("Generated {} big cubes".format(world.bigcube_count))
+
+
+def write_world(filepath, encoded, animations, animation_count,
+                bigcube_meshes, split_polygons=0):
+    """
+    Writes a world from meshes that were already read from Blender, so it
+    can run in a worker thread. encoded yields the results of
+    encode_world_mesh, or (mesh, env_list) pairs of encode_mesh if the
+    meshes are split up by split_polygons.
+    """
+    if split_polygons:
+        world = rvstruct.World()
+        for mesh, env_list in encoded:
             world.meshes.append(mesh)
-        else:
-            queue_error(
-                "exporting World",
-                "A mesh could not be exported."
-            )
-
-    world.mesh_count = len(world.meshes)
-    # Generates one big cube (sphere) around the scene
-    world.generate_bigcubes()
-
-    # Exports the texture animation
-    animations = json.loads(scene.texture_animations)
-    for animdict in animations:
-        anim = rvstruct.TexAnimation()
-        anim.from_dict(animdict)
-        world.animations.append(anim)
-    world.animation_count = scene.ta_max_slots
+            world.env_list.extend(env_list)
+        world.mesh_count = len(world.meshes)
+        world.partition_meshes(split_polygons)
+        world.generate_bigcubes(bigcube_meshes)
+        world.animations = animations
+        world.animation_count = animation_count
+        with open(filepath, "wb") as file:
+            world.write(file)
+        return world
 
-    # Writes the world to a file
     with open(filepath, "wb") as file:
-        world.write(file)
+        writer = rvstruct.WorldWriter(file)
+        for mesh_bytes, header, env_list in encoded:
+            writer.add_mesh(mesh_bytes, header, env_list)
+        writer.world.animations = animations
+        writer.world.animation_count = animation_count
+        writer.finish(bigcube_meshes)
+    return writer.world